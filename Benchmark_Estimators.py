@@ -0,0 +1,197 @@
+# Benchmarks for the profit estimators and the live bot helpers.
+# Runs each benchmark on a random walk (or a recorded price history) and reports ticks/sec, configs/sec and peak memory.
+# Results can be saved as baselines, and every run is compared against the saved baseline for the same settings.
+
+# Examples:
+#   python Benchmark_Estimators.py                                   (random walk, default sizes)
+#   python Benchmark_Estimators.py --length 100000 --grid 20x200     (longer series and the full KeepSome grid)
+#   python Benchmark_Estimators.py --history Price_History_April3_May15 --ticker ASTC
+#   python Benchmark_Estimators.py --save-baseline                   (store these numbers to compare future runs against)
+
+import argparse, json, os, time, tracemalloc
+
+baseline_file = 'Benchmark_Baselines.json'
+
+
+def measure(function,repeats):
+    """
+    Times a function and measures its peak python memory
+    function - function with no arguments to benchmark
+    repeats - number of times to run it (the fastest run is reported)
+
+    Returns the fastest time in seconds and the peak memory in bytes
+    """
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter()-start
+        if best is None or elapsed<best:
+            best = elapsed
+
+    tracemalloc.start()
+    function()
+    (current,peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (best,peak)
+
+
+def estimator_benchmarks(prices,sell_count,buy_count):
+    """
+    Builds the estimator benchmarks
+    prices - price history to run on
+    sell_count, buy_count - size of the sell x buy grid for the grid benchmarks
+
+    Returns a list of (name,function,ticks,configs)
+    """
+    from Estimate_Profits_MaxPrice_KeepSome_Optimal import new_buy_algo,max_price_algo,new_buy_zero
+    from Estimate_Profits_Vectorized import run_grid
+    from Estimate_Profits_Kernels import run_kernel_grid,buy_sell_percent_kernel,kernel_prices
+    from Price_Crossing_Index import build_crossing_index,simulate_buy_sell_percent
+
+    max_buys = 3
+    first_price = prices[0]
+
+    def scalar_new_buy():
+        state = (0,first_price,0,0)
+        for price in prices:
+            state = new_buy_algo(price,state[1],state[2],0.03,0.02,0.01,state[0],max_buys,state[3])
+
+    def scalar_max_price():
+        state = (0,first_price,0,0)
+        for price in prices:
+            state = max_price_algo(price,state[1],state[2],0.03,0.02,0,state[0],max_buys,state[3],0.01)
+
+    def scalar_new_buy_zero():
+        state = (0,first_price,0,0,first_price)
+        for price in prices:
+            state = new_buy_zero(price,state[1],state[2],0.03,0.02,state[0],max_buys,state[3],0.02,state[4])
+
+    #Same sell and buy ranges as Estimate_Profits_MaxPrice_KeepSome_Optimal.py
+    sell_proportions = [y*0.5/100+1/100 for y in range(sell_count)]
+    buy_proportions = [x*0.1/100+0.5/100 for x in range(buy_count)]
+    new_buy_zero_calc = [0,0.02,0.05,0.1,0.2,0.3,0.5,1]
+    grid_args = (sell_proportions,buy_proportions,new_buy_zero_calc,[0],[0],0.01,max_buys)
+    grid_configs = sell_count*buy_count*(len(new_buy_zero_calc)+2)
+
+    #Buy sell percent configs (same ranges as Estimate_Profits_VaryAll3.py)
+    configs = [(x*0.1/100+0.1/100,z*0.5/100+0.5/100,y*0.05/100+0.05/100) for z in range(sell_count) for x in range(buy_count) for y in (0,49,99)]
+    crossing_index = build_crossing_index(prices)
+    compiled_prices = kernel_prices(prices)
+
+    def buy_sell_percent_loop():
+        for config in configs:
+            simulate_buy_sell_percent(crossing_index,*config,max_buys)
+
+    def buy_sell_percent_kernel_loop():
+        for config in configs:
+            buy_sell_percent_kernel(compiled_prices,*config,max_buys)
+
+    #Run the kernels once so numba compile time is not part of the benchmark
+    run_kernel_grid(prices[:10],[0.01],[0.01],[0],[0],[0],0.01,max_buys)
+    buy_sell_percent_kernel(compiled_prices[:10],0.01,0.01,0.01,max_buys)
+
+    return [('new_buy_algo',scalar_new_buy,len(prices),1),
+            ('max_price_algo',scalar_max_price,len(prices),1),
+            ('new_buy_zero',scalar_new_buy_zero,len(prices),1),
+            ('run_grid',lambda:run_grid(prices,*grid_args),len(prices)*grid_configs,grid_configs),
+            ('run_kernel_grid',lambda:run_kernel_grid(prices,*grid_args),len(prices)*grid_configs,grid_configs),
+            ('buy_sell_percent',buy_sell_percent_loop,len(prices)*len(configs),len(configs)),
+            ('buy_sell_percent_kernel',buy_sell_percent_kernel_loop,len(prices)*len(configs),len(configs))]
+
+
+def live_benchmarks(calls):
+    """
+    Builds the benchmarks for the live bot helpers
+    calls - number of calls in each benchmark run
+
+    Returns a list of (name,function,ticks,configs)
+    """
+    from TDAmeritrade_rate_limit import RateLimiter,QUOTE
+    from TDAmeritrade_API import build_order_request
+
+    #A bucket that never runs out, so acquire never sleeps (measures only its bookkeeping)
+    limiter = RateLimiter(rate=1e12,capacity=1e12)
+
+    def limiter_acquire():
+        for i in range(calls):
+            limiter.acquire(QUOTE)
+
+    order_leg = [{'instrument':{'symbol':'SGBX','assetType':'EQUITY'},'instruction':'BUY','quantity':100}]
+
+    def order_requests():
+        for i in range(calls):
+            build_order_request('SEAMLESS','GOOD_TILL_CANCEL','LIMIT',order_leg,'SINGLE','2.73')
+
+    return [('RateLimiter.acquire',limiter_acquire,calls,0),
+            ('build_order_request',order_requests,calls,0)]
+
+
+def run_benchmarks(benchmarks,repeats):
+    """
+    Runs the benchmarks
+
+    Returns a dictionary of benchmark name to results (Seconds, Ticks Per Second, Configs Per Second, Peak Memory)
+    """
+    results = {}
+    for (name,function,ticks,configs) in benchmarks:
+        (seconds,peak) = measure(function,repeats)
+        results[name] = {'Seconds':seconds,
+                         'Ticks Per Second':ticks/seconds,
+                         'Configs Per Second':configs/seconds,
+                         'Peak Memory':peak}
+    return results
+
+
+def compare_with_baseline(results,baseline):
+    """
+    Prints each benchmark and the change from the baseline (positive means faster than the baseline)
+    """
+    print('{:<26}{:>16}{:>16}{:>14}{:>12}'.format('Benchmark','Ticks/sec','Configs/sec','Peak MB','vs base'))
+    for name,result in results.items():
+        change = ''
+        if name in baseline:
+            change = '{:+.1f}%'.format((result['Ticks Per Second']/baseline[name]['Ticks Per Second']-1)*100)
+        print('{:<26}{:>16.4g}{:>16.4g}{:>14.2f}{:>12}'.format(name,result['Ticks Per Second'],result['Configs Per Second'],
+                                                           result['Peak Memory']/1e6,change))
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the profit estimators and live bot helpers')
+    parser.add_argument('--length',type=int,default=20000,help='number of prices in the random walk')
+    parser.add_argument('--grid',default='5x20',help='sell x buy grid size for the grid benchmarks')
+    parser.add_argument('--history',default='',help='price history store or pickle name to use instead of a random walk')
+    parser.add_argument('--ticker',default='',help='ticker to use from the price history')
+    parser.add_argument('--calls',type=int,default=100000,help='calls per run for the live bot helper benchmarks')
+    parser.add_argument('--repeats',type=int,default=3,help='number of runs of each benchmark (fastest is reported)')
+    parser.add_argument('--save-baseline',action='store_true',help='save these results as the baseline')
+    args = parser.parse_args()
+
+    (sell_count,buy_count) = [int(size) for size in args.grid.split('x')]
+    if len(args.history)>0:
+        from Price_History_Store import load_price_history
+        prices = list(load_price_history(args.history)[args.ticker])
+        series = '{}:{}'.format(args.history,args.ticker)
+    else:
+        from Estimate_Profits_Kernels import random_walk_prices
+        prices = random_walk_prices(args.length)
+        series = 'random:{}'.format(args.length)
+    prices = [float(price) for price in prices]
+
+    results = run_benchmarks(estimator_benchmarks(prices,sell_count,buy_count)+live_benchmarks(args.calls),args.repeats)
+
+    #Baselines are stored per price series and grid size so only like runs are compared
+    settings = '{} grid:{}'.format(series,args.grid)
+    baselines = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file,'r') as saved:
+            baselines = json.load(saved)
+
+    print('Settings: {}'.format(settings))
+    compare_with_baseline(results,baselines.get(settings,{}))
+
+    if args.save_baseline:
+        baselines[settings] = results
+        with open(baseline_file,'w') as saved:
+            json.dump(baselines,saved,indent=1)
+        print('Saved baseline to {}'.format(baseline_file))
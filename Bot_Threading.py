@@ -1,10 +1,13 @@
 
-import threading,pyodbc,pickle
+import threading,pyodbc,pickle,queue
+from websocket import create_connection
 from TDAmeritrade_API import *
-from TDAmeritrade_algorithm_buysell import ordering_bot,check_request_times
+from TDAmeritrade_algorithm_buysell import ordering_bot,streaming_ordering_bot,async_ordering_bot
+from TDAmeritrade_websocket import login_websocket,subscribe_quote_websocket,read_websocket,refresh_access
 from TDAmeritrade_user import user_interface
 from TDAmeritrade_odbc import store_results,retrieve_open_orders
 from TDAmeritrade_excel import save_results
+from TDAmeritrade_state import migrate_transactions
 
 #This Bot places limit buy and sell orders on Stock.
 #It takes divides the money availble and places limit buys based on market conditions.
@@ -30,12 +33,17 @@ def time_diff(time_1,time_2):
     return time_difference #In seconds
 
 
-def run_bot(transactions):
+def run_bot(transactions,streaming=False,concurrent=False):
     """
     Runs a bot to buy and sell stock. 
     Loads the transactions dictionary to set up parameters for when to buy and sell stock. 
 
-    Within the transactions dictionary there are dictionaries for each stock. The keys of each stock dictionary are:
+    streaming - if True, quotes are streamed from the TD Ameritrade websocket and each quote wakes the ordering thread
+        for that ticker (no get_multi_quotes polling). If False, the ordering thread polls quotes.
+    concurrent - if True (and not streaming), the polling ordering thread runs the orders of every ticker at the same time
+        (async_ordering_bot) instead of one ticker after the other.
+
+    Within the transactions dictionary there is a TickerState (TDAmeritrade_state.py) for each stock. Its keys are:
         First Buy - the price of the first buy for the stock (ignore if we already have orders in place)
         Order Quantity - the amount of stock to buy and sell for each transactions
         Available Balance - the amount of the money the stock has available for new purchases
@@ -66,23 +74,48 @@ def run_bot(transactions):
 
     Stores latest results of transaction dictionary as a pickle file
     """
+    #Old pickles store a dictionary for each stock
+    migrate_transactions(transactions)
+
     #Keep track of any errors
     errors=[]
 
-    #Start multithreading
-    lock=threading.Lock() #Lock for transactions dictionary
-    #Thread 1 - Place limit buys and limit sell orders on TD Ameritrade site
-    ordering_thread=threading.Thread(target=ordering_bot,args=(lock,transactions,errors,))
-    #Thread 2 - Check for user input and provide user with details on transactions and status
-    user_thread=threading.Thread(target=user_interface,args=(lock,transactions,errors,))
+    #Start multithreading (the threads share the per ticker locks of TDAmeritrade_locks.py for the transactions dictionary)
+    threads=[]
+
+    if streaming:
+        #Connect to the websocket and subscribe to bid, ask and last price of every ticker
+        (transactions['Access Token'],transactions['Access Expire Time']) = get_access(transactions['Access Token'],transactions['Access Expire Time'])
+        (user_principals,tokenTimeStampAsMs) = get_user_principals(transactions['Access Token'])
+        ws = create_connection('wss://{}/ws'.format(user_principals['streamerInfo']['streamerSocketUrl']))
+        login_websocket(ws,user_principals,tokenTimeStampAsMs,errors)
+        subscribe_quote_websocket(ws,user_principals,'1',','.join(transactions['Tickers']),'0,1,2,3',errors)
+
+        #Tickers with new quotes (read_websocket puts them in, the ordering thread takes them out)
+        updates=queue.Queue()
+        #Thread 1 - Keep the websocket open and the access token fresh
+        threads.append(threading.Thread(target=refresh_access,args=(ws,transactions,errors,)))
+        #Thread 2 - Read quotes from the websocket
+        threads.append(threading.Thread(target=read_websocket,args=(ws,transactions,errors,updates,)))
+        #Thread 3 - Place limit buys and limit sell orders for tickers with new quotes
+        threads.append(threading.Thread(target=streaming_ordering_bot,args=(transactions,errors,updates,)))
+    elif concurrent:
+        #Thread 1 - Place limit buys and limit sell orders on TD Ameritrade site for all tickers at once
+        threads.append(threading.Thread(target=async_ordering_bot,args=(transactions,errors,)))
+    else:
+        #Thread 1 - Place limit buys and limit sell orders on TD Ameritrade site
+        threads.append(threading.Thread(target=ordering_bot,args=(transactions,errors,)))
+
+    #Check for user input and provide user with details on transactions and status
+    threads.append(threading.Thread(target=user_interface,args=(transactions,errors,)))
 
     #Start the threads
-    ordering_thread.start()
-    user_thread.start()
+    for thread in threads:
+        thread.start()
 
     #Wait for the threads to join
-    ordering_thread.join()
-    user_thread.join()
+    for thread in threads:
+        thread.join()
 
     print("-------------")
     print("-------------")
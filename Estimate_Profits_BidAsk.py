@@ -0,0 +1,222 @@
+# Estimates profit from recorded bid/ask quotes using the same fill rules as ordering_bot.
+# The Estimate_Profits_* scripts fill an order whenever the minute open price crosses the limit price. The live bot only
+# tracks a limit buy when Bid Price <= Limit Buy Price and a limit sell when Ask Price >= Limit Sell Price, so on thin
+# tickers (wide spreads) the open price estimates fill orders the bot never would.
+
+# The simulator follows one ticker through the ordering_bot phases on every quote:
+#   place buy (Previous Sell, Previous Buy or First Buy, rounded to Max Digits, only if the Available Balance covers it)
+#   -> track buy (bid <= limit buy) or else track sell (ask >= limit sell)
+#   -> place/replace sell at Average Buy*(1+Sell Proportion) -> cancel buy after a sell
+# Orders only change when a quote crosses a limit price, so it jumps from one crossing to the next. Each jump searches
+# numpy blocks of quotes for the first crossing (the blocks double in size), so tick level data stays practical.
+
+# Quotes come from the Bid_Ask_Data.xlsx file that TDAmeritrade_excel.save_results writes, or from bid/ask columns of a price store.
+
+import math
+import numpy as np
+from Price_History_Store import write_columns,PriceStore
+
+
+def first_crossing(series,start,limit,below):
+    """
+    Finds the first quote at or after start that crosses a limit price
+    series - numpy array of bid prices (below=True) or ask prices (below=False)
+    start - index to start searching from
+    limit - the limit order price
+    below - True to find series <= limit, False to find series >= limit
+
+    Returns the index (len(series) if the quotes never cross the limit)
+    """
+    length = len(series)
+    index = start
+    block = 64
+    while index < length:
+        segment = series[index:index+block]
+        hits = np.flatnonzero(segment<=limit if below else segment>=limit)
+        if hits.size>0:
+            return index+int(hits[0])
+        index += block
+        #Search larger blocks the longer we go without a crossing
+        block = min(block*2,1<<16)
+    return length
+
+
+def simulate_bid_ask(bid,ask,first_buy,buy_proportion,sell_proportion,new_buy_proportion,balance,max_buys,max_digits=2,order_quantity=None):
+    """
+    Runs the ordering_bot algorithm for one ticker on recorded quotes
+    bid - bid price of each quote
+    ask - ask price of each quote
+    first_buy - price of the first limit buy ('First Buy')
+    buy_proportion, sell_proportion, new_buy_proportion - same as the transactions dictionary
+    balance - starting 'Available Balance' of the ticker
+    max_buys - 'Max Buys' (only used to size the order quantity, the same as InitializeTransactionsDictionary)
+    max_digits - number of digits limit prices are rounded to ('Max Digits')
+    order_quantity - shares in each buy (default is the InitializeTransactionsDictionary formula)
+
+    Returns a dictionary
+        Profit - change in the value of the balance, reserved buy cash and stock owned (valued at the last bid)
+        Profit Proportion - profit divided by the starting balance
+        Times Sold - number of filled sell orders
+        Buys - number of filled buy orders
+        Stock Owned, Available Balance, Average Buy - state at the end of the quotes
+        Fills - list of (quote index, 'BUY' or 'SELL', price, quantity)
+    """
+    bid = np.ascontiguousarray(bid,dtype=np.float64)
+    ask = np.ascontiguousarray(ask,dtype=np.float64)
+    length = len(bid)
+    if order_quantity is None:
+        order_quantity = math.floor(balance/(first_buy*(1+sell_proportion)*max_buys))
+
+    start_balance = balance
+    stock_owned = 0
+    previous_buy = 0
+    average_buy = 0
+    previous_sell = 0
+    limit_buy = 0
+    limit_sell = 0
+    fills = []
+
+    index = 0
+    while index < length:
+
+        #Place Limit Buy Orders (place_buy_order)
+        if limit_buy==0:
+            if stock_owned==0 and previous_sell>0:
+                buy_price = previous_sell*(1-new_buy_proportion)
+            elif stock_owned>0:
+                buy_price = previous_buy*(1-buy_proportion)
+            else:
+                buy_price = first_buy
+            buy_price = round(buy_price,max_digits)
+            if balance > buy_price*order_quantity:
+                balance -= buy_price*order_quantity
+                previous_sell = 0
+                limit_buy = buy_price
+
+        #Jump to the next quote where the bot would track an order
+        next_buy = first_crossing(bid,index,limit_buy,True) if limit_buy>0 else length
+        next_sell = first_crossing(ask,index,limit_sell,False) if limit_sell>0 else length
+        index = min(next_buy,next_sell)
+        if index>=length:
+            break
+
+        #Track Orders (a buy is tracked before a sell on the same quote)
+        if next_buy<=next_sell:
+            previous_buy = limit_buy
+            average_buy = (average_buy*stock_owned+limit_buy*order_quantity)/(stock_owned+order_quantity)
+            stock_owned += order_quantity
+            fills.append((index,'BUY',limit_buy,order_quantity))
+            limit_buy = 0
+        else:
+            balance += limit_sell*stock_owned
+            fills.append((index,'SELL',limit_sell,stock_owned))
+            previous_buy = 0
+            average_buy = 0
+            previous_sell = limit_sell
+            stock_owned = 0
+            limit_sell = 0
+
+        #Place/Replace Limit Sell Orders
+        if stock_owned>0:
+            sell_price = round(average_buy*(1+sell_proportion),max_digits)
+            if limit_sell!=sell_price:
+                limit_sell = sell_price
+
+        #Cancel Buy Orders after a sell (returns the reserved cash)
+        if previous_sell>0 and limit_buy>0:
+            balance += limit_buy*order_quantity
+            limit_buy = 0
+
+        #Orders changed on this quote can be filled from the next quote on
+        index += 1
+
+    last_bid = bid[-1] if length>0 else 0
+    profit = balance+limit_buy*order_quantity+stock_owned*last_bid-start_balance
+    return {'Profit':profit,
+            'Profit Proportion':profit/start_balance,
+            'Times Sold':sum(1 for fill in fills if fill[1]=='SELL'),
+            'Buys':sum(1 for fill in fills if fill[1]=='BUY'),
+            'Stock Owned':stock_owned,
+            'Available Balance':balance,
+            'Average Buy':average_buy,
+            'Fills':fills}
+
+
+def sweep_bid_ask(bid,ask,first_buy,configs,balance,max_buys,max_digits=2):
+    """
+    Runs simulate_bid_ask for a list of configs on the same quotes
+    configs - list of (buy_proportion,sell_proportion,new_buy_proportion)
+
+    Returns a list of profit percents (in the order of configs)
+    """
+    bid = np.ascontiguousarray(bid,dtype=np.float64)
+    ask = np.ascontiguousarray(ask,dtype=np.float64)
+    return [simulate_bid_ask(bid,ask,first_buy,*config,balance,max_buys,max_digits)['Profit Proportion']*100 for config in configs]
+
+
+def load_bid_ask_excel(file_name='Bid_Ask_Data.xlsx',sheet_name=0):
+    """
+    Loads quotes saved by TDAmeritrade_excel.save_results
+    Layout - row 0 has each ticker above its columns, column 0 has the quote times,
+        columns 1-4 after a ticker are bid price, bid size, ask price, ask size
+
+    Returns a dictionary quotes[ticker] = {'Bid':array,'Bid Size':array,'Ask':array,'Ask Size':array,'Times':array}
+    """
+    import pandas as pd
+    sheet = pd.read_excel(file_name,sheet_name=sheet_name,header=None)
+
+    quotes = {}
+    times = sheet.iloc[1:,0].to_numpy()
+    for column in range(1,sheet.shape[1],4):
+        ticker = sheet.iloc[0,column]
+        if not isinstance(ticker,str):
+            continue
+        data = sheet.iloc[1:,column:column+4].apply(pd.to_numeric,errors='coerce').to_numpy(dtype=np.float64)
+        quotes[ticker] = {'Bid':data[:,0],'Bid Size':data[:,1],'Ask':data[:,2],'Ask Size':data[:,3],'Times':times}
+    return quotes
+
+
+def write_bid_ask(store_dir,quotes):
+    """
+    Saves quotes as bid/ask columns of a price store (memory mapped when they are loaded again)
+    quotes - dictionary from load_bid_ask_excel
+    """
+    for ticker,quote in quotes.items():
+        write_columns(store_dir,ticker,{'bid':(quote['Bid'],'float64'),'ask':(quote['Ask'],'float64'),
+                                        'bid_size':(quote['Bid Size'],'float64'),'ask_size':(quote['Ask Size'],'float64')})
+
+
+def load_bid_ask_store(store_dir,ticker):
+    """
+    Memory maps the bid and ask columns of a ticker in a price store
+
+    Returns (bid,ask)
+    """
+    store = PriceStore(store_dir)
+    return (store.column(ticker,'bid'),store.column(ticker,'ask'))
+
+
+if __name__=="__main__":
+    quotes = load_bid_ask_excel('Bid_Ask_Data.xlsx')
+
+    #Settings from InitializeTransactionsDictionary.py
+    settings = {'SGBX':{'First Buy':2.73,'Buy Proportion':10/100,'Sell Proportion':2/100,'New Buy Proportion':0,'Max Digits':2},
+                'ASTC':{'First Buy':3,'Buy Proportion':4/100,'Sell Proportion':3/100,'New Buy Proportion':0,'Max Digits':2}}
+    balance = 1000
+    max_buys = 3
+
+    for ticker,setting in settings.items():
+        if ticker not in quotes:
+            continue
+        #Drop quotes that were not captured
+        valid = ~(np.isnan(quotes[ticker]['Bid']) | np.isnan(quotes[ticker]['Ask']))
+        bid = quotes[ticker]['Bid'][valid]
+        ask = quotes[ticker]['Ask'][valid]
+        params = (setting['First Buy'],setting['Buy Proportion'],setting['Sell Proportion'],setting['New Buy Proportion'],balance,max_buys,setting['Max Digits'])
+
+        #Same algorithm filled at the mid price (how the open price estimators fill) vs the bid/ask trigger rules
+        bid_ask = simulate_bid_ask(bid,ask,*params)
+        mid = simulate_bid_ask((bid+ask)/2,(bid+ask)/2,*params)
+        print('-------------------------------------------------------------')
+        print('{} bid/ask fills: profit percent {} with {} sells'.format(ticker,round(bid_ask['Profit Proportion']*100,3),bid_ask['Times Sold']))
+        print('{} mid price fills: profit percent {} with {} sells'.format(ticker,round(mid['Profit Proportion']*100,3),mid['Times Sold']))
@@ -13,12 +13,15 @@ import time
 import pickle
 from mpl_toolkits import mplot3d
 import matplotlib.pyplot as plt
+from Price_History_Store import load_price_history
+from Price_Crossing_Index import build_crossing_index,simulate_buy_sell_percent
 
 
 if __name__=="__main__":
     file_name = 'save.p'
 
-    price_history = pickle.load(open("Price_History_April3_May15.p","rb"))
+    #Memory maps the Price_History_April3_May15 store if it was converted, otherwise loads the pickle
+    price_history = load_price_history("Price_History_April3_May15")
 
     test_tickers = ['SVC']
     sell_proportion = {'SVC': 0.05}
@@ -39,6 +42,7 @@ if __name__=="__main__":
 
         profit_ticker_percent[ticker] = []
         times_sold[ticker]=[]
+        crossing_index = build_crossing_index(price_history[ticker])
         
         if len(buy_percent) > 0:
             update_xy = False
@@ -54,46 +58,8 @@ if __name__=="__main__":
                 #New buy percent ranges from 0.05% below last sell price to 5% below
                 new_buy_proportion = 0.01
 
-                total_profit = 0
-                total_profit_percent = 0
-                index = 0
-
-                #Previous buy - the first time we buy the stock
-                previous_buy = price_history[ticker][index]
-                #average buy - the average limit order buy price
-                average_buy = previous_buy
-                #num buys - the total number of buys we have without any sells
-                num_buys = 1
-                profit_proportion = 0
-                count_sold = 0
-
-                #Run the rest of the algorithm
-                while index < len(price_history[ticker]):
-
-                    price = price_history[ticker][index]
-
-                    #If price falls below buy percent of the previous buy price and we haven't reached our buys allowed limit, make another buy
-                    if price <= previous_buy*(1-buy_proportion) and num_buys<buys_allowed:
-                        previous_buy = price
-                        average_buy = (num_buys*average_buy + previous_buy)/(num_buys+1)
-                        num_buys+=1
-
-                    #If price jumps up to sell percent above the average buy price, sell all of our stock
-                    if price >= average_buy*(1+sell_proportion[ticker]):
-
-                        profit_proportion += sell_proportion[ticker]*num_buys
-
-                        #Set a new buy limit order
-                        count_sold += num_buys
-                        num_buys = 1
-                        previous_buy = average_buy*(1+sell_proportion[ticker])*(1-new_buy_proportion)
-                        average_buy = previous_buy
-                        
-                        #Keep looping through price history until the price falls to the new buy price
-                        while index < len(price_history[ticker]) and price_history[ticker][index] > previous_buy:
-                            index=index+1
-                    else:
-                        index+=1
+                #Jump from one fill to the next instead of checking every price
+                (profit_proportion,count_sold) = simulate_buy_sell_percent(crossing_index,buy_proportion,sell_proportion[ticker],new_buy_proportion,buys_allowed)
 
                 profit_ticker_percent[ticker].append(profit_proportion*100)
                 times_sold[ticker].append(count_sold)
@@ -13,12 +13,16 @@ import time
 import pickle
 from mpl_toolkits import mplot3d
 import matplotlib.pyplot as plt
+from Price_History_Store import load_price_history
+from Estimate_Profits_Parallel import run_parallel_sweep
+from Sweep_Result_Cube import save_result_cube
 
 
 if __name__=="__main__":
     file_name = 'save.p'
 
-    price_history = pickle.load(open("Price_History_April3_May15.p","rb"))
+    #Memory maps the Price_History_April3_May15 store if it was converted, otherwise loads the pickle
+    price_history = load_price_history("Price_History_April3_May15")
 
     test_tickers = ['SGBX','NOVN','MIST','ASTC','CREX']
 
@@ -26,98 +30,36 @@ if __name__=="__main__":
     #test_tickers = ['MSFT']
     #Number of times we allow the bot to re-buy the same stock without any sells
     buys_allowed = 3
-    profit_ticker_percent = {}
-    times_sold = {}
 
     sell_percent = []
     new_buy_percent = []
 
-    update_xy=True
+    #Create a 3-D plot of profit vs new_buy_percent and buy_percent to find the optimal times to buy and sell this stock
+    configs = []
+    for x in range(100):
 
-    #Get the profit for each ticker
-    for ticker in test_tickers:
+        #Buy percent ranges from 0.1% buy below previous sell to 10% 
+        buy_proportion = x*0.1/100+0.1/100
+        sell_proportion = buy_proportion
+
+        for y in range(100):
+
+            #New buy percent ranges from 0.05% below last sell price to 5% below
+            new_buy_proportion = y*0.05/100+0.05/100
 
-        profit_ticker_percent[ticker] = []
-        times_sold[ticker]=[]
-        
-        if len(sell_percent) > 0:
-            update_xy = False
-        
-        #Create a 3-D plot of profit vs new_buy_percent and buy_percent to find the optimal times to buy and sell this stock
-        for x in range(100):
-
-            #Buy percent ranges from 0.1% buy below previous sell to 10% 
-            buy_proportion = x*0.1/100+0.1/100
-            sell_proportion = buy_proportion
-
-            for y in range(100):
-
-                #New buy percent ranges from 0.05% below last sell price to 5% below
-                new_buy_proportion = y*0.05/100+0.05/100
-
-                total_profit = 0
-                total_profit_percent = 0
-                index = 0
-
-                #Previous buy - the first time we buy the stock
-                previous_buy = price_history[ticker][index]
-                #average buy - the average limit order buy price
-                average_buy = previous_buy
-                #num buys - the total number of buys we have without any sells
-                num_buys = 1
-                profit_proportion = 0
-                count_sold = 0
-
-                #Run the rest of the algorithm
-                while index < len(price_history[ticker]):
-
-                    price = price_history[ticker][index]
-
-                    #If price falls below buy percent of the previous buy price and we haven't reached our buys allowed limit, make another buy
-                    if price <= previous_buy*(1-buy_proportion) and num_buys<buys_allowed:
-                        previous_buy = price
-                        average_buy = (num_buys*average_buy + previous_buy)/(num_buys+1)
-                        num_buys+=1
-
-                    #If price jumps up to sell percent above the average buy price, sell all of our stock
-                    if price >= average_buy*(1+sell_proportion):
-
-                        profit_proportion += sell_proportion*num_buys
-
-                        #Set a new buy limit order
-                        count_sold += num_buys
-                        num_buys = 1
-                        previous_buy = average_buy*(1+sell_proportion)*(1-new_buy_proportion)
-                        average_buy = previous_buy
-                        
-                        #Keep looping through price history until the price falls to the new buy price
-                        while index < len(price_history[ticker]) and price_history[ticker][index] > previous_buy:
-                            index=index+1
-                    else:
-                        index+=1
-
-                profit_ticker_percent[ticker].append(profit_proportion*100)
-                times_sold[ticker].append(count_sold)
-                if update_xy:
-                    new_buy_percent.append(new_buy_proportion*100)
-                    sell_percent.append(sell_proportion*100)
-
-                last_price = price_history[ticker][-1] 
-                """         
-                print('-------------------------------------------------------------')
-                print('{} had a profit percent of {}.'.format(ticker,profit_ticker_percent[ticker]/buys_allowed))
-                print('The number times we bought and sold was {}.'.format(times_sold))
-                print('The last price is {}, and the last buy average was {}.'.format(last_price,average_buy))
-                print('-------------------------------------------------------------')
-                """
-                    
-            #total_profit_percent = sum(profit_ticker_percent.values())/buys_allowed        
-            #print('Total percent profit:  {}'.format(total_profit_percent))
-            #print('Average percent profit:  {}'.format(total_profit_percent/len(test_tickers)))
+            configs.append((buy_proportion,sell_proportion,new_buy_proportion))
+            new_buy_percent.append(new_buy_proportion*100)
+            sell_percent.append(sell_proportion*100)
 
+    #Get the profit for each ticker, splitting the tickers and configs across all the cores
+    (profit_ticker_percent,times_sold) = run_parallel_sweep(price_history,test_tickers,configs,buys_allowed)
+
+    for ticker in test_tickers:
         print('The max times {} was sold was {}'.format(ticker,max(times_sold[ticker])))
-    pickle.dump(profit_ticker_percent,open("PofitbyPercent_SellNewBuy_April3_May15_3_SGBX.p","wb"))
-    pickle.dump(sell_percent,open("SellPercent_SGBX.p","wb"))
-    pickle.dump(new_buy_percent,open("NewBuyPercent_SGBX.p","wb"))
+
+    #Save the results as a compressed cube (graph it with Graph_Estimated_Profits.py)
+    axes = [('Sell Percent',[(x*0.1/100+0.1/100)*100 for x in range(100)]),
+            ('New Buy Percent',[(y*0.05/100+0.05/100)*100 for y in range(100)])]
+    save_result_cube("Sweep_SellNewBuy_April3_May15_3.npz",test_tickers,axes,{'Profit Percent':profit_ticker_percent,'Times Sold':times_sold})
 
 
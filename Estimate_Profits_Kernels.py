@@ -0,0 +1,315 @@
+# Compiled kernels for the profit estimators.
+# Each kernel runs a whole price history for one config in a single call instead of calling
+# new_buy_algo, max_price_algo or new_buy_zero once per price.
+
+# The kernels are compiled with numba when it is installed. Without numba the same functions run as plain python.
+#   - The powers of the buy proportion used for the average buy are precomputed once per config (python float powers),
+#     so the kernels give the same profit_proportion values as the scalar functions
+#   - Run this file to check the kernels against the scalar functions on random walk prices
+
+import random
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def jit(function):
+    """
+    Compiles a kernel with numba if it is installed, otherwise returns the plain python function
+    """
+    if njit is None:
+        return function
+    return njit(cache=True)(function)
+
+
+def buy_factors(buy_proportion,max_buys,zero):
+    """
+    Precomputes the factors used to re-calculate the average buy price
+    buy_proportion - the proportion below the last buy price for a new buy order
+    max_buys - the number of times we are allowed to buy the same stock
+    zero - True for new_buy_zero ((1-buy_proportion)**i divisors), False for new_buy_algo and max_price_algo ((1+buy_proportion)**i)
+
+    Returns a numpy array with a factor for each buy
+    """
+    if zero:
+        return np.array([(1-buy_proportion)**i for i in range(max_buys)],dtype=np.float64)
+    return np.array([(1+buy_proportion)**i for i in range(max_buys)],dtype=np.float64)
+
+
+def kernel_prices(prices):
+    """
+    Prices in the format the kernels run fastest on (numpy array when compiled, list of floats in plain python)
+    """
+    if njit is None:
+        return prices.tolist() if hasattr(prices,'tolist') else list(prices)
+    return np.ascontiguousarray(prices,dtype=np.float64)
+
+
+@jit
+def new_buy_algo_kernel(prices,num_buys,buy_order,sell_order,profit_proportion,buy_proportion,sell_proportion,new_buy_proportion,max_buys,factors):
+    """
+    Runs new_buy_algo over every price
+    prices - price history (from kernel_prices)
+    num_buys, buy_order, sell_order, profit_proportion - starting state (same meaning as new_buy_algo)
+    buy_proportion, sell_proportion, new_buy_proportion, max_buys - config (same meaning as new_buy_algo)
+    factors - buy_factors(buy_proportion,max_buys,False)
+
+    Returns num_buys, buy_order, sell_order, and profit proportion after the last price
+    """
+    for price in prices:
+        if buy_order>0 and price<=buy_order:
+            #Our buy order was successfully placed
+            num_buys+=1
+            total_buy=0.0
+            for i in range(num_buys):
+                total_buy += buy_order*factors[i]
+            sell_order = total_buy/num_buys*(1+sell_proportion)
+            if num_buys<max_buys:
+                buy_order = buy_order*(1-buy_proportion)
+            else:
+                buy_order = 0.0
+
+        if sell_order>0 and price>=sell_order:
+            #Our sell order was successfully placed
+            profit_proportion += num_buys/max_buys*sell_proportion
+            buy_order = sell_order*(1-new_buy_proportion)
+            sell_order = 0.0
+            num_buys = 0
+
+    return (num_buys,buy_order,sell_order,profit_proportion)
+
+
+@jit
+def max_price_algo_kernel(prices,num_buys,buy_order,sell_order,profit_proportion,buy_proportion,sell_proportion,new_buy_proportion,max_buys,calc_proportion,factors):
+    """
+    Runs max_price_algo over every price (same arguments as new_buy_algo_kernel plus calc_proportion)
+
+    Returns num_buys, buy_order, sell_order, and profit proportion after the last price
+    """
+    for price in prices:
+        if buy_order>0 and price<=buy_order:
+            #Our buy order was successfully placed
+            num_buys+=1
+            total_buy=0.0
+            for i in range(num_buys):
+                total_buy += buy_order*factors[i]
+            sell_order = total_buy/num_buys*(1+sell_proportion)
+            if num_buys<max_buys:
+                buy_order = buy_order*(1-buy_proportion)
+            else:
+                buy_order = 0.0
+
+        if sell_order>0 and price>=sell_order:
+            #Our sell order was successfully placed
+            profit_proportion += num_buys/max_buys*sell_proportion
+            buy_order = sell_order*(1-new_buy_proportion)
+            sell_order = 0.0
+            num_buys = 0
+
+        #If we haven't bought any stock yet and the price increases above calc_proportion, re-caculate buy order
+        if num_buys==0 and price*(1-new_buy_proportion)>buy_order*(1+calc_proportion):
+            buy_order = price*(1-new_buy_proportion)
+
+    return (num_buys,buy_order,sell_order,profit_proportion)
+
+
+@jit
+def new_buy_zero_kernel(prices,num_buys,buy_order,sell_order,profit_proportion,last_sell,buy_proportion,sell_proportion,max_buys,calc_proportion,factors):
+    """
+    Runs new_buy_zero over every price
+    prices - price history (from kernel_prices)
+    num_buys, buy_order, sell_order, profit_proportion, last_sell - starting state (same meaning as new_buy_zero)
+    buy_proportion, sell_proportion, max_buys, calc_proportion - config (same meaning as new_buy_zero)
+    factors - buy_factors(buy_proportion,max_buys,True)
+
+    Returns num_buys, buy_order, sell_order, profit proportion, and last_sell after the last price
+    """
+    for price in prices:
+        if buy_order>0 and price<=buy_order:
+            #Our buy order was successfully placed
+            num_buys+=1
+            total_buy=0.0
+            for i in range(num_buys):
+                total_buy += buy_order/factors[i]
+            sell_order = total_buy/num_buys*(1+sell_proportion)
+            if num_buys<max_buys:
+                buy_order = buy_order*(1-buy_proportion)
+            else:
+                buy_order = 0.0
+
+        if sell_order>0 and price>=sell_order:
+            #Our sell order was successfully placed
+            profit_proportion += num_buys/max_buys*sell_proportion
+            buy_order = sell_order*(1-buy_proportion)
+            last_sell = sell_order
+            sell_order = 0.0
+            num_buys = 1 #Assume we don't sell all of stock
+
+        #If we only have 1 buy and price increases by calc proportion, change buy order
+        if num_buys==1 and calc_proportion>0 and price>last_sell*(1+calc_proportion):
+            buy_order = price*(1-buy_proportion)
+            profit_proportion += 1/max_buys*calc_proportion
+            last_sell = price
+
+        #For calc proportion equal to zero, re-calculate at the sell proportion
+        if num_buys==1 and calc_proportion==0 and price>last_sell*(1+sell_proportion):
+            buy_order = price*(1-buy_proportion)
+            profit_proportion += 1/max_buys*sell_proportion
+            last_sell = price
+
+    return (num_buys,buy_order,sell_order,profit_proportion,last_sell)
+
+
+@jit
+def buy_sell_percent_kernel(prices,buy_proportion,sell_proportion,new_buy_proportion,buys_allowed):
+    """
+    Runs the algorithm from Estimate_Profits_BuySellPercent.py over every price
+    prices - price history (from kernel_prices)
+    buy_proportion, sell_proportion, new_buy_proportion, buys_allowed - config (same meaning as simulate_buy_sell_percent)
+
+    Returns the profit proportion and the number of times we sold stock
+    """
+    length = len(prices)
+    index = 0
+    previous_buy = prices[0]
+    average_buy = previous_buy
+    num_buys = 1
+    profit_proportion = 0.0
+    count_sold = 0
+
+    while index < length:
+        price = prices[index]
+
+        #If price falls below buy percent of the previous buy price and we haven't reached our buys allowed limit, make another buy
+        if price <= previous_buy*(1-buy_proportion) and num_buys<buys_allowed:
+            previous_buy = price
+            average_buy = (num_buys*average_buy + previous_buy)/(num_buys+1)
+            num_buys+=1
+
+        #If price jumps up to sell percent above the average buy price, sell all of our stock
+        if price >= average_buy*(1+sell_proportion):
+            profit_proportion += sell_proportion*num_buys
+            count_sold += num_buys
+            num_buys = 1
+            previous_buy = average_buy*(1+sell_proportion)*(1-new_buy_proportion)
+            average_buy = previous_buy
+
+            #Keep looping through price history until the price falls to the new buy price
+            while index < length and prices[index] > previous_buy:
+                index+=1
+        else:
+            index+=1
+
+    return (profit_proportion,count_sold)
+
+
+def run_kernel_grid(prices,sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys,calc_proportion,max_buys):
+    """
+    Same as Estimate_Profits_Vectorized.run_grid, but runs each config with the compiled kernels
+
+    Returns the profit proportion cube (sell x buy x algorithm)
+    """
+    prices = kernel_prices(prices)
+    first_price = float(prices[0])
+    last_price = float(prices[-1])
+    total_algos = len(new_buy_zero_calc)+len(new_buy_proportions)+len(max_price_new_buys)
+    cube = np.zeros((len(sell_proportions),len(buy_proportions),total_algos))
+
+    for x,buy_proportion in enumerate(buy_proportions):
+        zero_factors = buy_factors(buy_proportion,max_buys,True)
+        factors = buy_factors(buy_proportion,max_buys,False)
+
+        for y,sell_proportion in enumerate(sell_proportions):
+            k = 0
+            for calc in new_buy_zero_calc:
+                (num_buys,buy_order,sell_order,profit_proportion,last_sell) = new_buy_zero_kernel(prices,0,first_price,0.0,0.0,first_price,
+                                                                                               buy_proportion,sell_proportion,max_buys,calc,zero_factors)
+                #Set profit based on ending price
+                cube[y,x,k] = profit_proportion - (1/max_buys)*(last_sell-last_price)/last_sell
+                k+=1
+            for new_buy_proportion in new_buy_proportions:
+                cube[y,x,k] = new_buy_algo_kernel(prices,0,first_price,0.0,0.0,buy_proportion,sell_proportion,new_buy_proportion,max_buys,factors)[3]
+                k+=1
+            for new_buy_proportion in max_price_new_buys:
+                cube[y,x,k] = max_price_algo_kernel(prices,0,first_price,0.0,0.0,buy_proportion,sell_proportion,new_buy_proportion,
+                                                    max_buys,calc_proportion,factors)[3]
+                k+=1
+
+    return cube
+
+
+def random_walk_prices(length,seed=0,start=3.0,volatility=0.004):
+    """
+    Random walk of minute prices rounded to cents (used for parity checks and benchmarks)
+    """
+    generator = random.Random(seed)
+    price = start
+    prices = []
+    for i in range(length):
+        price = max(0.05,round(price*(1+generator.gauss(0,volatility)),2))
+        prices.append(price)
+    return prices
+
+
+def check_parity(length=5000,seeds=(0,1,2)):
+    """
+    Checks that the kernels give the same results as the scalar estimator functions and simulate_buy_sell_percent
+    length - number of prices in each random walk
+    seeds - random walk seeds to check
+
+    Returns a list of mismatches (empty if every result matched)
+    """
+    from Estimate_Profits_MaxPrice_KeepSome_Optimal import new_buy_algo,max_price_algo,new_buy_zero
+    from Price_Crossing_Index import build_crossing_index,simulate_buy_sell_percent
+
+    mismatches = []
+    max_buys = 3
+    calc_proportion = 0.01
+    for seed in seeds:
+        price_list = random_walk_prices(length,seed)
+        prices = kernel_prices(price_list)
+        crossing_index = build_crossing_index(price_list)
+
+        for buy_proportion in [0.005,0.01,0.03,0.08]:
+            for sell_proportion in [0.01,0.02,0.05]:
+                for algo_proportion in [0,0.0025,0.02,0.1]:
+                    config = (seed,buy_proportion,sell_proportion,algo_proportion)
+
+                    #Scalar functions called once per price
+                    new_state = (0,price_list[0],0,0)
+                    max_state = (0,price_list[0],0,0)
+                    zero_state = (0,price_list[0],0,0,price_list[0])
+                    for price in price_list:
+                        new_state = new_buy_algo(price,new_state[1],new_state[2],buy_proportion,sell_proportion,algo_proportion,new_state[0],max_buys,new_state[3])
+                        max_state = max_price_algo(price,max_state[1],max_state[2],buy_proportion,sell_proportion,algo_proportion,max_state[0],max_buys,max_state[3],calc_proportion)
+                        zero_state = new_buy_zero(price,zero_state[1],zero_state[2],buy_proportion,sell_proportion,zero_state[0],max_buys,zero_state[3],algo_proportion,zero_state[4])
+
+                    if new_buy_algo_kernel(prices,0,price_list[0],0.0,0.0,buy_proportion,sell_proportion,algo_proportion,max_buys,
+                                           buy_factors(buy_proportion,max_buys,False))[3] != new_state[3]:
+                        mismatches.append(('new_buy_algo',config))
+                    if max_price_algo_kernel(prices,0,price_list[0],0.0,0.0,buy_proportion,sell_proportion,algo_proportion,max_buys,calc_proportion,
+                                             buy_factors(buy_proportion,max_buys,False))[3] != max_state[3]:
+                        mismatches.append(('max_price_algo',config))
+                    if new_buy_zero_kernel(prices,0,price_list[0],0.0,0.0,price_list[0],buy_proportion,sell_proportion,max_buys,algo_proportion,
+                                           buy_factors(buy_proportion,max_buys,True))[3:] != zero_state[3:]:
+                        mismatches.append(('new_buy_zero',config))
+
+                    #New buy percent can't be zero for the buy sell percent algorithm
+                    new_buy_proportion = algo_proportion+0.0005
+                    if buy_sell_percent_kernel(prices,buy_proportion,sell_proportion,new_buy_proportion,max_buys) != \
+                        simulate_buy_sell_percent(crossing_index,buy_proportion,sell_proportion,new_buy_proportion,max_buys):
+                        mismatches.append(('buy_sell_percent',config))
+
+    return mismatches
+
+
+if __name__=="__main__":
+    mismatches = check_parity()
+    print('Compiled with numba: {}'.format(njit is not None))
+    if len(mismatches)==0:
+        print('All kernels match the scalar estimators.')
+    else:
+        print('Kernels that do not match: {}'.format(mismatches))
@@ -25,6 +25,9 @@ import time
 import pickle
 from mpl_toolkits import mplot3d
 import matplotlib.pyplot as plt
+from Price_History_Store import load_price_history
+from Sweep_Result_Cache import ResultCache,cached_run_grid
+from Sweep_Result_Cube import save_result_cube
 
 def new_buy_algo(price,buy_order,sell_order,buy_proportion,sell_proportion,new_buy_proportion,num_buys,max_buys,profit_proportion):
     """
@@ -195,7 +198,8 @@ def new_buy_zero(price,buy_order,sell_order,buy_proportion,sell_proportion,num_b
 if __name__=="__main__":
     file_name = 'save.p'
 
-    price_history = pickle.load(open("Price_History_April3_May15.p","rb"))
+    #Memory maps the Price_History_April3_May15 store if it was converted, otherwise loads the pickle
+    price_history = load_price_history("Price_History_April3_May15")
 
     test_tickers = ['ASTC']
 
@@ -223,12 +227,26 @@ if __name__=="__main__":
     #Total algorithms we are running
     total_algos = len(new_buy_zero_calc)+len(new_buy_proportions)+len(max_price_new_buys)
 
+    #Sell percent ranges from 1% to 10.5%, buy percent ranges from 0.5% buy below previous sell to 20.4%
+    sell_proportions = [y*0.5/100+1/100 for y in range(20)]
+    buy_proportions = [x*0.1/100+0.5/100 for x in range(200)]
+
+    #Results of previous sweeps (only the cells that are not in the cache get run)
+    cache = ResultCache("Sweep_Results.db")
+    profit_cubes = {}
+
     #Get the profit for each ticker
     for ticker in test_tickers:
 
-        for y in range(20):
+        #Run every sell/buy/algorithm combination at once (same results as looping over new_buy_zero, new_buy_algo and max_price_algo)
+        profit_cube = cached_run_grid(cache,price_history[ticker],sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,
+                                      max_price_new_buys,calc_proportion,max_buys)
+        profit_cubes[ticker] = profit_cube*100
+        profit_cube = profit_cube.tolist()
+
+        for y in range(len(sell_proportions)):
 
-            sell_proportion = y*0.5/100+1/100
+            sell_proportion = sell_proportions[y]
 
             #Reset profits before trying out new sell percent
             profit_ticker_percent[ticker] = []
@@ -238,67 +256,13 @@ if __name__=="__main__":
             if len(buy_percent) > 0:
                 update_x = False
         
-            #Create a 2-D plot of profit buy_percent for each sell percent
-            for x in range(200):
-
-                #Buy percent ranges from 0.5% buy below previous sell to 10% 
-                buy_proportion = x*0.1/100+0.5/100
-
-                index=0
-                #Buy order - the new price for us to buy stock
-                buy_order = [price_history[ticker][index]] * total_algos
-                #Sell order - the new price for us to sell stock (start at zero because we don't own stock)
-                sell_order = [0] * total_algos
-                #num buys - the total number of buys we have without any sells
-                num_buys = [0] * total_algos
-                profit_proportion = [0] * total_algos
-                #Last sell is used for new buy zero calculations
-                last_sell = [price_history[ticker][index]] * len(new_buy_zero_calc)
-
-                #Loop for each price in price_history
-                while index < len(price_history[ticker]):
-                    
-                    price = price_history[ticker][index]
-
-                    #For each new calc proportion for new buy zero, run the new_buy_zero algorithm
-                    for i in range(len(new_buy_zero_calc)):
-                        (num_buys[i],buy_order[i],sell_order[i],profit_proportion[i],last_sell[i]) = new_buy_zero(price,buy_order[i],sell_order[i],buy_proportion,sell_proportion,num_buys[i],max_buys,profit_proportion[i],new_buy_zero_calc[i],last_sell[i])
-
-                    #For each new buy proportion, run the new_buy algorithms
-                    for j in range(len(new_buy_proportions)):
-                        k = j + len(new_buy_zero_calc) #get the index right for variables shared with new_buy_zero algorithm
-                        (num_buys[k],buy_order[k],sell_order[k],profit_proportion[k]) = new_buy_algo(price,buy_order[k],sell_order[k],buy_proportion,sell_proportion,new_buy_proportions[j],num_buys[k],max_buys,profit_proportion[k])
-                
-                    #For each new buy proportion, run the new_buy algorithms
-                    for j in range(len(max_price_new_buys)):
-                        k = j + len(new_buy_zero_calc) + len(new_buy_proportions) #get the index right for variables shared with new_buy_proportion algorithm
-                        #Max price algorithm with new_buy_proportion = 0.25/100 and calc_proportion = 0.01
-                        (num_buys[k],buy_order[k],sell_order[k],profit_proportion[k]) = max_price_algo(price,buy_order[k],sell_order[k],buy_proportion,sell_proportion,max_price_new_buys[j],num_buys[k],max_buys,profit_proportion[k],calc_proportion)
-
-                    index+=1
-
-                last_price = price_history[ticker][-1] 
-                #For new_buy_zero calcs, set profit based on ending price.
-                for i in range(len(new_buy_zero_calc)):
-                    profit_proportion[i] -= (1/max_buys)*(last_sell[i]-last_price)/last_sell[i]
+            #Create a 2-D plot of profit buy_percent for each sell percent (profits come from the vectorized grid)
+            for x in range(len(buy_proportions)):
 
                 for i in range(total_algos):
-                    profit_ticker_percent[ticker][i].append(profit_proportion[i]*100)
+                    profit_ticker_percent[ticker][i].append(profit_cube[y][x][i]*100)
                 if update_x:
-                    buy_percent.append(buy_proportion*100)
-
-                
-                """         
-                print('-------------------------------------------------------------')
-                print('{} had a profit percent of {}.'.format(ticker,profit_ticker_percent[ticker]/buys_allowed))
-                print('The number times we bought and sold was {}.'.format(times_sold))
-                print('The last price is {}, and the last buy average was {}.'.format(last_price,average_buy))
-                print('-------------------------------------------------------------')
-                """
-                    
-                #total_profit_percent = sum(profit_ticker_percent.values())/buys_allowed        
-                #print('Total percent profit:  {}'.format(total_profit_percent))
-                #print('Average percent profit:  {}'.format(total_profit_percent/len(test_tickers)))
+                    buy_percent.append(buy_proportions[x]*100)
 
             fig = plt.figure()
 
@@ -322,10 +286,13 @@ if __name__=="__main__":
             plt.legend()
             plt.show()
 
-    """
-    pickle.dump(profit_ticker_percent,open("PofitbyPercent_BuyNewBuy_April3_May15_3_SGBX.p","wb"))
-    pickle.dump(buy_percent,open("BuyPercent_SGBX.p","wb"))
-    pickle.dump(new_buy_percent,open("NewBuyPercent_SGBX.p","wb"))
-    """
+    #Save the sell x buy x algorithm cube (graph it with Graph_Estimated_Profits.py)
+    algorithms = ['zero = {}'.format(calc*100) for calc in new_buy_zero_calc] + \
+                 ['new = {}'.format(new_buy*100) for new_buy in new_buy_proportions] + \
+                 ['max = {}'.format(new_buy*100) for new_buy in max_price_new_buys]
+    axes = [('Sell Percent',[sell*100 for sell in sell_proportions]),
+            ('Buy Percent',[buy*100 for buy in buy_proportions]),
+            ('Algorithm',algorithms)]
+    save_result_cube("Sweep_KeepSome_April3_May15_3.npz",test_tickers,axes,{'Profit Percent':profit_cubes})
 
 
@@ -0,0 +1,211 @@
+# Monte Carlo robustness check for buy/sell/new buy percent configs.
+# One price history is only one path, so configs picked on it (Ex: InitializeTransactionsDictionary.py) can be overfit.
+# This builds many resampled price paths with a block bootstrap of the minute returns (blocks keep the short term
+# swings the algorithm trades on) and runs every config on every path.
+
+# Paths are generated in batches inside worker processes from a seed, so only the seed is sent to a worker and only
+# the batch of profits comes back. The mean, variance and quantiles of each config's profit are updated online
+# (Welford mean/variance and P-squared quantile markers), so memory does not grow with the number of paths.
+
+import multiprocessing
+import numpy as np
+from Estimate_Profits_Kernels import buy_sell_percent_kernel,kernel_prices
+
+#State of a worker process (set once by init_worker)
+worker = {}
+
+
+def bootstrap_paths(log_returns,start_price,length,block_size,count,generator):
+    """
+    Builds price paths from blocks of historical returns
+    log_returns - numpy array of log returns of the minute prices
+    start_price - first price of every path
+    length - number of prices in each path
+    block_size - number of consecutive returns in each block
+    count - number of paths
+    generator - numpy random generator
+
+    Returns a numpy array of paths (count x length) rounded to cents
+    """
+    blocks = -(-(length-1)//block_size)
+    starts = generator.integers(0,len(log_returns)-block_size+1,size=(count,blocks))
+    indexes = (starts[:,:,None]+np.arange(block_size)).reshape(count,-1)[:,:length-1]
+    log_prices = np.log(start_price)+np.concatenate((np.zeros((count,1)),np.cumsum(log_returns[indexes],axis=1)),axis=1)
+    return np.maximum(np.round(np.exp(log_prices),2),0.01)
+
+
+class P2Quantiles:
+    """
+    P-squared estimate of one quantile for many configs at once (five markers per config, Jain and Chlamtac 1985)
+    """
+
+    def __init__(self,count,quantile):
+        self.quantile = quantile
+        self.first = []
+        self.heights = None
+        self.positions = np.tile(np.arange(1,6,dtype=np.float64),(count,1))
+        self.desired = np.tile(np.array([1,1+2*quantile,1+4*quantile,3+2*quantile,5]),(count,1))
+        self.increments = np.array([0,quantile/2,quantile,(1+quantile)/2,1])
+
+    def add(self,values):
+        """
+        values - one new value for each config
+        """
+        if self.heights is None:
+            #The first five values become the markers
+            self.first.append(np.array(values,dtype=np.float64))
+            if len(self.first)==5:
+                self.heights = np.sort(np.stack(self.first,axis=1),axis=1)
+            return
+
+        heights = self.heights
+        rows = np.arange(len(values))
+        heights[:,0] = np.minimum(heights[:,0],values)
+        heights[:,4] = np.maximum(heights[:,4],values)
+        #Cell k of each value (markers above the cell move up one position)
+        cell = np.clip((values[:,None]>=heights[:,1:4]).sum(axis=1),0,3)
+        self.positions += np.arange(5)[None,:]>cell[:,None]
+        self.desired += self.increments
+
+        for i in range(1,4):
+            offset = self.desired[:,i]-self.positions[:,i]
+            move = ((offset>=1) & (self.positions[:,i+1]-self.positions[:,i]>1)) | \
+                   ((offset<=-1) & (self.positions[:,i-1]-self.positions[:,i]<-1))
+            if not move.any():
+                continue
+            step = np.sign(offset)
+            (n_low,n,n_high) = (self.positions[:,i-1],self.positions[:,i],self.positions[:,i+1])
+            (q_low,q,q_high) = (heights[:,i-1],heights[:,i],heights[:,i+1])
+            with np.errstate(divide='ignore',invalid='ignore'):
+                parabolic = q+step/(n_high-n_low)*((n-n_low+step)*(q_high-q)/(n_high-n)+(n_high-n-step)*(q-q_low)/(n-n_low))
+                neighbor = np.where(step>0,i+1,i-1)
+                linear = q+step*(heights[rows,neighbor]-q)/(self.positions[rows,neighbor]-n)
+            estimate = np.where((q_low<parabolic) & (parabolic<q_high),parabolic,linear)
+            heights[:,i] = np.where(move,estimate,q)
+            self.positions[:,i] += np.where(move,step,0)
+
+    def value(self):
+        """
+        Returns the current quantile estimate of each config
+        """
+        if self.heights is None:
+            #Fewer than five values, use the exact quantile
+            return np.quantile(np.stack(self.first,axis=1),self.quantile,axis=1)
+        return self.heights[:,2].copy()
+
+
+class OnlineProfitStats:
+    """
+    Running mean, variance and quantiles of profit for many configs
+    """
+
+    def __init__(self,count,quantiles=(0.05,0.5,0.95)):
+        self.paths = 0
+        self.mean = np.zeros(count)
+        self.squares = np.zeros(count)
+        self.quantiles = {quantile:P2Quantiles(count,quantile) for quantile in quantiles}
+
+    def add(self,profits):
+        """
+        profits - profit of each config on one path
+        """
+        profits = np.asarray(profits,dtype=np.float64)
+        self.paths += 1
+        delta = profits-self.mean
+        self.mean += delta/self.paths
+        self.squares += delta*(profits-self.mean)
+        for estimator in self.quantiles.values():
+            estimator.add(profits)
+
+    def results(self):
+        """
+        Returns a dictionary with Paths, Mean, Std and Quantiles (dictionary of quantile to estimate) for each config
+        """
+        return {'Paths':self.paths,
+                'Mean':self.mean.copy(),
+                'Std':np.sqrt(self.squares/max(self.paths-1,1)),
+                'Quantiles':{quantile:estimator.value() for quantile,estimator in self.quantiles.items()}}
+
+
+def init_worker(log_returns,start_price,length,block_size,configs,buys_allowed):
+    """
+    Stores the settings shared by every batch in the worker process
+    """
+    worker['Log Returns'] = log_returns
+    worker['Start Price'] = start_price
+    worker['Length'] = length
+    worker['Block Size'] = block_size
+    worker['Configs'] = configs
+    worker['Buys Allowed'] = buys_allowed
+
+
+def run_batch(task):
+    """
+    Generates a batch of paths and runs every config on them
+    task - (batch seed, number of paths)
+
+    Returns a numpy array of profit percents (paths x configs)
+    """
+    (seed,count) = task
+    generator = np.random.default_rng(seed)
+    paths = bootstrap_paths(worker['Log Returns'],worker['Start Price'],worker['Length'],worker['Block Size'],count,generator)
+    profits = np.zeros((count,len(worker['Configs'])))
+    for p in range(count):
+        prices = kernel_prices(paths[p])
+        for c,(buy_proportion,sell_proportion,new_buy_proportion) in enumerate(worker['Configs']):
+            profits[p,c] = buy_sell_percent_kernel(prices,buy_proportion,sell_proportion,new_buy_proportion,worker['Buys Allowed'])[0]*100
+    return profits
+
+
+def monte_carlo(prices,configs,buys_allowed,paths=1000,length=None,block_size=60,batch_size=20,processes=None,seed=0,quantiles=(0.05,0.5,0.95)):
+    """
+    Runs configs on block bootstrap paths of a price history
+    prices - minute level price history of a ticker
+    configs - list of (buy_proportion,sell_proportion,new_buy_proportion)
+    buys_allowed - the number of times we allow the bot to re-buy the same stock without any sells
+    paths - number of resampled paths
+    length - number of prices in each path (default is the length of the price history)
+    block_size - number of consecutive minute returns in each bootstrap block
+    batch_size - number of paths generated by a worker at a time
+    processes - number of worker processes (default is the number of cores)
+    seed - seed of the first batch (batch i uses seed+i, so results do not depend on the number of processes)
+    quantiles - profit quantiles to estimate
+
+    Returns a dictionary with Paths, Mean, Std and Quantiles of the profit percent of each config (in the order of configs)
+    """
+    prices = np.asarray(prices,dtype=np.float64)
+    log_returns = np.diff(np.log(prices))
+    if length is None:
+        length = len(prices)
+
+    stats = OnlineProfitStats(len(configs),quantiles)
+    tasks = [(seed+i,min(batch_size,paths-start)) for i,start in enumerate(range(0,paths,batch_size))]
+    with multiprocessing.Pool(processes,initializer=init_worker,initargs=(log_returns,float(prices[0]),length,block_size,configs,buys_allowed)) as pool:
+        #Batches come back in order so the online quantiles are the same on every run
+        for profits in pool.imap(run_batch,tasks):
+            for path_profits in profits:
+                stats.add(path_profits)
+
+    return stats.results()
+
+
+if __name__=="__main__":
+    from Price_History_Store import load_price_history
+
+    price_history = load_price_history("Price_History_April3_May15")
+    buys_allowed = 3
+
+    #Settings from InitializeTransactionsDictionary.py and the neighboring buy and sell percents
+    settings = {'SVC':(5/100,4/100),'ASTC':(4/100,3/100),'SGBX':(10/100,2/100)}
+    new_buy_proportion = 0.05/100
+
+    for ticker,(buy,sell) in settings.items():
+        configs = [(buy*b,sell*s,new_buy_proportion) for b in (0.75,1,1.25) for s in (0.75,1,1.25)]
+        result = monte_carlo(price_history[ticker],configs,buys_allowed,paths=500)
+
+        print('-------------------------------------------------------------')
+        print('{} profit percent over {} bootstrap paths'.format(ticker,result['Paths']))
+        for c,(buy_proportion,sell_proportion,new_buy) in enumerate(configs):
+            print('buy {}% sell {}%: mean {} std {} 5% {} median {} 95% {}'.format(round(buy_proportion*100,2),round(sell_proportion*100,2),
+                  round(result['Mean'][c],2),round(result['Std'][c],2),round(result['Quantiles'][0.05][c],2),
+                  round(result['Quantiles'][0.5][c],2),round(result['Quantiles'][0.95][c],2)))
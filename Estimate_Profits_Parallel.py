@@ -0,0 +1,156 @@
+# Runs the buy/sell/new buy percent sweeps (Estimate_Profits_BuySellPercent.py, Estimate_Profits_VaryAll3.py) on a process pool.
+# The price series and their crossing index tables (range min/max, see Price_Crossing_Index.py) are built once with numpy
+# and published in a shared memory block. Each worker attaches to it when it starts and reads the tables in place
+# (memoryview slices), so no worker gets the price history pickled with every task or builds its own copy of the tables.
+# Results are gathered into the same profit_ticker_percent[ticker] = [profit percent for each config] layout as the scripts.
+# If a ResultCache is passed in, only the configs missing from the cache are run and results are cached as each chunk finishes.
+
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from Price_Crossing_Index import simulate_buy_sell_percent
+from Sweep_Result_Cache import price_series_hash,cell_key
+
+#State of a worker process (set once by init_worker)
+worker = {}
+
+
+def publish_prices(price_history,tickers):
+    """
+    Copies the price history of each ticker and its crossing index tables into one shared memory block
+    price_history - dictionary of minute level price data for each ticker
+    tickers - the tickers to publish
+
+    Returns the shared memory block and the layout dictionary, layout[ticker] = [(min_offset,max_offset,length), ...]
+        with one entry per table level (level 0 is the prices, so its min and max offsets are the same)
+    """
+    layout = {}
+    total = 0
+    for ticker in tickers:
+        length = len(price_history[ticker])
+        layout[ticker] = [(total,total,length)]
+        total += length
+        k = 1
+        while (1<<k) <= length:
+            level_length = length-(1<<k)+1
+            layout[ticker].append((total,total+level_length,level_length))
+            total += 2*level_length
+            k += 1
+
+    memory = shared_memory.SharedMemory(create=True,size=max(total,1)*8)
+    block = np.ndarray((total,),dtype=np.float64,buffer=memory.buf)
+    for ticker in tickers:
+        levels = layout[ticker]
+        (offset,offset_max,length) = levels[0]
+        block[offset:offset+length] = price_history[ticker]
+        #Each block of 2**k prices is made up of two blocks of 2**(k-1) prices (written straight into the shared block)
+        for k in range(1,len(levels)):
+            half = 1<<(k-1)
+            (prev_min,prev_max,prev_length) = levels[k-1]
+            (min_offset,max_offset,level_length) = levels[k]
+            np.minimum(block[prev_min:prev_min+level_length],block[prev_min+half:prev_min+half+level_length],
+                       out=block[min_offset:min_offset+level_length])
+            np.maximum(block[prev_max:prev_max+level_length],block[prev_max+half:prev_max+half+level_length],
+                       out=block[max_offset:max_offset+level_length])
+    del block
+
+    return (memory,layout)
+
+
+def init_worker(memory_name,layout,configs,buys_allowed):
+    """
+    Attaches a worker process to the shared price block
+    memory_name - name of the shared memory block from publish_prices
+    layout - layout[ticker] = [(min_offset,max_offset,length), ...] of each ticker's tables in the block
+    configs - list of (buy_proportion,sell_proportion,new_buy_proportion) to test
+    buys_allowed - the number of times we allow the bot to re-buy the same stock without any sells
+    """
+    worker['Memory'] = shared_memory.SharedMemory(name=memory_name)
+    #Indexing a memoryview gives python floats as fast as a list, without copying the tables
+    worker['Block'] = worker['Memory'].buf.cast('d')
+    worker['Layout'] = layout
+    worker['Configs'] = configs
+    worker['Buys Allowed'] = buys_allowed
+    worker['Crossing Index'] = {}
+
+
+def sweep_chunk(task):
+    """
+    Estimates profit for a chunk of configs on one ticker (runs in a worker process)
+    task - (ticker,indexes) indexes of the configs to run
+
+    Returns ticker, indexes and a list of (profit_proportion,count_sold) for each config
+    """
+    (ticker,indexes) = task
+
+    #Point a crossing index at the shared tables the first time this worker sees the ticker
+    if ticker not in worker['Crossing Index']:
+        block = worker['Block']
+        levels = worker['Layout'][ticker]
+        worker['Crossing Index'][ticker] = {'Prices':block[levels[0][0]:levels[0][0]+levels[0][2]],
+                                            'Min':[block[min_offset:min_offset+length] for (min_offset,max_offset,length) in levels],
+                                            'Max':[block[max_offset:max_offset+length] for (min_offset,max_offset,length) in levels]}
+    crossing_index = worker['Crossing Index'][ticker]
+
+    results = []
+    for i in indexes:
+        (buy_proportion,sell_proportion,new_buy_proportion) = worker['Configs'][i]
+        results.append(simulate_buy_sell_percent(crossing_index,buy_proportion,sell_proportion,new_buy_proportion,worker['Buys Allowed']))
+    return (ticker,indexes,results)
+
+
+def run_parallel_sweep(price_history,tickers,configs,buys_allowed,processes=None,chunk_size=250,cache=None):
+    """
+    Estimates profit for every config on every ticker using a pool of processes
+    price_history - dictionary of minute level price data for each ticker
+    tickers - the tickers to test
+    configs - list of (buy_proportion,sell_proportion,new_buy_proportion) to test
+    buys_allowed - the number of times we allow the bot to re-buy the same stock without any sells
+    processes - number of worker processes (default is the number of cores)
+    chunk_size - number of configs sent to a worker at a time
+    cache - ResultCache of previously computed configs (None to compute everything)
+
+    Returns profit_ticker_percent and times_sold dictionaries with a list entry for each config (in the order of configs)
+    """
+    profit_ticker_percent = {}
+    times_sold = {}
+    for ticker in tickers:
+        profit_ticker_percent[ticker] = [0]*len(configs)
+        times_sold[ticker] = [0]*len(configs)
+
+    tasks = []
+    keys = {}
+    for ticker in tickers:
+        missing = list(range(len(configs)))
+        if cache is not None:
+            #Fill in the configs we already have results for
+            price_hash = price_series_hash(price_history[ticker])
+            keys[ticker] = [cell_key('Buy Sell Percent',config,buys_allowed,price_hash) for config in configs]
+            found = cache.get_many(keys[ticker])
+            missing = []
+            for i,key in enumerate(keys[ticker]):
+                if key in found:
+                    profit_ticker_percent[ticker][i] = found[key][0]*100
+                    times_sold[ticker][i] = found[key][1]
+                else:
+                    missing.append(i)
+        tasks += [(ticker,missing[start:start+chunk_size]) for start in range(0,len(missing),chunk_size)]
+
+    if len(tasks)==0:
+        return (profit_ticker_percent,times_sold)
+
+    (memory,layout) = publish_prices(price_history,tickers)
+    try:
+        with multiprocessing.Pool(processes,initializer=init_worker,initargs=(memory.name,layout,configs,buys_allowed)) as pool:
+            for (ticker,indexes,results) in pool.imap_unordered(sweep_chunk,tasks):
+                for i,(profit_proportion,count_sold) in zip(indexes,results):
+                    profit_ticker_percent[ticker][i] = profit_proportion*100
+                    times_sold[ticker][i] = count_sold
+                if cache is not None:
+                    #Save each chunk as it finishes so an interrupted sweep can resume
+                    cache.put_many({keys[ticker][i]:[profit_proportion,count_sold] for i,(profit_proportion,count_sold) in zip(indexes,results)})
+    finally:
+        memory.close()
+        memory.unlink()
+
+    return (profit_ticker_percent,times_sold)
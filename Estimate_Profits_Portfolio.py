@@ -0,0 +1,249 @@
+# Portfolio backtest of the live bot across all tickers.
+# The other estimators run one ticker at a time and report profit proportions. The live bot gives each ticker an
+# 'Available Balance', sizes 'Order Quantity' from it and reserves cash when a buy is placed. This steps every ticker
+# on one common timeline with the state of all tickers held in numpy arrays, so each minute is a handful of array
+# operations no matter how many tickers there are.
+
+# Each minute follows the ordering_bot phases for every ticker at once (the same rules as Estimate_Profits_BidAsk.py):
+#   place buy (cash is reserved) -> track buy (bid <= limit buy) or else track sell (ask >= limit sell)
+#   -> place/replace sell at Average Buy*(1+Sell Proportion) -> cancel buy after a sell (reserved cash is returned)
+# With shared_cash=True the tickers draw on one cash pool instead of their own balances (first ticker in the list buys first).
+
+import numpy as np
+
+#Settings read from the transactions dictionary for each ticker
+setting_keys = ['First Buy','Buy Proportion','Sell Proportion','New Buy Proportion','Available Balance','Order Quantity','Max Digits']
+
+
+def settings_from_transactions(transactions,tickers=None):
+    """
+    Reads the portfolio settings from a transactions dictionary (InitializeTransactionsDictionary.py)
+    transactions - the transactions dictionary
+    tickers - tickers to include (default is transactions['Tickers'])
+
+    Returns a dictionary of setting name to a numpy array with one value for each ticker
+    """
+    if tickers is None:
+        tickers = transactions['Tickers']
+    return {key:np.array([transactions[ticker][key] for ticker in tickers],dtype=np.float64) for key in setting_keys}
+
+
+def align_price_history(price_history,tickers,times=None):
+    """
+    Puts the price histories of many tickers on one timeline
+    price_history - dictionary like object of minute level prices (PriceStore or the price history pickle)
+    tickers - the tickers to align
+    times - dictionary of ticker to the time of each price (None to line the prices up by position)
+
+    Returns a numpy array of prices (minutes x tickers) with nan where a ticker has no price, and the times of the rows
+    """
+    if times is None:
+        length = max(len(price_history[ticker]) for ticker in tickers)
+        timeline = np.arange(length)
+        times = {ticker:np.arange(len(price_history[ticker])) for ticker in tickers}
+    else:
+        timeline = np.unique(np.concatenate([np.asarray(times[ticker]) for ticker in tickers]))
+
+    prices = np.full((len(timeline),len(tickers)),np.nan)
+    for t,ticker in enumerate(tickers):
+        prices[np.searchsorted(timeline,times[ticker]),t] = price_history[ticker]
+    return (prices,timeline)
+
+
+def round_digits(values,digits,where):
+    """
+    Rounds the values of the tickers in where to their number of digits with round (the same as place_buy_order and
+    place_sell_order, np.round can round a half cent the other way)
+    values - one value for each ticker
+    digits - number of digits of each ticker ('Max Digits')
+    where - boolean array of the tickers to round (the others are returned as they are)
+
+    Returns a new array of values
+    """
+    rounded = values.copy()
+    for t in np.flatnonzero(where):
+        rounded[t] = round(float(values[t]),int(digits[t]))
+    return rounded
+
+
+def simulate_portfolio(settings,bids,asks=None,shared_cash=False,record_every=1):
+    """
+    Runs the live bot algorithm on every ticker at once
+    settings - dictionary from settings_from_transactions
+    bids - bid prices (minutes x tickers), nan where a ticker has no quote
+    asks - ask prices (default is the bid prices, for minute open prices)
+    shared_cash - True to draw every ticker's buys from one cash pool (the sum of the Available Balances)
+    record_every - number of minutes between the rows of the ticker equity curves
+
+    Returns a dictionary
+        Equity - portfolio value after each minute (cash, reserved buy cash and stock at the last price)
+        Ticker Equity - value of each ticker every record_every minutes (rows x tickers)
+        Cash - cash that is not reserved or invested at the end
+        Stock Owned, Average Buy - position of each ticker at the end
+        Times Sold, Buys - number of filled sell and buy orders of each ticker
+    """
+    if asks is None:
+        asks = bids
+    (length,count) = bids.shape
+    first_buy = settings['First Buy']
+    buy_proportion = settings['Buy Proportion']
+    sell_proportion = settings['Sell Proportion']
+    new_buy_proportion = settings['New Buy Proportion']
+    quantity = settings['Order Quantity']
+    digits = settings['Max Digits']
+
+    balance = settings['Available Balance'].copy()
+    cash = np.array([balance.sum()])
+    stock_owned = np.zeros(count)
+    previous_buy = np.zeros(count)
+    average_buy = np.zeros(count)
+    previous_sell = np.zeros(count)
+    limit_buy = np.zeros(count)
+    limit_sell = np.zeros(count)
+    last_price = np.where(np.isnan(bids[0]),first_buy,bids[0])
+    times_sold = np.zeros(count,dtype=np.int64)
+    buys = np.zeros(count,dtype=np.int64)
+
+    equity = np.zeros(length)
+    ticker_equity = np.zeros((-(-length//record_every),count))
+
+    for minute in range(length):
+        bid = bids[minute]
+        ask = asks[minute]
+
+        #Place Limit Buy Orders
+        placing = limit_buy==0
+        if placing.any():
+            buy_price = np.where((stock_owned==0) & (previous_sell>0),previous_sell*(1-new_buy_proportion),
+                                 np.where(stock_owned>0,previous_buy*(1-buy_proportion),first_buy))
+            buy_price = round_digits(buy_price,digits,placing)
+            cost = np.where(placing,buy_price*quantity,0)
+            if shared_cash:
+                #Tickers buy in order until the shared cash runs out
+                placing &= np.cumsum(cost) < cash[0]
+                cash[0] -= cost[placing].sum()
+            else:
+                placing &= balance > cost
+                balance -= np.where(placing,cost,0)
+            previous_sell = np.where(placing,0,previous_sell)
+            limit_buy = np.where(placing,buy_price,limit_buy)
+
+        #Track Orders (a buy is tracked before a sell on the same minute)
+        bought = (limit_buy>0) & (bid<=limit_buy)
+        sold = ~bought & (limit_sell>0) & (ask>=limit_sell)
+        if bought.any():
+            average_buy = np.where(bought,(average_buy*stock_owned+limit_buy*quantity)/np.where(bought,stock_owned+quantity,1),average_buy)
+            previous_buy = np.where(bought,limit_buy,previous_buy)
+            stock_owned = np.where(bought,stock_owned+quantity,stock_owned)
+            limit_buy = np.where(bought,0,limit_buy)
+            buys += bought
+        if sold.any():
+            proceeds = np.where(sold,limit_sell*stock_owned,0)
+            if shared_cash:
+                cash[0] += proceeds.sum()
+            else:
+                balance += proceeds
+            previous_buy = np.where(sold,0,previous_buy)
+            average_buy = np.where(sold,0,average_buy)
+            previous_sell = np.where(sold,limit_sell,previous_sell)
+            stock_owned = np.where(sold,0,stock_owned)
+            limit_sell = np.where(sold,0,limit_sell)
+            times_sold += sold
+
+        #Place/Replace Limit Sell Orders
+        #Only the tickers that bought this minute have a new Average Buy
+        if bought.any():
+            limit_sell = round_digits(average_buy*(1+sell_proportion),digits,bought)
+
+        #Cancel Buy Orders after a sell (returns the reserved cash)
+        cancel = (previous_sell>0) & (limit_buy>0)
+        if cancel.any():
+            refund = np.where(cancel,limit_buy*quantity,0)
+            if shared_cash:
+                cash[0] += refund.sum()
+            else:
+                balance += refund
+            limit_buy = np.where(cancel,0,limit_buy)
+
+        #Value stock at the last bid of each ticker
+        last_price = np.where(np.isnan(bid),last_price,bid)
+        value = limit_buy*quantity+stock_owned*last_price
+        equity[minute] = value.sum()+(cash[0] if shared_cash else balance.sum())
+        if minute%record_every==0:
+            ticker_equity[minute//record_every] = value if shared_cash else value+balance
+
+    return {'Equity':equity,
+            'Ticker Equity':ticker_equity,
+            'Cash':cash[0] if shared_cash else balance.sum(),
+            'Stock Owned':stock_owned,
+            'Average Buy':average_buy,
+            'Times Sold':times_sold,
+            'Buys':buys}
+
+
+def check_parity(length=2000,seeds=range(30)):
+    """
+    Checks that one ticker run by simulate_portfolio gives the same fills and equity as simulate_bid_ask
+    length - number of quotes in each random walk
+    seeds - random walk seeds to check
+
+    Returns a list of mismatches (empty if every result matched)
+    """
+    from Estimate_Profits_BidAsk import simulate_bid_ask
+    from Estimate_Profits_Kernels import random_walk_prices
+
+    mismatches = []
+    for seed in seeds:
+        bid = np.array(random_walk_prices(length,seed,start=1.0))
+        #Spread of 1 to 3 cents
+        ask = np.round(bid+np.random.RandomState(seed).randint(1,4,length)/100,2)
+        (first_buy,balance,max_buys) = (float(bid[0]),1000.0,5)
+        for (buy_proportion,sell_proportion,new_buy_proportion) in [(0.05,0.05,0.01),(0.02,0.015,0.005)]:
+            expected = simulate_bid_ask(bid,ask,first_buy,buy_proportion,sell_proportion,new_buy_proportion,balance,max_buys)
+            quantity = np.floor(balance/(first_buy*(1+sell_proportion)*max_buys))
+            settings = {'First Buy':np.array([first_buy]),
+                        'Buy Proportion':np.array([buy_proportion]),
+                        'Sell Proportion':np.array([sell_proportion]),
+                        'New Buy Proportion':np.array([new_buy_proportion]),
+                        'Available Balance':np.array([balance]),
+                        'Order Quantity':np.array([quantity]),
+                        'Max Digits':np.array([2.0])}
+            result = simulate_portfolio(settings,bid[:,None],ask[:,None])
+            if result['Buys'][0]!=expected['Buys'] or result['Times Sold'][0]!=expected['Times Sold'] or \
+                abs(result['Equity'][-1]-(balance+expected['Profit']))>1e-6:
+                mismatches.append((seed,buy_proportion,sell_proportion,new_buy_proportion))
+    return mismatches
+
+
+if __name__=="__main__":
+    import pickle
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from Price_History_Store import load_price_history
+
+    #Make sure the portfolio steps match the single ticker bid/ask estimator
+    mismatches = check_parity()
+    if len(mismatches)>0:
+        print('Portfolio results that do not match simulate_bid_ask: {}'.format(mismatches))
+
+    #Use the live settings on the price history the estimators were run on
+    with open("Transactions.p","rb") as transactions_file:
+        transactions = pickle.load(transactions_file)
+    price_history = load_price_history("Price_History_April3_May15")
+    tickers = [ticker for ticker in transactions['Tickers'] if ticker in price_history]
+    times = {ticker:price_history.times(ticker) for ticker in tickers} if hasattr(price_history,'times') and \
+        all(price_history.times(ticker) is not None for ticker in tickers) else None
+
+    (prices,timeline) = align_price_history(price_history,tickers,times)
+    settings = settings_from_transactions(transactions,tickers)
+    result = simulate_portfolio(settings,prices,record_every=60)
+
+    start = settings['Available Balance'].sum()
+    print('Portfolio profit percent {} ({} sells)'.format(round((result['Equity'][-1]/start-1)*100,2),result['Times Sold'].sum()))
+    fig = plt.figure(figsize=(10,6))
+    plt.plot(result['Equity'],label='Portfolio')
+    plt.xlabel('Minute')
+    plt.ylabel('Equity')
+    plt.legend()
+    fig.savefig('Portfolio_Equity.png',dpi=100)
@@ -0,0 +1,273 @@
+# Vectorized version of the algorithms in Estimate_Profits_MaxPrice_KeepSome_Optimal.py
+# Instead of calling new_buy_zero, new_buy_algo and max_price_algo once per price for every grid point,
+# this holds the state of the whole parameter grid (sell_proportion x buy_proportion x algorithm) as numpy arrays
+# and steps all of them together over each price.
+
+# The result cube has the same profit_proportion values as the scalar functions.
+#   - Powers of (1+buy_proportion) and (1-buy_proportion) are computed with python floats just like the scalar functions
+#   - The total buy is summed in the same order as the scalar for loops (adding 0 for buys that have not happened yet)
+
+# Prices can also be streamed in chunks (run_grid_chunks). The grid state carries over from one chunk to the next,
+# so histories larger than memory give the same cube as an in-memory run while only one chunk is held at a time.
+
+# Grid axes of the result cube
+#   - axis 0: sell_proportions
+#   - axis 1: buy_proportions
+#   - axis 2: algorithms in the order new_buy_zero_calc, new_buy_proportions, max_price_new_buys
+
+import numpy as np
+
+
+def power_table(proportions,max_buys,shape,sign):
+    """
+    Precompute (1+sign*proportion)**i for each buy proportion the same way the scalar functions do (python float powers)
+    proportions - list of buy proportions (axis 1 of the grid)
+    max_buys - the number of times we are allowed to buy the same stock
+    shape - the shape of the grid state arrays
+    sign - 1 for new_buy_algo/max_price_algo (1+buy_proportion), -1 for new_buy_zero (1-buy_proportion)
+
+    Returns an array of shape (max_buys,)+shape
+    """
+    table = np.empty((max_buys,)+shape)
+    for i in range(max_buys):
+        powers = np.array([(1+sign*proportion)**i for proportion in proportions])
+        table[i] = np.broadcast_to(powers.reshape(1,-1,1),shape)
+    return table
+
+
+def init_family(first_price,shape,algo_proportions,buy_proportions,sell_proportions,max_buys,sign):
+    """
+    Create the state arrays for one algorithm family of the grid
+    first_price - the first price in the price history (first buy order and first last sell)
+    shape - shape of the state arrays (len(sell_proportions),len(buy_proportions),len(algo_proportions))
+    algo_proportions - the calc proportions (new_buy_zero) or new buy proportions (new_buy_algo, max_price_algo) on axis 2
+    buy_proportions - the buy proportions on axis 1
+    sell_proportions - the sell proportions on axis 0
+    max_buys - the number of times we are allowed to buy the same stock
+    sign - sign of the buy proportion in the average buy power table
+
+    Returns a dictionary of state and parameter arrays
+    """
+    family = {}
+    #State of each grid point (same starting values as the scalar estimators)
+    family['Num Buys'] = np.zeros(shape,dtype=np.int64)
+    family['Buy Order'] = np.full(shape,first_price,dtype=np.float64)
+    family['Sell Order'] = np.zeros(shape,dtype=np.float64)
+    family['Profit Proportion'] = np.zeros(shape,dtype=np.float64)
+    family['Last Sell'] = np.full(shape,first_price,dtype=np.float64)
+
+    #Parameters broadcast to the full grid so that boolean masks can be applied to them
+    family['Sell Proportion'] = np.broadcast_to(np.array(sell_proportions,dtype=np.float64).reshape(-1,1,1),shape).copy()
+    family['Buy Proportion'] = np.broadcast_to(np.array(buy_proportions,dtype=np.float64).reshape(1,-1,1),shape).copy()
+    family['Algo Proportion'] = np.broadcast_to(np.array(algo_proportions,dtype=np.float64).reshape(1,1,-1),shape).copy()
+    family['Powers'] = power_table(buy_proportions,max_buys,shape,sign)
+    return family
+
+
+def init_grid(first_price,sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys,calc_proportion,max_buys):
+    """
+    Create the grid state for all three algorithms
+    first_price - the first price in the price history
+    sell_proportions - list of sell proportions to test (axis 0)
+    buy_proportions - list of buy proportions to test (axis 1)
+    new_buy_zero_calc - list of calc proportions to test with the new_buy_zero algorithm
+    new_buy_proportions - list of new buy proportions to test with the new_buy_algo algorithm
+    max_price_new_buys - list of new buy proportions to test with the max_price_algo algorithm
+    calc_proportion - calc proportion used by the max_price_algo algorithm
+    max_buys - the number of times we are allowed to buy the same stock
+
+    Returns the grid dictionary
+    """
+    first_price = float(first_price)
+    grid = {'Max Buys':max_buys,'Calc Proportion':calc_proportion,'Last Price':first_price}
+    grid['Families'] = [('New Buy Zero',new_buy_zero_calc,-1),('New Buy',new_buy_proportions,1),('Max Price',max_price_new_buys,1)]
+    for (name,algo_proportions,sign) in grid['Families']:
+        shape = (len(sell_proportions),len(buy_proportions),len(algo_proportions))
+        grid[name] = init_family(first_price,shape,algo_proportions,buy_proportions,sell_proportions,max_buys,sign)
+    return grid
+
+
+def average_buy_step(price,family,max_buys,zero):
+    """
+    Fill the buy orders that the price dipped to and re-calculate the sell order (same as the first block of the scalar functions)
+    price - current price of stock
+    family - state arrays of the algorithm family
+    max_buys - the number of times we are allowed to buy the same stock
+    zero - True for new_buy_zero (divides by powers of 1-buy_proportion), False otherwise (multiplies by powers of 1+buy_proportion)
+    """
+    buy_order = family['Buy Order']
+    filled = (buy_order>0) & (price<=buy_order)
+    if not filled.any():
+        return
+
+    num_buys = family['Num Buys'][filled]+1
+    old_buy = buy_order[filled]
+    buy_proportion = family['Buy Proportion'][filled]
+
+    #What is the total amount spent on buy orders thus far (summed in the same order as the scalar loop)
+    total_buy = np.zeros(old_buy.shape)
+    for i in range(max_buys):
+        if zero:
+            term = old_buy/family['Powers'][i][filled]
+        else:
+            term = old_buy*family['Powers'][i][filled]
+        total_buy += np.where(i<num_buys,term,0)
+    average_buy = total_buy/num_buys
+
+    family['Sell Order'][filled] = average_buy*(1+family['Sell Proportion'][filled])
+    #Calculate new buy order price
+    buy_order[filled] = np.where(num_buys<max_buys,old_buy*(1-buy_proportion),0)
+    family['Num Buys'][filled] = num_buys
+
+
+def new_buy_zero_step(price,family,max_buys):
+    """
+    Vectorized new_buy_zero for one price. The algo proportion of the family is the calc proportion.
+    """
+    average_buy_step(price,family,max_buys,True)
+
+    sell_order = family['Sell Order']
+    sold = (sell_order>0) & (price>=sell_order)
+    if sold.any():
+        #Our sell order was successfully placed
+        family['Profit Proportion'][sold] += family['Num Buys'][sold]/max_buys*family['Sell Proportion'][sold]
+        family['Buy Order'][sold] = sell_order[sold]*(1-family['Buy Proportion'][sold])
+        family['Last Sell'][sold] = sell_order[sold]
+        sell_order[sold] = 0
+        family['Num Buys'][sold] = 1 #Assume we don't sell all of stock
+
+    calc_proportion = family['Algo Proportion']
+    one_buy = family['Num Buys']==1
+
+    #If we only have 1 buy and price increases by calc proportion, change buy order
+    raised = one_buy & (calc_proportion>0) & (price>family['Last Sell']*(1+calc_proportion))
+    if raised.any():
+        family['Buy Order'][raised] = price*(1-family['Buy Proportion'][raised])
+        family['Profit Proportion'][raised] += 1/max_buys*calc_proportion[raised]
+        family['Last Sell'][raised] = price
+
+    #For calc proportion equal to zero, re-calculate at the sell proportion
+    raised = one_buy & (calc_proportion==0) & (price>family['Last Sell']*(1+family['Sell Proportion']))
+    if raised.any():
+        family['Buy Order'][raised] = price*(1-family['Buy Proportion'][raised])
+        family['Profit Proportion'][raised] += 1/max_buys*family['Sell Proportion'][raised]
+        family['Last Sell'][raised] = price
+
+
+def new_buy_step(price,family,max_buys):
+    """
+    Vectorized new_buy_algo for one price. The algo proportion of the family is the new buy proportion.
+    """
+    average_buy_step(price,family,max_buys,False)
+
+    sell_order = family['Sell Order']
+    sold = (sell_order>0) & (price>=sell_order)
+    if sold.any():
+        #Our sell order was successfully placed
+        family['Profit Proportion'][sold] += family['Num Buys'][sold]/max_buys*family['Sell Proportion'][sold]
+        family['Buy Order'][sold] = sell_order[sold]*(1-family['Algo Proportion'][sold])
+        sell_order[sold] = 0
+        family['Num Buys'][sold] = 0
+
+
+def max_price_step(price,family,max_buys,calc_proportion):
+    """
+    Vectorized max_price_algo for one price. The algo proportion of the family is the new buy proportion.
+    """
+    new_buy_step(price,family,max_buys)
+
+    #If we haven't bought any stock yet and the price increases above calc_proportion, re-caculate buy order
+    new_buy = price*(1-family['Algo Proportion'])
+    raised = (family['Num Buys']==0) & (new_buy>family['Buy Order']*(1+calc_proportion))
+    if raised.any():
+        family['Buy Order'][raised] = new_buy[raised]
+
+
+def step_grid(grid,prices):
+    """
+    Step every grid point over a sequence of prices
+    grid - grid dictionary from init_grid (updated in place)
+    prices - sequence of prices (list or numpy array) that follow the prices already stepped
+    """
+    max_buys = grid['Max Buys']
+    zero = grid['New Buy Zero']
+    new = grid['New Buy']
+    max_price = grid['Max Price']
+    run_zero = zero['Num Buys'].size>0
+    run_new = new['Num Buys'].size>0
+    run_max = max_price['Num Buys'].size>0
+
+    for price in prices:
+        price = float(price)
+        if run_zero:
+            new_buy_zero_step(price,zero,max_buys)
+        if run_new:
+            new_buy_step(price,new,max_buys)
+        if run_max:
+            max_price_step(price,max_price,max_buys,grid['Calc Proportion'])
+        grid['Last Price'] = price
+
+
+def grid_profits(grid):
+    """
+    Get the profit proportion cube of the grid. The new_buy_zero profits are marked to the last price stepped.
+    grid - grid dictionary from init_grid (not modified)
+
+    Returns a numpy array of shape (len(sell_proportions),len(buy_proportions),total algorithms)
+    """
+    max_buys = grid['Max Buys']
+    last_price = grid['Last Price']
+    zero = grid['New Buy Zero']
+
+    #For new_buy_zero calcs, set profit based on ending price.
+    zero_profit = zero['Profit Proportion'] - (1/max_buys)*(zero['Last Sell']-last_price)/zero['Last Sell']
+
+    return np.concatenate((zero_profit,grid['New Buy']['Profit Proportion'],grid['Max Price']['Profit Proportion']),axis=2)
+
+
+def empty_profits(sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys):
+    """
+    Profit proportion cube of a price history with no prices (no trades, so zero profit everywhere)
+    """
+    return np.zeros((len(sell_proportions),len(buy_proportions),len(new_buy_zero_calc)+len(new_buy_proportions)+len(max_price_new_buys)))
+
+
+def run_grid(prices,sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys,calc_proportion,max_buys):
+    """
+    Estimates profit for every combination of sell proportion, buy proportion and algorithm on one price history
+    prices - minute level price history of a ticker
+    sell_proportions - list of sell proportions to test (axis 0)
+    buy_proportions - list of buy proportions to test (axis 1)
+    new_buy_zero_calc - list of calc proportions to test with the new_buy_zero algorithm
+    new_buy_proportions - list of new buy proportions to test with the new_buy_algo algorithm
+    max_price_new_buys - list of new buy proportions to test with the max_price_algo algorithm
+    calc_proportion - calc proportion used by the max_price_algo algorithm
+    max_buys - the number of times we are allowed to buy the same stock
+
+    Returns the profit proportion cube (sell x buy x algorithm)
+    """
+    if len(prices)==0:
+        return empty_profits(sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys)
+    grid = init_grid(prices[0],sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys,calc_proportion,max_buys)
+    step_grid(grid,prices)
+    return grid_profits(grid)
+
+
+def run_grid_chunks(chunks,sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys,calc_proportion,max_buys):
+    """
+    Same as run_grid, but the price history arrives as chunks (Ex: Price_History_Store.iter_price_chunks)
+    chunks - iterable of price arrays in time order. Only one chunk is used at a time.
+
+    Returns the profit proportion cube (sell x buy x algorithm)
+    """
+    grid = None
+    for chunk in chunks:
+        if len(chunk)==0:
+            continue
+        if grid is None:
+            #The first price of the first chunk starts every grid point
+            grid = init_grid(chunk[0],sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys,calc_proportion,max_buys)
+        step_grid(grid,chunk)
+    if grid is None:
+        return empty_profits(sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys)
+    return grid_profits(grid)
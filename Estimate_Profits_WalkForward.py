@@ -0,0 +1,136 @@
+# Walk forward optimization for the algorithms in Estimate_Profits_MaxPrice_KeepSome_Optimal.py
+# Instead of picking parameters on the whole April 3 - May 15 window (in sample), it repeats these steps:
+#   1. Pick the best grid config on a rolling training window
+#   2. Record the profit that config makes on the next test window (out of sample)
+#   3. Roll both windows forward by the test window length
+
+# Every config runs once over the whole price history in the vectorized grid. Only checkpoints of the grid profits
+# are stored at each window boundary. The profit on a window is the difference between the checkpoints at its ends,
+# so each step only runs the new test window prices instead of restarting the simulation from the first price.
+# The checkpoints value the stock still owned at the boundary price (marked_profits), so stock bought in one window
+# and sold in the next counts its gain or loss up to the boundary in the first window and the rest in the second.
+# A config's orders at the start of a window carry over from the earlier prices, the same as the live bot which never restarts.
+
+from collections import deque
+import numpy as np
+from Estimate_Profits_Vectorized import init_grid,step_grid,grid_profits
+
+
+def grid_algorithms(grid):
+    """
+    Names of the algorithms on axis 2 of the profit cube
+    grid - grid dictionary from init_grid
+
+    Returns a list of (algorithm name, algorithm proportion)
+    """
+    algorithms = []
+    for (name,algo_proportions,sign) in grid['Families']:
+        for algo_proportion in algo_proportions:
+            algorithms.append((name,algo_proportion))
+    return algorithms
+
+
+def marked_profits(grid):
+    """
+    Profit proportion cube of the grid with the stock we still own valued at the last price stepped
+    grid_profits already does this for new_buy_zero (it keeps stock after each sale). For new_buy_algo and max_price_algo
+    each open buy is 1/max_buys of the balance bought at the average buy price (sell order/(1+sell proportion)).
+    grid - grid dictionary from init_grid (not modified)
+
+    Returns a numpy array of shape (len(sell_proportions),len(buy_proportions),total algorithms)
+    """
+    max_buys = grid['Max Buys']
+    last_price = grid['Last Price']
+    open_profits = [np.zeros(grid['New Buy Zero']['Num Buys'].shape)]
+    for name in ('New Buy','Max Price'):
+        family = grid[name]
+        owned = (family['Num Buys']>0) & (family['Sell Order']>0)
+        average_buy = np.where(owned,family['Sell Order'],1)/(1+family['Sell Proportion'])
+        open_profits.append(np.where(owned,family['Num Buys']/max_buys*(last_price-average_buy)/average_buy,0))
+    return grid_profits(grid)+np.concatenate(open_profits,axis=2)
+
+
+def walk_forward(prices,train_bars,test_bars,sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys,calc_proportion,max_buys):
+    """
+    Walk forward optimization over one price history
+    prices - minute level price history of a ticker
+    train_bars - number of prices in each training window (must be a multiple of test_bars)
+    test_bars - number of prices in each test window (also how far the windows roll forward each step)
+    sell_proportions, buy_proportions, new_buy_zero_calc, new_buy_proportions, max_price_new_buys, calc_proportion, max_buys - grid to test (see run_grid)
+
+    Returns a list with a dictionary for each step
+        Train Start, Test Start, Test End - price indexes of the windows
+        Sell Proportion, Buy Proportion, Algorithm, Algorithm Proportion - the config picked on the training window
+        Train Profit - profit proportion of the picked config on the training window
+        Test Profit - profit proportion of the picked config on the test window
+    """
+    if train_bars%test_bars!=0:
+        raise ValueError('train_bars must be a multiple of test_bars')
+
+    grid = init_grid(prices[0],sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys,calc_proportion,max_buys)
+    algorithms = grid_algorithms(grid)
+
+    #Only keep the checkpoints needed for the current training window
+    windows_per_train = train_bars//test_bars
+    checkpoints = deque([marked_profits(grid)],maxlen=windows_per_train+1)
+
+    steps = []
+    pending = None
+    for start in range(0,len(prices)-test_bars+1,test_bars):
+        step_grid(grid,prices[start:start+test_bars])
+        profits = marked_profits(grid)
+
+        #Score the config picked on the last training window on the window we just ran
+        if pending is not None:
+            pending['Test Profit'] = float(profits[pending['Cell']]-checkpoints[-1][pending['Cell']])
+            del pending['Cell']
+            steps.append(pending)
+            pending = None
+
+        checkpoints.append(profits)
+
+        #Pick the best config on the training window that ends here
+        if len(checkpoints)==windows_per_train+1 and start+2*test_bars<=len(prices):
+            train_profits = checkpoints[-1]-checkpoints[0]
+            cell = np.unravel_index(np.argmax(train_profits),train_profits.shape)
+            (algorithm,algo_proportion) = algorithms[cell[2]]
+            pending = {'Train Start':start+test_bars-train_bars,
+                       'Test Start':start+test_bars,
+                       'Test End':start+2*test_bars,
+                       'Sell Proportion':sell_proportions[cell[0]],
+                       'Buy Proportion':buy_proportions[cell[1]],
+                       'Algorithm':algorithm,
+                       'Algorithm Proportion':algo_proportion,
+                       'Train Profit':float(train_profits[cell]),
+                       'Cell':cell}
+
+    return steps
+
+
+if __name__=="__main__":
+    from Price_History_Store import load_price_history
+
+    price_history = load_price_history("Price_History_April3_May15")
+    test_tickers = ['ASTC']
+    max_buys = 3
+
+    #Same grid as Estimate_Profits_MaxPrice_KeepSome_Optimal.py
+    sell_proportions = [y*0.5/100+1/100 for y in range(20)]
+    buy_proportions = [x*0.1/100+0.5/100 for x in range(200)]
+    new_buy_zero_calc = [0,0.02,0.05,0.1,0.2,0.3,0.5,1]
+    new_buy_proportions = [0]
+    max_price_new_buys = [0]
+    calc_proportion = 0.01
+
+    #Train on about two weeks of minute prices (extended hours) and test on the next week
+    test_bars = 5*780
+    train_bars = 2*test_bars
+
+    for ticker in test_tickers:
+        steps = walk_forward(price_history[ticker],train_bars,test_bars,sell_proportions,buy_proportions,new_buy_zero_calc,
+                             new_buy_proportions,max_price_new_buys,calc_proportion,max_buys)
+        print('-------------------------------------------------------------')
+        for step in steps:
+            print('{} {} ({}) sell {}% buy {}%: train profit {}%, test profit {}%'.format(ticker,step['Algorithm'],step['Algorithm Proportion'],
+                  round(step['Sell Proportion']*100,2),round(step['Buy Proportion']*100,2),round(step['Train Profit']*100,2),round(step['Test Profit']*100,2)))
+        print('{} total out of sample profit percent {}'.format(ticker,sum(step['Test Profit'] for step in steps)*100))
@@ -1,21 +1,170 @@
+# Renders the sweep result files from Sweep_Result_Cube.py to image files (no plot windows).
+# Each ticker gets a heatmap of the best profit over the last two axes of the cube, a small heatmap for each value of the
+# first axis (3-D cubes), and a 3-D surface of the best profit. Tickers are rendered in parallel worker processes.
+# Large cubes are decimated before plotting. Each plotted cell is the best profit of the block of configs it covers,
+# so decimating never hides a profitable region.
 
-import pickle
-from mpl_toolkits import mplot3d
+# Example: python Graph_Estimated_Profits.py Sweep_VaryAll3_April3_May15_3.npz Profit_Graphs
+
+import os, sys, math
+import multiprocessing
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+from Sweep_Result_Cube import load_result_cube
+
+
+def decimate(cube,axes,max_points=100):
+    """
+    Shrinks a cube so no axis has more than max_points values
+    cube - numpy array of results (one axis for each entry in axes)
+    axes - list of (axis name, axis values)
+    max_points - max number of values to keep on each axis
+
+    Returns the decimated cube and axes (each value is the max of its block, labeled with the first axis value of the block)
+    """
+    for a,(name,axis_values) in enumerate(axes):
+        if len(axis_values)>max_points:
+            step = math.ceil(len(axis_values)/max_points)
+            starts = np.arange(0,len(axis_values),step)
+            cube = np.maximum.reduceat(cube,starts,axis=a)
+            axes = axes[:a]+[(name,np.asarray(axis_values)[starts])]+axes[a+1:]
+    return (cube,axes)
+
+
+def value_label(value):
+    """
+    Short label for an axis value (floats are rounded)
+    """
+    return str(round(value,4)) if isinstance(value,float) else str(value)
+
+
+def axis_labels(axis_values,count=6):
+    """
+    Tick positions and labels for an axis of a heatmap
+    """
+    positions = np.unique(np.linspace(0,len(axis_values)-1,min(count,len(axis_values))).astype(int))
+    labels = [value_label(value) for value in np.asarray(axis_values)[positions].tolist()]
+    return (positions,labels)
+
+
+def draw_heatmap(ax,plane,row_axis,column_axis):
+    """
+    Draws a 2-D slice of the cube (rows on the y axis, columns on the x axis)
+    """
+    image = ax.imshow(plane,origin='lower',aspect='auto',cmap='viridis')
+    (positions,labels) = axis_labels(column_axis[1])
+    ax.set_xticks(positions)
+    ax.set_xticklabels(labels,fontsize=7)
+    (positions,labels) = axis_labels(row_axis[1])
+    ax.set_yticks(positions)
+    ax.set_yticklabels(labels,fontsize=7)
+    ax.set_xlabel(column_axis[0])
+    ax.set_ylabel(row_axis[0])
+    return image
+
+
+def render_ticker(job):
+    """
+    Renders the graphs of one ticker (run in a worker process)
+    job - (ticker, cube of the ticker, axes, metric name, output folder, max points per axis)
+
+    Returns a list of the image files written
+    """
+    (ticker,cube,axes,metric,output_dir,max_points) = job
+    (cube,axes) = decimate(cube,axes,max_points)
+    files = []
+
+    if cube.ndim==1:
+        fig = plt.figure()
+        plt.plot(axes[0][1],cube)
+        plt.xlabel(axes[0][0])
+        plt.ylabel(metric)
+        plt.title(ticker)
+        files.append(os.path.join(output_dir,'{}_line.png'.format(ticker)))
+        fig.savefig(files[-1],dpi=100)
+        plt.close(fig)
+        return files
+
+    #Best result over the leading axes for each cell of the last two axes
+    plane = cube.reshape((-1,)+cube.shape[-2:]).max(axis=0)
+    (row_axis,column_axis) = (axes[-2],axes[-1])
+
+    fig = plt.figure(figsize=(8,6))
+    ax = fig.add_subplot(1,1,1)
+    fig.colorbar(draw_heatmap(ax,plane,row_axis,column_axis),ax=ax,label=metric)
+    best = np.unravel_index(np.argmax(cube),cube.shape)
+    best_params = ', '.join('{} {}'.format(name,value_label(np.asarray(axis_values)[best[a]].item())) for a,(name,axis_values) in enumerate(axes))
+    ax.set_title('{} best {} {}\n{}'.format(ticker,metric,round(float(cube[best]),2),best_params),fontsize=9)
+    files.append(os.path.join(output_dir,'{}_heatmap.png'.format(ticker)))
+    fig.savefig(files[-1],dpi=100)
+    plt.close(fig)
+
+    #Small heatmap for each value of the first axis (Ex: one for each sell percent)
+    if cube.ndim==3:
+        count = cube.shape[0]
+        columns = math.ceil(math.sqrt(count))
+        rows = math.ceil(count/columns)
+        fig,grid = plt.subplots(rows,columns,figsize=(3*columns,2.5*rows),squeeze=False)
+        (low,high) = (cube.min(),cube.max())
+        for i in range(rows*columns):
+            ax = grid[i//columns][i%columns]
+            if i>=count:
+                ax.axis('off')
+                continue
+            ax.imshow(cube[i],origin='lower',aspect='auto',cmap='viridis',vmin=low,vmax=high)
+            ax.set_title('{} {}'.format(axes[0][0],value_label(np.asarray(axes[0][1])[i].item())),fontsize=7)
+            ax.set_xticks([])
+            ax.set_yticks([])
+        fig.suptitle('{} {} ({} vs {})'.format(ticker,metric,row_axis[0],column_axis[0]))
+        files.append(os.path.join(output_dir,'{}_slices.png'.format(ticker)))
+        fig.savefig(files[-1],dpi=80)
+        plt.close(fig)
+
+    #3-D surface of the best result (only numeric axes can be used as coordinates)
+    if np.asarray(row_axis[1]).dtype.kind in 'iuf' and np.asarray(column_axis[1]).dtype.kind in 'iuf':
+        (x,y) = np.meshgrid(column_axis[1],row_axis[1])
+        fig = plt.figure(figsize=(8,6))
+        ax = fig.add_subplot(1,1,1,projection='3d')
+        ax.plot_surface(x,y,plane,cmap='viridis')
+        ax.set_xlabel(column_axis[0])
+        ax.set_ylabel(row_axis[0])
+        ax.set_zlabel(metric)
+        ax.set_title(ticker)
+        files.append(os.path.join(output_dir,'{}_surface.png'.format(ticker)))
+        fig.savefig(files[-1],dpi=100)
+        plt.close(fig)
+
+    return files
+
+
+def render_result_file(file_name,output_dir,metric='Profit Percent',max_points=100,processes=None):
+    """
+    Renders every ticker of a result file to images
+    file_name - result file saved by Sweep_Result_Cube.save_result_cube
+    output_dir - folder to write the images to
+    metric - metric of the result file to graph
+    max_points - max number of values to plot on each axis
+    processes - number of worker processes (default is the number of cores)
+
+    Returns a list of the image files written
+    """
+    result = load_result_cube(file_name)
+    os.makedirs(output_dir,exist_ok=True)
+    axes = [(name,axis_values) for (name,axis_values) in result['Axes']]
+    jobs = [(ticker,result['Metrics'][metric][t],axes,metric,output_dir,max_points) for t,ticker in enumerate(result['Tickers'])]
 
-profit_ticker_percent = pickle.load(open("PofitbyPercent_SellNewBuy_April3_May15_3_SGBX.p","rb"))
-sell_percent = pickle.load(open("SellPercent_SGBX.p","rb"))
-new_buy_percent = pickle.load(open("NewBuyPercent_SGBX_Sell.p","rb"))
+    files = []
+    with multiprocessing.Pool(processes) as pool:
+        for ticker_files in pool.imap_unordered(render_ticker,jobs):
+            files += ticker_files
+    return files
 
-for ticker in profit_ticker_percent:
-    fig = plt.figure()
-    ax = plt.axes(projection='3d')
 
-    #Plot the data
-    ax.plot3D(sell_percent,new_buy_percent,profit_ticker_percent[ticker],'gray')
+if __name__=="__main__":
+    file_name = sys.argv[1] if len(sys.argv)>1 else 'Sweep_SellNewBuy_April3_May15_3.npz'
+    output_dir = sys.argv[2] if len(sys.argv)>2 else 'Profit_Graphs'
 
-    print(ticker)
-    plt.show()
-    
-    
+    files = render_result_file(file_name,output_dir)
+    print('Wrote {} graphs to {}'.format(len(files),output_dir))
@@ -1,5 +1,6 @@
 import math,pickle
 from TDAmeritrade_API import get_access,get_account
+from TDAmeritrade_state import TickerState
 
 #Initialize dictionary
 def initialize_transactions():
@@ -28,7 +29,7 @@ def initialize_transactions():
     tickers_list = ['NAIL','SVC','MTDR','HXL','BIMI','SGBX','NOVN','MIST','ASTC','CREX']
     transactions['Tickers']=tickers_list
     for ticker in tickers_list:
-        transactions[ticker]={}
+        transactions[ticker]=TickerState()
     
     #Make the base balance for each stock to use 1000
     for ticker in tickers_list:
@@ -102,6 +103,8 @@ def initialize_transactions():
         transactions[ticker]['Limit Buy Price']=0  #The buy price of the most recent limit buy order
         transactions[ticker]['Limit Sell ID']=0    #Order ID
         transactions[ticker]['Limit Sell Price']=0 #The sell price of the most recent limit sell order
+        transactions[ticker]['Limit Buy Entered']=''    #Date the limit buy order was placed (track_fills gets the filled orders since then)
+        transactions[ticker]['Limit Sell Entered']=''   #Date the limit sell order was placed
 
         #Max numer of digits we can use when placing orders (>$1 stocks = 2 digits, <$1 stocks = 4 digits)
         if ticker=='NOVN':
@@ -109,7 +112,8 @@ def initialize_transactions():
         else:
             transactions[ticker]['Max Digits']=2       
 
-    pickle.dump(transactions,open("Transactions.p","wb"))
+    with open("Transactions.p","wb") as transactions_file:
+        pickle.dump(transactions,transactions_file)
 
 
 def add_stock_transactions(ticker,price,balance,buy_proportion,sell_proportion,new_buy_proportion,max_digits):
@@ -124,10 +128,11 @@ def add_stock_transactions(ticker,price,balance,buy_proportion,sell_proportion,n
     max_digits - the max number of digits allowed when placing orders (2 for stocks >$1 and 4 for stocks <$1)
     """
 
-    transactions = pickle.load(open("Transactions.p","rb"))
+    with open("Transactions.p","rb") as transactions_file:
+        transactions = pickle.load(transactions_file)
 
     transactions['Tickers'].append(ticker)
-    transactions[ticker]={}
+    transactions[ticker]=TickerState()
 
     transactions[ticker]['First Buy']=price
     transactions[ticker]['Available Balance']=balance
@@ -146,6 +151,8 @@ def add_stock_transactions(ticker,price,balance,buy_proportion,sell_proportion,n
     transactions[ticker]['Limit Buy Price']=0  #The buy price of the most recent limit buy order
     transactions[ticker]['Limit Sell ID']=0    #Order ID
     transactions[ticker]['Limit Sell Price']=0 #The sell price of the most recent limit sell order
+    transactions[ticker]['Limit Buy Entered']=''    #Date the limit buy order was placed (track_fills gets the filled orders since then)
+    transactions[ticker]['Limit Sell Entered']=''   #Date the limit sell order was placed
     transactions[ticker]['Previous Buy']=0  #Last purchase price of stock
     transactions[ticker]['Previous Sell']=0 #Last sale price of stock
     transactions[ticker]['Average Buy']=0   #Average purchase cost of stock
@@ -155,7 +162,8 @@ def add_stock_transactions(ticker,price,balance,buy_proportion,sell_proportion,n
     transactions[ticker]['Max Digits']=max_digits
 
     #Save Updates
-    pickle.dump(transactions,open("Transactions.p","wb"))
+    with open("Transactions.p","wb") as transactions_file:
+        pickle.dump(transactions,transactions_file)
 
 
 def recover_transactions(transactions):
@@ -173,8 +181,10 @@ def recover_transactions(transactions):
     for ticker in transactions['Tickers']:
         transactions[ticker]['Limit Buy ID'] = 0
         transactions[ticker]['Limit Buy Price'] = 0
+        transactions[ticker]['Limit Buy Entered'] = ''
         transactions[ticker]['Limit Sell ID'] = 0
         transactions[ticker]['Limit Sell Price'] = 0
+        transactions[ticker]['Limit Sell Entered'] = ''
 
     #Update limit buy and sell orders using currently queued orders
     for order in orders:
@@ -188,11 +198,14 @@ def recover_transactions(transactions):
 
                     transactions[ticker]['Limit Buy ID'] = order['orderId']
                     transactions[ticker]['Limit Buy Price'] = order['price']
+                    #Entered time is in UTC (Ex: 2021-03-01T15:30:00+0000), track_fills only needs the date
+                    transactions[ticker]['Limit Buy Entered'] = order.get('enteredTime','')[:10]
 
                 elif order['orderLegCollection'][0]['instruction']=='SELL':
 
                     transactions[ticker]['Limit Sell ID'] = order['orderId']
                     transactions[ticker]['Limit Sell Price'] = order['price']
+                    transactions[ticker]['Limit Sell Entered'] = order.get('enteredTime','')[:10]
 
 
     #Update stock owned and after buy price
@@ -1,15 +1,18 @@
 from Bot_Threading import run_bot
 from InitializeTransactionsDictionary import initialize_transactions,recover_transactions
+from TDAmeritrade_journal import journal
 import pickle, json, datetime, time
 
 initialize = 0
 recover=0
+streaming=0     #Stream quotes from the websocket instead of polling get_multi_quotes
+concurrent=0    #Run the orders of every ticker at the same time (polling only)
 
 if initialize:
     initialize_transactions()
 
-#Load transactions dictionary
-transactions = pickle.load(open("Transactions.p","rb"))
+#Load transactions dictionary (the journal replays the orders and fills made after the last snapshot)
+transactions = journal.open("Transactions.p","Transactions.journal")
 
 #Recover old info
 if recover:
@@ -22,6 +25,6 @@ while len(errors)==0:
     #Reset API errors list
     transactions['API Errors']=[]
 
-    errors = run_bot(transactions)
+    errors = run_bot(transactions,streaming==1,concurrent==1)
 
     
\ No newline at end of file
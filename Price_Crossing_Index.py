@@ -0,0 +1,139 @@
+# Precomputed range min/max tables (sparse tables) for a price history.
+# Answers "first index at or after i where price <= x" and "first index at or after i where price >= y" in O(log n).
+
+# The Estimate_Profits_* simulators only change state when the price crosses the next buy price or the next sell price.
+# Instead of walking every minute bar, they can jump straight from one fill to the next with these queries.
+
+def build_crossing_index(prices):
+    """
+    Builds the sparse tables of range min and range max prices
+    prices - minute level price history of a ticker (list or numpy array)
+
+    Returns a dictionary with the prices and the tables
+        Prices - the price history as a list of floats
+        Min - Min[k][i] is the min price of prices[i:i+2**k]
+        Max - Max[k][i] is the max price of prices[i:i+2**k]
+    """
+    if hasattr(prices,'tolist'):
+        prices = prices.tolist()
+    else:
+        prices = list(prices)
+
+    table_min = [prices]
+    table_max = [prices]
+    k = 1
+    while (1<<k) <= len(prices):
+        half = 1<<(k-1)
+        prev_min = table_min[k-1]
+        prev_max = table_max[k-1]
+        length = len(prices)-(1<<k)+1
+        #Each block of 2**k prices is made up of two blocks of 2**(k-1) prices
+        table_min.append([min(prev_min[i],prev_min[i+half]) for i in range(length)])
+        table_max.append([max(prev_max[i],prev_max[i+half]) for i in range(length)])
+        k+=1
+
+    return {'Prices':prices,'Min':table_min,'Max':table_max}
+
+
+def first_price_at_or_below(crossing_index,start,limit):
+    """
+    Finds the first index at or after start where the price is less than or equal to limit
+    crossing_index - tables from build_crossing_index
+    start - the index to start searching from
+    limit - the buy price we are waiting for the price to dip to
+
+    Returns the index (len(prices) if the price never dips to limit)
+    """
+    table_min = crossing_index['Min']
+    length = len(crossing_index['Prices'])
+    index = start
+    #Skip the largest blocks of prices that are all above the limit
+    for k in range(len(table_min)-1,-1,-1):
+        if index+(1<<k) <= length and table_min[k][index] > limit:
+            index += 1<<k
+    return index
+
+
+def first_price_at_or_above(crossing_index,start,limit):
+    """
+    Finds the first index at or after start where the price is greater than or equal to limit
+    crossing_index - tables from build_crossing_index
+    start - the index to start searching from
+    limit - the sell price we are waiting for the price to rise to
+
+    Returns the index (len(prices) if the price never rises to limit)
+    """
+    table_max = crossing_index['Max']
+    length = len(crossing_index['Prices'])
+    index = start
+    #Skip the largest blocks of prices that are all below the limit
+    for k in range(len(table_max)-1,-1,-1):
+        if index+(1<<k) <= length and table_max[k][index] < limit:
+            index += 1<<k
+    return index
+
+
+def simulate_buy_sell_percent(crossing_index,buy_proportion,sell_proportion,new_buy_proportion,buys_allowed):
+    """
+    Estimates profit for the algorithm in Estimate_Profits_BuySellPercent.py, BuyNewBuyPercent.py and VaryAll3.py.
+    Gives the same results as looping through every price, but only visits the prices where an order is filled.
+
+    crossing_index - tables from build_crossing_index for the ticker's price history
+    buy_proportion - buy again if the price falls this proportion below the previous buy price
+    sell_proportion - sell all of our stock if the price rises this proportion above the average buy price
+    new_buy_proportion - after selling, buy again at this proportion below the sell price
+    buys_allowed - the number of times we allow the bot to re-buy the same stock without any sells
+
+    Returns the profit proportion and the number of times we sold stock
+    """
+    prices = crossing_index['Prices']
+    length = len(prices)
+    index = 0
+
+    #Previous buy - the first time we buy the stock
+    previous_buy = prices[index]
+    #average buy - the average limit order buy price
+    average_buy = previous_buy
+    #num buys - the total number of buys we have without any sells
+    num_buys = 1
+    profit_proportion = 0
+    count_sold = 0
+
+    while index < length:
+
+        #Jump to the next price that fills a buy or a sell
+        buy_price = previous_buy*(1-buy_proportion)
+        if num_buys<buys_allowed:
+            next_buy = first_price_at_or_below(crossing_index,index,buy_price)
+        else:
+            next_buy = length
+        next_sell = first_price_at_or_above(crossing_index,index,average_buy*(1+sell_proportion))
+        index = min(next_buy,next_sell)
+        if index >= length:
+            break
+
+        price = prices[index]
+
+        #If price falls below buy percent of the previous buy price and we haven't reached our buys allowed limit, make another buy
+        if price <= buy_price and num_buys<buys_allowed:
+            previous_buy = price
+            average_buy = (num_buys*average_buy + previous_buy)/(num_buys+1)
+            num_buys+=1
+
+        #If price jumps up to sell percent above the average buy price, sell all of our stock
+        if price >= average_buy*(1+sell_proportion):
+
+            profit_proportion += sell_proportion*num_buys
+
+            #Set a new buy limit order
+            count_sold += num_buys
+            num_buys = 1
+            previous_buy = average_buy*(1+sell_proportion)*(1-new_buy_proportion)
+            average_buy = previous_buy
+
+            #Skip to the price that falls to the new buy price
+            index = first_price_at_or_below(crossing_index,index,previous_buy)
+        else:
+            index+=1
+
+    return (profit_proportion,count_sold)
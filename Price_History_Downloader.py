@@ -0,0 +1,189 @@
+# Downloads minute price history for many tickers into the price store (Price_History_Store.py / Price_Pyramid.py).
+# TD Ameritrade only returns minute candles for about 10 days per request, so the date range of each ticker is split
+# into windows. The windows of every ticker are fetched concurrently by a thread pool. All threads share the process
+# wide rate limiter (TDAmeritrade_rate_limit.py, price history is its lowest priority lane so a running bot goes first),
+# failed windows are retried with backoff (only here, the TDClient retries are turned off for these requests), and each ticker is written to the store as soon as all of its windows are in.
+
+# To test without the live site, point TDAmeritrade_API.api_url at a local server (see check_download for a stub server).
+
+import time, threading, datetime, json, random
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from urllib.parse import urlparse,parse_qs
+import numpy as np
+import TDAmeritrade_API
+from TDAmeritrade_API import client,get_access,get_price_history_dates
+from TDAmeritrade_rate_limit import limiter
+from Price_Pyramid import candles_to_columns,write_pyramid,write_resolution
+
+
+def date_windows(start_date,end_date,window_days=10):
+    """
+    Splits a date range into request windows
+    start_date, end_date - range to download in milliseconds since epoch
+    window_days - max number of days in each request
+
+    Returns a list of (start,end) in milliseconds since epoch
+    """
+    step = window_days*24*60*60*1000
+    return [(start,min(start+step-1,end_date)) for start in range(start_date,end_date+1,step)]
+
+
+def fetch_window(access,access_lock,ticker,start,end,frequency,retries=4,backoff=1.0):
+    """
+    Downloads the minute candles of one window, retrying failed requests (the only retries of the window's requests)
+    access - dictionary with the shared 'Access Token' and 'Access Expire Time'
+    access_lock - lock for the access dictionary
+    ticker - the stock ticker symbol
+    start, end - window in milliseconds since epoch
+    frequency - minutes in each candle (1, 5, 10, 15 or 30)
+    retries - number of times to retry a failed request
+    backoff - seconds to wait before the first retry (doubles after each failure)
+
+    Returns the list of candles
+    """
+    for attempt in range(retries+1):
+        try:
+            with access_lock:
+                (access['Access Token'],access['Access Expire Time']) = get_access(access['Access Token'],access['Access Expire Time'])
+                access_token = access['Access Token']
+
+            with client.retry_limit(0):
+                price_history = get_price_history_dates(access_token,ticker,start,end,'minute',frequency)
+            if 'candles' not in price_history:
+                raise ValueError('No candles for {}: {}'.format(ticker,price_history))
+            return price_history['candles']
+        except Exception:
+            if attempt==retries:
+                raise
+            #Wait longer after each failure (jitter keeps the threads from retrying at the same time)
+            time.sleep(backoff*2**attempt*(1+random.random()/2))
+
+
+def write_candles(store_dir,ticker,candles,frequency):
+    """
+    Writes the candles of a ticker to the store (sorted by time with duplicate times removed)
+    1 minute candles are written with the coarser resolutions built from them (Price_Pyramid.write_pyramid).
+    """
+    columns = candles_to_columns(candles)
+    (times,first) = np.unique(columns['time'],return_index=True)
+    if frequency==1:
+        write_pyramid(store_dir,ticker,columns['open'][first],columns['high'][first],columns['low'][first],times)
+    else:
+        write_resolution(store_dir,ticker,frequency,columns['open'][first],columns['high'][first],columns['low'][first],times)
+
+
+def download_price_history(tickers,start_date,end_date,store_dir,frequency=1,workers=8,window_days=10,access=None):
+    """
+    Downloads the price history of many tickers into a price store
+    tickers - list of stock ticker symbols
+    start_date, end_date - range to download in milliseconds since epoch
+    store_dir - folder of the price store
+    frequency - minutes in each candle (1, 5, 10, 15 or 30)
+    workers - number of download threads
+    window_days - max number of days in each request
+    access - dictionary with 'Access Token' and 'Access Expire Time' (a new token is requested if None)
+
+    Returns a dictionary of ticker to number of candles stored, and a dictionary of ticker to the error of failed tickers
+    """
+    if access is None:
+        access = {'Access Token':'','Access Expire Time':0}
+    access_lock = threading.Lock()
+    windows = date_windows(start_date,end_date,window_days)
+
+    candles = {ticker:[] for ticker in tickers}
+    remaining = {ticker:len(windows) for ticker in tickers}
+    stored = {}
+    failed = {}
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        futures = {executor.submit(fetch_window,access,access_lock,ticker,start,end,frequency):ticker
+                   for ticker in tickers for (start,end) in windows}
+
+        for future in concurrent.futures.as_completed(futures):
+            ticker = futures[future]
+            try:
+                candles[ticker] += future.result()
+            except Exception as error:
+                failed[ticker] = str(error)
+            remaining[ticker] -= 1
+
+            #Write the ticker as soon as all of its windows are in (a ticker with a failed window is not written)
+            if remaining[ticker]==0:
+                if ticker not in failed and len(candles[ticker])>0:
+                    write_candles(store_dir,ticker,candles[ticker],frequency)
+                    stored[ticker] = len(candles[ticker])
+                candles[ticker] = None
+
+    return (stored,failed)
+
+
+class StubPriceHistoryHandler(BaseHTTPRequestHandler):
+    """
+    Local stand in for the TD Ameritrade token and price history endpoints (random candles, fails some requests)
+    """
+    fail_rate = 0.1
+
+    def do_POST(self):
+        self.send_json(200,{'access_token':'stub','expires_in':1800})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if random.random() < self.fail_rate:
+            self.send_json(429,{'error':'Too many requests'})
+            return
+        ticker = url.path.split('/')[-2]
+        frequency = int(params['frequency'][0])
+        times = range(int(params['startDate'][0]),int(params['endDate'][0])+1,frequency*60000)
+        generator = random.Random(ticker)
+        candles = []
+        for candle_time in times:
+            price = 3+generator.random()
+            candles.append({'open':price,'high':price*1.01,'low':price*0.99,'close':price,'volume':100,'datetime':candle_time})
+        self.send_json(200,{'candles':candles,'symbol':ticker,'empty':len(candles)==0})
+
+    def send_json(self,status,content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type','application/json')
+        self.send_header('Content-Length',str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self,format,*args):
+        pass
+
+
+def check_download(store_dir='Stub_Price_Store',tickers=('AAA','BBB','CCC'),days=30):
+    """
+    Downloads from a local stub server to check the downloader without the live site (the rate limit is raised while it runs)
+
+    Returns the stored and failed dictionaries from download_price_history
+    """
+    server = ThreadingHTTPServer(('127.0.0.1',0),StubPriceHistoryHandler)
+    threading.Thread(target=server.serve_forever,daemon=True).start()
+    live_url = TDAmeritrade_API.api_url
+    TDAmeritrade_API.api_url = 'http://127.0.0.1:{}/v1'.format(server.server_address[1])
+    (live_rate,live_capacity) = (limiter.rate,limiter.capacity)
+    limiter.configure(rate=50,capacity=50)
+    try:
+        end_date = int(datetime.datetime(2020,5,15).timestamp()*1000)
+        start_date = end_date-days*24*60*60*1000
+        return download_price_history(list(tickers),start_date,end_date,store_dir,frequency=5)
+    finally:
+        limiter.configure(rate=live_rate,capacity=live_capacity)
+        TDAmeritrade_API.api_url = live_url
+        server.shutdown()
+
+
+if __name__=="__main__":
+    #Refresh the minute price history of the bot's tickers
+    tickers = ['NAIL','SVC','MTDR','HXL','BIMI','SGBX','NOVN','MIST','ASTC','CREX']
+    end_date = int(time.time()*1000)
+    start_date = end_date-60*24*60*60*1000
+
+    (stored,failed) = download_price_history(tickers,start_date,end_date,"Price_History_Latest")
+    print('Stored {} tickers'.format(len(stored)))
+    for ticker,error in failed.items():
+        print('Could not download {}: {}'.format(ticker,error))
@@ -0,0 +1,184 @@
+# Columnar on disk store for price history (replaces the Price_History_*.p pickles).
+# Each ticker gets one contiguous binary file per column (ex: SGBX.open.f8 - float64 opening prices, SGBX.time.i8 - int64 times in ms since epoch).
+# A small catalog.json in the store folder lists the tickers and their columns.
+
+# Readers memory map the columns and only open a ticker when it is used, so a single ticker run
+# does not load the rest of the universe into memory.
+
+import os, json, pickle
+import numpy as np
+
+catalog_name = 'catalog.json'
+
+#File extension for each column data type
+dtype_extensions = {'float64':'f8','int64':'i8','int32':'i4'}
+
+
+def read_catalog(store_dir):
+    """
+    Reads the catalog of a price store
+    store_dir - folder of the price store
+
+    Returns the catalog dictionary (empty catalog if the store does not exist yet)
+    """
+    catalog_path = os.path.join(store_dir,catalog_name)
+    if not os.path.exists(catalog_path):
+        return {'Tickers':{}}
+    with open(catalog_path,'r') as catalog_file:
+        return json.load(catalog_file)
+
+
+def write_catalog(store_dir,catalog):
+    """
+    Saves the catalog of a price store (written to a temporary file and renamed so readers never see half a catalog)
+    store_dir - folder of the price store
+    catalog - the catalog dictionary
+    """
+    catalog_path = os.path.join(store_dir,catalog_name)
+    with open(catalog_path+'.tmp','w') as catalog_file:
+        json.dump(catalog,catalog_file,indent=1)
+    os.replace(catalog_path+'.tmp',catalog_path)
+
+
+def write_columns(store_dir,ticker,columns):
+    """
+    Writes columns of data for a ticker and adds them to the catalog
+    store_dir - folder of the price store
+    ticker - the stock ticker symbol
+    columns - dictionary of column name to (values,dtype). Ex: {'open':(prices,'float64')}
+    """
+    os.makedirs(store_dir,exist_ok=True)
+    catalog = read_catalog(store_dir)
+    if ticker not in catalog['Tickers']:
+        catalog['Tickers'][ticker] = {'Columns':{}}
+
+    for name,(values,dtype) in columns.items():
+        file_name = '{}.{}.{}'.format(ticker,name,dtype_extensions[dtype])
+        file_path = os.path.join(store_dir,file_name)
+        #Copy the values first (they may be a memory map of the file being replaced) and rename a temporary file over the
+        #old column so a failed write never leaves a truncated column behind
+        data = np.array(values,dtype=dtype)
+        data.tofile(file_path+'.tmp')
+        os.replace(file_path+'.tmp',file_path)
+        catalog['Tickers'][ticker]['Columns'][name] = {'File':file_name,'Dtype':dtype,'Length':len(values)}
+
+    write_catalog(store_dir,catalog)
+
+
+def write_ticker(store_dir,ticker,prices,times=None):
+    """
+    Writes the minute level price history of a ticker to the store
+    store_dir - folder of the price store
+    ticker - the stock ticker symbol
+    prices - minute level opening prices
+    times - time of each price in milliseconds since epoch (None if unknown)
+    """
+    columns = {'open':(prices,'float64')}
+    if times is not None:
+        columns['time'] = (times,'int64')
+    write_columns(store_dir,ticker,columns)
+
+
+def convert_pickle_to_store(pickle_file,store_dir,tickers=None):
+    """
+    One time conversion of a Price_History_*.p pickle into a columnar price store
+    pickle_file - the pickle file with price_history[ticker]=[minute level opening price data]
+    store_dir - folder of the new price store
+    tickers - the tickers to convert (default is all of them)
+    """
+    with open(pickle_file,'rb') as price_file:
+        price_history = pickle.load(price_file)
+
+    if tickers is None:
+        tickers = list(price_history.keys())
+
+    for ticker in tickers:
+        write_ticker(store_dir,ticker,price_history[ticker])
+
+
+class PriceStore:
+    """
+    Read only view of a price store that acts like the price_history dictionary.
+    price_store[ticker] returns the memory mapped opening prices of the ticker.
+    """
+
+    def __init__(self,store_dir):
+        self.store_dir = store_dir
+        self.catalog = read_catalog(store_dir)
+        self.mapped = {}
+
+    def column(self,ticker,name):
+        """
+        Memory maps a column of a ticker (only mapped the first time it is used)
+        ticker - the stock ticker symbol
+        name - name of the column (Ex: 'open', 'time')
+        """
+        if (ticker,name) not in self.mapped:
+            info = self.catalog['Tickers'][ticker]['Columns'][name]
+            if info['Length']==0:
+                self.mapped[(ticker,name)] = np.zeros(0,dtype=info['Dtype'])
+            else:
+                self.mapped[(ticker,name)] = np.memmap(os.path.join(self.store_dir,info['File']),dtype=info['Dtype'],mode='r',shape=(info['Length'],))
+        return self.mapped[(ticker,name)]
+
+    def has_column(self,ticker,name):
+        return ticker in self.catalog['Tickers'] and name in self.catalog['Tickers'][ticker]['Columns']
+
+    def times(self,ticker):
+        """
+        Returns the times of the ticker's prices in milliseconds since epoch (None if the store has no times for this ticker)
+        """
+        if not self.has_column(ticker,'time'):
+            return None
+        return self.column(ticker,'time')
+
+    def __getitem__(self,ticker):
+        return self.column(ticker,'open')
+
+    def __contains__(self,ticker):
+        return ticker in self.catalog['Tickers']
+
+    def __iter__(self):
+        return iter(self.catalog['Tickers'])
+
+    def __len__(self):
+        return len(self.catalog['Tickers'])
+
+    def keys(self):
+        return self.catalog['Tickers'].keys()
+
+
+def iter_price_chunks(store_dir,ticker,chunk_size=100000,column='open'):
+    """
+    Reads a column of a ticker from disk one chunk at a time (for histories that don't fit in memory)
+    store_dir - folder of the price store
+    ticker - the stock ticker symbol
+    chunk_size - number of prices in each chunk
+    column - name of the column to read
+
+    Yields numpy arrays of at most chunk_size prices in time order
+    """
+    info = read_catalog(store_dir)['Tickers'][ticker]['Columns'][column]
+    dtype = np.dtype(info['Dtype'])
+    with open(os.path.join(store_dir,info['File']),'rb') as column_file:
+        for start in range(0,info['Length'],chunk_size):
+            yield np.fromfile(column_file,dtype=dtype,count=min(chunk_size,info['Length']-start))
+
+
+def load_price_history(name):
+    """
+    Loads price history for the estimators
+    name - name of the price history (Ex: 'Price_History_April3_May15')
+        If a price store folder with this name exists, it is memory mapped. Otherwise the pickle file name + '.p' is loaded.
+
+    Returns a dictionary like object where price_history[ticker] = minute level opening prices
+    """
+    if os.path.isdir(name):
+        return PriceStore(name)
+    with open(name+'.p','rb') as price_file:
+        return pickle.load(price_file)
+
+
+if __name__=="__main__":
+    #Convert the pickled price history into a price store folder with the same name
+    convert_pickle_to_store("Price_History_April3_May15.p","Price_History_April3_May15")
@@ -0,0 +1,275 @@
+# Multi resolution price pyramid in the price store (Price_History_Store.py).
+# TD Ameritrade keeps about two months of 1 minute candles but eight months of 5, 10, 15 and 30 minute candles.
+# Each ticker can be stored at several resolutions. Every resolution has open, high, low and time columns:
+#   1 minute  - 'open', 'high', 'low', 'time' (the same columns the estimators already read)
+#   N minutes - 'open_N', 'high_N', 'low_N', 'time_N'
+# Coarse bars are either downloaded directly or built from finer bars (first open, max high, min low of each time bucket).
+# Time columns always hold milliseconds since epoch. If the bar times are unknown, no time columns are written and coarse
+# bars group every N bars by position.
+
+# Sweeps run on coarse bars first and only re-run the most promising configs exactly on 1 minute bars, then climb to
+# better neighboring configs (one grid step on each axis) on 1 minute bars until none of them improve.
+# On coarse bars a buy fills if the bar low reaches the limit and a sell fills if the bar high reaches it, so no crossing
+# inside a bar is missed. Fills are at the limit price, and a buy is processed before a sell in the same bar.
+
+import numpy as np
+from Price_History_Store import write_columns,PriceStore
+from Price_Crossing_Index import build_crossing_index,first_price_at_or_below,first_price_at_or_above,simulate_buy_sell_percent
+
+#Resolutions (minutes) TD Ameritrade provides minute candles for
+resolutions = [1,5,10,15,30]
+
+
+def column_name(name,resolution):
+    """
+    Name of a price store column at a resolution (Ex: column_name('high',5) = 'high_5')
+    """
+    return name if resolution==1 else '{}_{}'.format(name,resolution)
+
+
+def candles_to_columns(candles):
+    """
+    Converts candles from get_price_history_dates/get_price_history_lookback to numpy columns
+    candles - the 'candles' list of the price history response
+
+    Returns a dictionary with 'open', 'high', 'low' and 'time' arrays
+    """
+    return {'open':np.array([candle['open'] for candle in candles],dtype=np.float64),
+            'high':np.array([candle['high'] for candle in candles],dtype=np.float64),
+            'low':np.array([candle['low'] for candle in candles],dtype=np.float64),
+            'time':np.array([candle['datetime'] for candle in candles],dtype=np.int64)}
+
+
+def aggregate_bars(opens,highs,lows,times,resolution):
+    """
+    Builds coarse bars from finer bars
+    opens, highs, lows - numpy arrays of the finer bars
+    times - bar times in milliseconds since epoch (None to group every resolution bars by position)
+    resolution - minutes in each coarse bar
+
+    Returns (opens,highs,lows,times) of the coarse bars (times is None if the bar times are unknown)
+    """
+    if len(opens)==0:
+        return (opens,highs,lows,None if times is None else np.zeros(0,dtype=np.int64))
+    if times is None:
+        starts = np.arange(0,len(opens),resolution)
+    else:
+        #A new coarse bar starts whenever a bar falls in a new time bucket
+        buckets = np.asarray(times)//(resolution*60000)
+        starts = np.flatnonzero(np.concatenate(([True],buckets[1:]!=buckets[:-1])))
+        times = buckets[starts]*(resolution*60000)
+    if times is not None:
+        times = np.asarray(times,dtype=np.int64)
+    return (np.asarray(opens)[starts],np.maximum.reduceat(highs,starts),np.minimum.reduceat(lows,starts),times)
+
+
+def write_resolution(store_dir,ticker,resolution,opens,highs,lows,times):
+    """
+    Writes the bars of one resolution of a ticker to the store
+    times - bar times in milliseconds since epoch (None if unknown, then no time column is written)
+    """
+    columns = {column_name('open',resolution):(opens,'float64'),
+               column_name('high',resolution):(highs,'float64'),
+               column_name('low',resolution):(lows,'float64')}
+    if times is not None:
+        columns[column_name('time',resolution)] = (times,'int64')
+    write_columns(store_dir,ticker,columns)
+
+
+def write_pyramid(store_dir,ticker,opens,highs=None,lows=None,times=None,coarse_resolutions=(5,10,15,30)):
+    """
+    Writes 1 minute bars of a ticker and every coarser resolution built from them
+    opens - 1 minute opening prices
+    highs, lows - 1 minute high and low prices (None if only opening prices are known, then high = low = open)
+    times - bar times in milliseconds since epoch (None to group bars by position and write no time columns)
+    coarse_resolutions - coarse resolutions to build
+    """
+    opens = np.asarray(opens,dtype=np.float64)
+    highs = opens if highs is None else np.asarray(highs,dtype=np.float64)
+    lows = opens if lows is None else np.asarray(lows,dtype=np.float64)
+    if times is not None:
+        times = np.asarray(times,dtype=np.int64)
+
+    write_resolution(store_dir,ticker,1,opens,highs,lows,times)
+    for resolution in coarse_resolutions:
+        write_resolution(store_dir,ticker,resolution,*aggregate_bars(opens,highs,lows,times,resolution))
+
+
+def read_bars(store,ticker,resolution):
+    """
+    Memory maps the bars of a ticker at a resolution
+    store - PriceStore
+
+    Returns (opens,highs,lows). At 1 minute, high and low fall back to the open if the store only has opening prices.
+    """
+    opens = store.column(ticker,column_name('open',resolution))
+    if not store.has_column(ticker,column_name('high',resolution)):
+        return (opens,opens,opens)
+    return (opens,store.column(ticker,column_name('high',resolution)),store.column(ticker,column_name('low',resolution)))
+
+
+def build_bar_index(opens,highs,lows):
+    """
+    Builds the crossing indexes of coarse bars (range min of the lows and range max of the highs)
+
+    Returns a dictionary with the first open and the Low and High crossing indexes
+    """
+    return {'First':float(opens[0]),'Low':build_crossing_index(lows),'High':build_crossing_index(highs)}
+
+
+def simulate_buy_sell_percent_bars(bar_index,buy_proportion,sell_proportion,new_buy_proportion,buys_allowed):
+    """
+    Coarse bar version of Price_Crossing_Index.simulate_buy_sell_percent (used to rank configs, not as the final estimate)
+    bar_index - indexes from build_bar_index
+    buy_proportion, sell_proportion, new_buy_proportion, buys_allowed - same as simulate_buy_sell_percent
+
+    Returns the profit proportion and the number of times we sold stock
+    """
+    low_index = bar_index['Low']
+    high_index = bar_index['High']
+    lows = low_index['Prices']
+    highs = high_index['Prices']
+    length = len(lows)
+    index = 0
+
+    previous_buy = bar_index['First']
+    average_buy = previous_buy
+    num_buys = 1
+    profit_proportion = 0
+    count_sold = 0
+
+    while index < length:
+
+        #Jump to the next bar that reaches the buy price or the sell price
+        buy_price = previous_buy*(1-buy_proportion)
+        if num_buys<buys_allowed:
+            next_buy = first_price_at_or_below(low_index,index,buy_price)
+        else:
+            next_buy = length
+        next_sell = first_price_at_or_above(high_index,index,average_buy*(1+sell_proportion))
+        index = min(next_buy,next_sell)
+        if index >= length:
+            break
+
+        #Buy at the limit price if the bar low reaches it
+        if lows[index] <= buy_price and num_buys<buys_allowed:
+            previous_buy = buy_price
+            average_buy = (num_buys*average_buy + previous_buy)/(num_buys+1)
+            num_buys+=1
+
+        #Sell all of our stock if the bar high reaches the sell price
+        if highs[index] >= average_buy*(1+sell_proportion):
+
+            profit_proportion += sell_proportion*num_buys
+            count_sold += num_buys
+            num_buys = 1
+            previous_buy = average_buy*(1+sell_proportion)*(1-new_buy_proportion)
+            average_buy = previous_buy
+
+            #Wait for a later bar to fall to the new buy price (we don't know if the low came after the high in this bar)
+            index = first_price_at_or_below(low_index,index+1,previous_buy)
+        else:
+            index+=1
+
+    return (profit_proportion,count_sold)
+
+
+def neighbor_configs(configs):
+    """
+    Finds the configs one grid step away from each config (on every axis, diagonals included)
+    configs - list of (buy_proportion,sell_proportion,new_buy_proportion)
+
+    Returns a list with the indexes of the neighbors of each config
+    """
+    axis_values = [sorted(set(config[axis] for config in configs)) for axis in range(3)]
+    axis_ranks = [{value:rank for rank,value in enumerate(values)} for values in axis_values]
+    config_index = {tuple(config):i for i,config in enumerate(configs)}
+
+    neighbors = []
+    for config in configs:
+        ranks = [axis_ranks[axis][config[axis]] for axis in range(3)]
+        found = []
+        for step_0 in (-1,0,1):
+            for step_1 in (-1,0,1):
+                for step_2 in (-1,0,1):
+                    steps = (step_0,step_1,step_2)
+                    if steps==(0,0,0):
+                        continue
+                    rank = [ranks[axis]+steps[axis] for axis in range(3)]
+                    if all(0<=rank[axis]<len(axis_values[axis]) for axis in range(3)):
+                        i = config_index.get(tuple(axis_values[axis][rank[axis]] for axis in range(3)))
+                        if i is not None:
+                            found.append(i)
+        neighbors.append(found)
+    return neighbors
+
+
+def pyramid_sweep(store,ticker,configs,buys_allowed,coarse_resolution=15,keep=50):
+    """
+    Coarse to fine sweep of buy/sell/new buy percent configs
+    store - PriceStore with the pyramid of the ticker
+    ticker - the ticker to test
+    configs - list of (buy_proportion,sell_proportion,new_buy_proportion)
+    buys_allowed - the number of times we allow the bot to re-buy the same stock without any sells
+    coarse_resolution - resolution (minutes) of the first pass over every config
+    keep - number of the best coarse configs to re-run exactly on 1 minute opening prices
+
+    The best 1 minute configs then climb to their neighbors (neighbor_configs) on 1 minute prices until the best config
+    has no better neighbor, so a peak the coarse bars ranked a little too low is still found if it is next to a kept config.
+
+    Returns a dictionary
+        Coarse Profit - profit percent of every config on the coarse bars
+        Fine Profit - dictionary of config index to profit percent on 1 minute bars (kept and refined configs)
+        Best Config - the config with the highest 1 minute profit
+        Best Profit - its profit percent
+    """
+    bar_index = build_bar_index(*read_bars(store,ticker,coarse_resolution))
+    coarse_profit = [simulate_buy_sell_percent_bars(bar_index,*config,buys_allowed)[0]*100 for config in configs]
+
+    #Only the most promising configs are run on every 1 minute bar
+    promising = sorted(range(len(configs)),key=lambda i:coarse_profit[i],reverse=True)[:keep]
+    crossing_index = build_crossing_index(store.column(ticker,'open'))
+    fine_profit = {i:simulate_buy_sell_percent(crossing_index,*configs[i],buys_allowed)[0]*100 for i in promising}
+
+    #Refine around the best 1 minute configs until the best config is a local peak on 1 minute prices
+    neighbors = neighbor_configs(configs)
+    checked = set()
+    while True:
+        best = max(fine_profit,key=fine_profit.get)
+        if best in checked:
+            break
+        checked.add(best)
+        for i in neighbors[best]:
+            if i not in fine_profit:
+                fine_profit[i] = simulate_buy_sell_percent(crossing_index,*configs[i],buys_allowed)[0]*100
+
+    return {'Coarse Profit':coarse_profit,
+            'Fine Profit':fine_profit,
+            'Best Config':configs[best],
+            'Best Profit':fine_profit[best]}
+
+
+if __name__=="__main__":
+    from Price_History_Store import convert_pickle_to_store
+    import os
+
+    store_dir = "Price_History_April3_May15"
+    if not os.path.isdir(store_dir):
+        convert_pickle_to_store(store_dir+".p",store_dir)
+
+    #Build the coarse resolutions from the 1 minute opening prices in the store
+    store = PriceStore(store_dir)
+    test_tickers = ['SVC']
+    for ticker in test_tickers:
+        write_pyramid(store_dir,ticker,np.array(store[ticker]),times=store.times(ticker))
+    store = PriceStore(store_dir)
+
+    #Same space as Estimate_Profits_VaryAll3.py
+    configs = [(x*0.1/100+0.1/100,z*0.5/100+0.5/100,y*0.05/100+0.05/100) for z in range(20) for x in range(100) for y in range(100)]
+    buys_allowed = 3
+
+    for ticker in test_tickers:
+        result = pyramid_sweep(store,ticker,configs,buys_allowed)
+        (buy_proportion,sell_proportion,new_buy_proportion) = result['Best Config']
+        print('{} best profit percent {} (buy {}%, sell {}%, new buy {}%)'.format(ticker,round(result['Best Profit'],3),
+              round(buy_proportion*100,2),round(sell_proportion*100,2),round(new_buy_proportion*100,2)))
@@ -0,0 +1,144 @@
+# Persistent cache of profit sweep results (replaces recomputing every cell and saving ad-hoc PofitbyPercent_*.p pickles).
+# Each cell is keyed by a hash of (algorithm, parameter tuple, max buys, hash of the price series).
+# Re-running a sweep with a slightly different grid only computes the cells that are missing.
+# Results are committed in batches as they are computed, so an interrupted sweep resumes where it stopped.
+# The cache is bounded. When it grows past max_entries, the least recently used cells are removed.
+
+import sqlite3, hashlib, json, time
+import numpy as np
+from Estimate_Profits_Vectorized import run_grid
+
+
+def price_series_hash(prices):
+    """
+    Hash of a price series so results are only reused for the exact same prices
+    prices - list or numpy array of prices
+    """
+    return hashlib.sha1(np.ascontiguousarray(prices,dtype=np.float64).tobytes()).hexdigest()
+
+
+def cell_key(algorithm,params,max_buys,price_hash):
+    """
+    Content address of one cell of a sweep
+    algorithm - name of the algorithm (Ex: 'Buy Sell Percent', 'New Buy Zero')
+    params - tuple of the algorithm parameters (Ex: (buy_proportion,sell_proportion,new_buy_proportion))
+    max_buys - the number of times we are allowed to buy the same stock
+    price_hash - hash of the price series from price_series_hash
+    """
+    #json writes floats with repr so different proportions never share a key
+    content = json.dumps([algorithm,list(params),max_buys,price_hash])
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    SQLite backed cache of sweep cells with least recently used eviction
+    """
+
+    def __init__(self,path,max_entries=5000000):
+        """
+        path - the database file to store results in (created if it does not exist)
+        max_entries - max number of cells to keep
+        """
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS cells (key TEXT PRIMARY KEY, result TEXT, last_used REAL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS cells_last_used ON cells (last_used)')
+        self.connection.commit()
+        #Number of cells in the cache (counted once here and kept up to date by put_many)
+        (self.count,) = self.connection.execute('SELECT COUNT(*) FROM cells').fetchone()
+
+    def get_many(self,keys):
+        """
+        Looks up cells in the cache and marks them as used
+        keys - list of cell keys from cell_key
+
+        Returns a dictionary of key to result for the keys in the cache
+        """
+        found = {}
+        for start in range(0,len(keys),500):
+            batch = keys[start:start+500]
+            rows = self.connection.execute('SELECT key,result FROM cells WHERE key IN ({})'.format(','.join('?'*len(batch))),batch)
+            for (key,result) in rows:
+                found[key] = json.loads(result)
+
+        now = time.time()
+        self.connection.executemany('UPDATE cells SET last_used=? WHERE key=?',[(now,key) for key in found])
+        self.connection.commit()
+        return found
+
+    def put_many(self,results):
+        """
+        Stores computed cells and evicts the least recently used cells if the cache is too large
+        results - dictionary of key to result (result must be json serializable)
+        """
+        #Only keys that are not in the cache yet add to the count (primary key lookups, not a scan of the table)
+        keys = list(results)
+        existing = 0
+        for start in range(0,len(keys),500):
+            batch = keys[start:start+500]
+            (found,) = self.connection.execute('SELECT COUNT(*) FROM cells WHERE key IN ({})'.format(','.join('?'*len(batch))),batch).fetchone()
+            existing += found
+
+        now = time.time()
+        self.connection.executemany('INSERT OR REPLACE INTO cells (key,result,last_used) VALUES (?,?,?)',
+                                    [(key,json.dumps(result),now) for key,result in results.items()])
+        self.count += len(keys)-existing
+
+        #Count the table again only when the cache may be over its size (another process may also write to it)
+        if self.count > self.max_entries:
+            (self.count,) = self.connection.execute('SELECT COUNT(*) FROM cells').fetchone()
+            if self.count > self.max_entries:
+                self.connection.execute('DELETE FROM cells WHERE key IN (SELECT key FROM cells ORDER BY last_used LIMIT ?)',(self.count-self.max_entries,))
+                self.count = self.max_entries
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def cached_run_grid(cache,prices,sell_proportions,buy_proportions,new_buy_zero_calc,new_buy_proportions,max_price_new_buys,calc_proportion,max_buys):
+    """
+    Same as Estimate_Profits_Vectorized.run_grid, but only runs the sell and buy proportions that have missing cells
+    cache - ResultCache to read and store cells
+
+    Returns the profit proportion cube (sell x buy x algorithm)
+    """
+    price_hash = price_series_hash(prices)
+
+    #Key of every cell in the cube
+    algorithms = [('New Buy Zero',calc,()) for calc in new_buy_zero_calc] + \
+                 [('New Buy',new_buy,()) for new_buy in new_buy_proportions] + \
+                 [('Max Price',new_buy,(calc_proportion,)) for new_buy in max_price_new_buys]
+    keys = {}
+    for y,sell_proportion in enumerate(sell_proportions):
+        for x,buy_proportion in enumerate(buy_proportions):
+            for i,(algorithm,algo_proportion,extra) in enumerate(algorithms):
+                keys[(y,x,i)] = cell_key(algorithm,(sell_proportion,buy_proportion,algo_proportion)+extra,max_buys,price_hash)
+
+    found = cache.get_many(list(keys.values()))
+    cube = np.zeros((len(sell_proportions),len(buy_proportions),len(algorithms)))
+    missing_sells = set()
+    missing_buys = set()
+    for (y,x,i),key in keys.items():
+        if key in found:
+            cube[y,x,i] = found[key]
+        else:
+            missing_sells.add(y)
+            missing_buys.add(x)
+
+    if len(missing_sells)>0:
+        #Run the smallest grid that covers every missing cell
+        missing_sells = sorted(missing_sells)
+        missing_buys = sorted(missing_buys)
+        sub_cube = run_grid(prices,[sell_proportions[y] for y in missing_sells],[buy_proportions[x] for x in missing_buys],
+                            new_buy_zero_calc,new_buy_proportions,max_price_new_buys,calc_proportion,max_buys)
+        results = {}
+        for j,y in enumerate(missing_sells):
+            for k,x in enumerate(missing_buys):
+                for i in range(len(algorithms)):
+                    cube[y,x,i] = sub_cube[j,k,i]
+                    results[keys[(y,x,i)]] = float(sub_cube[j,k,i])
+        cache.put_many(results)
+
+    return cube
@@ -0,0 +1,86 @@
+# Compact file format for sweep results (replaces pickling flat profit_ticker_percent/sell_percent/new_buy_percent lists).
+# A result file holds one N-dimensional cube per metric with a leading ticker axis, plus the name and values of every other axis.
+# Ex: profit cube shape (tickers, 20 sell percents, 100 buy percents, 100 new buy percents) stored as float32.
+# Files are compressed numpy .npz archives and are loaded without pickle.
+
+import numpy as np
+
+#Data type each metric is stored as (other metrics are stored as float32)
+metric_dtypes = {'Profit Percent':'float32','Times Sold':'int32'}
+
+
+def flat_to_cube(values,axes,dtype='float32'):
+    """
+    Reshapes a flat list of results into a cube
+    values - one result for each config, in the order of itertools.product over the axis values (last axis changes fastest)
+    axes - list of (axis name, axis values)
+    dtype - data type of the cube
+
+    Returns the cube as a numpy array
+    """
+    return np.asarray(values,dtype=dtype).reshape([len(axis_values) for (name,axis_values) in axes])
+
+
+def save_result_cube(file_name,tickers,axes,metrics):
+    """
+    Saves sweep results to a compressed result file
+    file_name - the file to write (.npz is added if missing)
+    tickers - list of tickers (the first axis of every metric cube)
+    axes - list of (axis name, axis values) for the other axes of the cubes. Ex: [('Sell Percent',[0.5,1.0,...]),('Buy Percent',[...])]
+    metrics - dictionary of metric name to a dictionary of ticker to cube (or a flat list in config order)
+        Ex: {'Profit Percent':profit_ticker_percent, 'Times Sold':times_sold}
+    """
+    shape = [len(axis_values) for (name,axis_values) in axes]
+    arrays = {'tickers':np.array(tickers,dtype=str),
+              'axis_names':np.array([name for (name,axis_values) in axes],dtype=str),
+              'metric_names':np.array(list(metrics),dtype=str)}
+
+    for i,(name,axis_values) in enumerate(axes):
+        arrays['axis_{}'.format(i)] = np.asarray(axis_values)
+
+    for i,(metric,ticker_results) in enumerate(metrics.items()):
+        dtype = metric_dtypes.get(metric,'float32')
+        cube = np.zeros([len(tickers)]+shape,dtype=dtype)
+        for t,ticker in enumerate(tickers):
+            cube[t] = np.asarray(ticker_results[ticker],dtype=dtype).reshape(shape)
+        arrays['metric_{}'.format(i)] = cube
+
+    np.savez_compressed(file_name,**arrays)
+
+
+def load_result_cube(file_name):
+    """
+    Loads a result file saved by save_result_cube
+    file_name - the result file
+
+    Returns a dictionary
+        Tickers - list of tickers
+        Axes - list of (axis name, numpy array of axis values)
+        Metrics - dictionary of metric name to cube (ticker x axes)
+    """
+    with np.load(file_name,allow_pickle=False) as archive:
+        axis_names = [str(name) for name in archive['axis_names']]
+        return {'Tickers':[str(ticker) for ticker in archive['tickers']],
+                'Axes':[(name,archive['axis_{}'.format(i)]) for i,name in enumerate(axis_names)],
+                'Metrics':{str(metric):archive['metric_{}'.format(i)] for i,metric in enumerate(archive['metric_names'])}}
+
+
+def best_configs(result,metric='Profit Percent',count=5):
+    """
+    Finds the best configs of each ticker in a result cube
+    result - dictionary from load_result_cube
+    metric - metric to rank configs by
+    count - number of configs to return for each ticker
+
+    Returns a dictionary of ticker to a list of (metric value, dictionary of axis name to value)
+    """
+    best = {}
+    for t,ticker in enumerate(result['Tickers']):
+        cube = result['Metrics'][metric][t]
+        order = np.argsort(cube,axis=None)[::-1][:count]
+        best[ticker] = []
+        for flat_index in order:
+            cell = np.unravel_index(flat_index,cube.shape)
+            params = {name:axis_values[cell[a]].item() for a,(name,axis_values) in enumerate(result['Axes'])}
+            best[ticker].append((cube[cell].item(),params))
+    return best
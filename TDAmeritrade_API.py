@@ -1,7 +1,101 @@
 #Functions to access the TD Ameritrade API. Make sure you have authenticated access to their site first.
 
-import requests, requests, time, datetime, dateutil.parser,json
+import requests, time, datetime, dateutil.parser,json,random,threading
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
 import TDAuth_Info
+from TDAmeritrade_rate_limit import limiter,current_priority,AUTH,CANCEL,SELL,BUY,STATUS,QUOTE,HISTORY
+
+#Base URL of the TD Ameritrade API (point this at a local server to test without the live site)
+api_url = 'https://api.tdameritrade.com/v1'
+
+#(connect, read) timeouts in seconds of each kind of request
+timeouts = {'Auth':(3.05,10),
+            'Order':(3.05,5),
+            'Status':(3.05,5),
+            'Quote':(3.05,3),
+            'History':(3.05,30)}
+
+
+class TDClient:
+    """
+    Keeps one pooled keep-alive session for all requests to the TD Ameritrade API (no new TCP/TLS handshake per call)
+    """
+
+    def __init__(self,pool_size=16,retries=3,backoff=0.25):
+        """
+        pool_size - max number of open connections kept to the site (one per thread making requests)
+        retries - number of times to retry GET and DELETE requests that failed to connect, timed out or got a 429/5xx reply
+        backoff - seconds to wait before the first retry (doubles after each failure)
+        """
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2,pool_maxsize=pool_size)
+        self.session.mount('https://',adapter)
+        self.session.mount('http://',adapter)
+        self.retries = retries
+        self.backoff = backoff
+        #Per thread override of retries (retry_limit)
+        self.local = threading.local()
+        #(access token, headers, json headers) of the latest token
+        self.cached_headers = (None,{},{})
+
+    def headers(self,access_token,json=False):
+        """
+        Returns the authorization headers of the access token (only built again when the token changes)
+        json - True to include the json content type
+        """
+        cached = self.cached_headers
+        if cached[0]!=access_token:
+            auth = {'Authorization':'Bearer {}'.format(access_token)}
+            cached = (access_token,auth,dict(auth,**{'Content-Type':'application/json'}))
+            self.cached_headers = cached
+        return cached[2] if json else cached[1]
+
+    @contextmanager
+    def retry_limit(self,retries):
+        """
+        Changes the number of retries of the requests made by this thread inside the with block
+        (Ex: the price history downloader retries whole windows itself, so it turns the client retries off)
+        """
+        previous = getattr(self.local,'retries',None)
+        self.local.retries = retries
+        try:
+            yield
+        finally:
+            self.local.retries = previous
+
+    def request(self,method,url,priority,timeout,**kwargs):
+        """
+        Makes one request to the site through the rate limiter
+        method - 'GET', 'POST', 'PUT' or 'DELETE'
+        url - full url of the request
+        priority - rate limiter lane of the request (request_priority overrides it)
+        timeout - key of the timeouts dictionary (Ex: 'Order')
+        kwargs - passed on to requests (headers, params, data, json)
+
+        Returns the response. Only GET and DELETE are retried since placing or replacing an order twice is not safe.
+        """
+        retries = getattr(self.local,'retries',None)
+        if retries is None:
+            retries = self.retries
+        attempts = retries+1 if method in ('GET','DELETE') else 1
+        lane = current_priority(priority)
+        for attempt in range(attempts):
+            limiter.acquire(lane)
+            try:
+                response = self.session.request(method,url,timeout=timeouts[timeout],**kwargs)
+                if attempt+1==attempts or (response.status_code!=429 and response.status_code<500):
+                    return response
+            except (requests.ConnectionError,requests.Timeout):
+                if attempt+1==attempts:
+                    raise
+            #Wait longer after each failure (jitter keeps the threads from retrying at the same time)
+            time.sleep(self.backoff*2**attempt*(1+random.random()/2))
+
+
+#The client shared by every thread
+client = TDClient()
+
 
 def get_access(access_token='',expire_time=0):
     """
@@ -13,7 +107,7 @@ def get_access(access_token='',expire_time=0):
     if (expire_time==0) or (len(access_token)==0) or (time.time()-expire_time>=-300):
 
         #API needed to authorize account with refresh token
-        auth_url = 'https://api.tdameritrade.com/v1/oauth2/token'
+        auth_url = api_url+'/oauth2/token'
 
         #Data needed for token
         data = {'grant_type':'refresh_token',
@@ -21,7 +115,7 @@ def get_access(access_token='',expire_time=0):
                 'client_id':TDAuth_Info.client_id}
 
         #Post the data to get the token
-        auth_reply_json = requests.post(url=auth_url,data=data)
+        auth_reply_json = client.request('POST',auth_url,AUTH,'Auth',data=data)
         auth_reply=auth_reply_json.json()
 
         #Now use the token to get account information
@@ -37,10 +131,9 @@ def get_user_principals(access_token):
     access token - used to get information on my account
     """
     #Make request to user info and preferences to get principals for login
-    user_url = 'https://api.tdameritrade.com/v1/userprincipals'
-    headers = {'Authorization': 'Bearer {}'.format(access_token)}
+    user_url = api_url+'/userprincipals'
     params = {'fields':'streamerSubscriptionKeys,streamerConnectionInfo'}
-    user_principals_json = requests.get(url=user_url,headers=headers,params=params)
+    user_principals_json = client.request('GET',user_url,STATUS,'Status',headers=client.headers(access_token),params=params)
     user_principals = user_principals_json.json()
 
     #convert token timestamp to milliseconds (required for login to websocket)
@@ -52,26 +145,28 @@ def get_user_principals(access_token):
     return (user_principals,tokenTimeStampAsMs)
 
 
-def get_orders(access_token,start_date,end_date,status):
+def get_orders(access_token,start_date,end_date,status,max_results=None):
     """
     Get orders for the account in the specified date range on TD Ameritrade
     access_token - token used to access the TD Ameritrade site
     start_date - beginning time period to get orders (includes start_date in returned orders)
     end_date - ending time period to get orders (includes end_date in returned orders)
     status - the status of the orders to return (Ex: filled, queued)
+    max_results - max number of orders to return (None for the site's default)
     Returns the orders data in a dictionary format
     """
 
-    orders_url = 'https://api.tdameritrade.com/v1/orders'
-    headers={'Authorization': 'Bearer {}'.format(access_token)}
+    orders_url = api_url+'/orders'
     #Parameters for the order
     params = {'accountId':TDAuth_Info.account_num,
               'fromEnteredTime': start_date,
               'toEnteredTime': end_date,
               'status': status}
+    if max_results is not None:
+        params['maxResults'] = max_results
 
     #Make the get request to TD Ameritrade
-    orders_data_json = requests.get(url=orders_url,headers=headers,params=params)
+    orders_data_json = client.request('GET',orders_url,STATUS,'Status',headers=client.headers(access_token),params=params)
     return orders_data_json.json()
 
 
@@ -82,11 +177,10 @@ def get_order_by_id(access_token,order_ID):
     order_ID - the ID of the order we are getting
     """
 
-    orders_url = 'https://api.tdameritrade.com/v1/accounts/{}/orders/{}'.format(TDAuth_Info.account_num,order_ID)
-    headers={'Authorization': 'Bearer {}'.format(access_token)}
+    orders_url = api_url+'/accounts/{}/orders/{}'.format(TDAuth_Info.account_num,order_ID)
 
     #Make the get request to TD Ameritrade
-    orders_data_json = requests.get(url=orders_url,headers=headers)
+    orders_data_json = client.request('GET',orders_url,STATUS,'Status',headers=client.headers(access_token))
     return orders_data_json.json()
 
 
@@ -96,9 +190,8 @@ def delete_order(access_token,order_ID):
     access_token - token used to access the TD Ameritrade site
     order_ID - the ID of the order to delete
     """
-    orders_url = 'https://api.tdameritrade.com/v1/accounts/{}/orders/{}'.format(TDAuth_Info.account_num,order_ID)
-    headers={'Authorization': 'Bearer {}'.format(access_token)}
-    order_status = requests.delete(url=orders_url,headers=headers)
+    orders_url = api_url+'/accounts/{}/orders/{}'.format(TDAuth_Info.account_num,order_ID)
+    order_status = client.request('DELETE',orders_url,CANCEL,'Order',headers=client.headers(access_token))
     return order_status
 
 
@@ -109,14 +202,10 @@ def post_order(access_token,json_request):
     json_request - the order request in json format
     Returns the response to the post request
     """
-    orders_url = 'https://api.tdameritrade.com/v1/accounts/{}/orders'.format(TDAuth_Info.account_num)
+    orders_url = api_url+'/accounts/{}/orders'.format(TDAuth_Info.account_num)
 
-    #The header for placing in order needs to define the input type (json)
-    headers = {'Authorization':'Bearer {}'.format(access_token),
-               'Content-Type':'application/json'}
-
-    #Post the order on TD Ameritrade and check the response
-    post_order_response=requests.post(url=orders_url,headers=headers,json=json_request)
+    #Post the order on TD Ameritrade and check the response (the header defines the input type as json)
+    post_order_response=client.request('POST',orders_url,BUY,'Order',headers=client.headers(access_token,json=True),json=json_request)
 
     return post_order_response
 
@@ -129,14 +218,10 @@ def replace_order(access_token,order_ID,json_request):
     json_request - the new order request in json format to replace the old one
     Returns the response to the replace order request
     """
-    orders_url = 'https://api.tdameritrade.com/v1/accounts/{}/orders/{}'.format(TDAuth_Info.account_num,order_ID)
-
-    #The header for placing in order needs to define the input type (json)
-    headers = {'Authorization':'Bearer {}'.format(access_token),
-               'Content-Type':'application/json'}
+    orders_url = api_url+'/accounts/{}/orders/{}'.format(TDAuth_Info.account_num,order_ID)
 
-    #Post the order on TD Ameritrade and check the response
-    replace_order_response=requests.put(url=orders_url,headers=headers,json=json_request)
+    #Put the order on TD Ameritrade and check the response (the header defines the input type as json)
+    replace_order_response=client.request('PUT',orders_url,SELL,'Order',headers=client.headers(access_token,json=True),json=json_request)
 
     return replace_order_response
 
@@ -171,14 +256,10 @@ def get_quote(access_token,ticker):
     access_token - token used to access the TD Ameritrade site
     ticker - the stock ticker symbol
     """
-    quote_url = 'https://api.tdameritrade.com/v1/marketdata/{}/quotes'.format(ticker)
+    quote_url = api_url+'/marketdata/{}/quotes'.format(ticker)
 
-    #The header for getting a quote needs to define the input type (json)
-    headers = {'Authorization':'Bearer {}'.format(access_token),
-               'Content-Type':'application/json'}
-
-    #Make the get request to TD Ameritrade
-    quote_data_json = requests.get(url=quote_url,headers=headers)
+    #Make the get request to TD Ameritrade (the header for getting a quote needs to define the input type as json)
+    quote_data_json = client.request('GET',quote_url,QUOTE,'Quote',headers=client.headers(access_token,json=True))
     return quote_data_json.json()
 
 
@@ -188,17 +269,13 @@ def get_multi_quotes(access_token,tickers):
     access_token - token used to access the TD Ameritrade site
     tickers - comma delimited list of ticker symbols to get quotes for (Ex: 'MSFT,APPL,AMZN')
     """
-    quote_url = 'https://api.tdameritrade.com/v1/marketdata/quotes'
-
-    #The header for getting a quote needs to define the input type (json)
-    headers = {'Authorization':'Bearer {}'.format(access_token),
-               'Content-Type':'application/json'}
+    quote_url = api_url+'/marketdata/quotes'
 
     #Pass in the symbols as parameters
     params = {'symbol':tickers}
 
-    #Make the get request to TD Ameritrade
-    quote_data_json = requests.get(url=quote_url,headers=headers,params=params)
+    #Make the get request to TD Ameritrade (the header for getting a quote needs to define the input type as json)
+    quote_data_json = client.request('GET',quote_url,QUOTE,'Quote',headers=client.headers(access_token,json=True),params=params)
     return quote_data_json.json()
 
 
@@ -215,11 +292,7 @@ def get_price_history_lookback(access_token,ticker,periodType,period,frequencyTy
                     1, 5, 10, 15, and 30 available for minute (only 1 for other types)
     """
     
-    price_url = 'https://api.tdameritrade.com/v1/marketdata/{}/pricehistory'.format(ticker)
-
-    #The header for getting a quote needs to define the input type (json)
-    headers = {'Authorization':'Bearer {}'.format(access_token),
-               'Content-Type':'application/json'}
+    price_url = api_url+'/marketdata/{}/pricehistory'.format(ticker)
 
     #Parameters for period of time and frequency of data to get
     params = {'periodType':periodType,
@@ -228,7 +301,7 @@ def get_price_history_lookback(access_token,ticker,periodType,period,frequencyTy
               'frequency': frequency}
                 
     #Make the get request to TD Ameritrade
-    price_history_json = requests.get(url=price_url,headers=headers,params=params)
+    price_history_json = client.request('GET',price_url,HISTORY,'History',headers=client.headers(access_token,json=True),params=params)
     return price_history_json.json()
     
 
@@ -252,11 +325,7 @@ def get_price_history_dates(access_token,ticker,start_date,end_date,frequencyTyp
                     1, 5, 10, 15, and 30 available for minute (only 1 for other types)
     """
     
-    price_url = 'https://api.tdameritrade.com/v1/marketdata/{}/pricehistory'.format(ticker)
-
-    #The header for getting a quote needs to define the input type (json)
-    headers = {'Authorization':'Bearer {}'.format(access_token),
-               'Content-Type':'application/json'}
+    price_url = api_url+'/marketdata/{}/pricehistory'.format(ticker)
 
     #Parameters for period of time and frequency of data to get
     params = {'startDate':start_date,
@@ -265,5 +334,5 @@ def get_price_history_dates(access_token,ticker,start_date,end_date,frequencyTyp
               'frequency': frequency}
                 
     #Make the get request to TD Ameritrade
-    price_history_json = requests.get(url=price_url,headers=headers,params=params)
+    price_history_json = client.request('GET',price_url,HISTORY,'History',headers=client.headers(access_token,json=True),params=params)
     return price_history_json.json()
\ No newline at end of file
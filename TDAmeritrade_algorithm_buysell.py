@@ -1,13 +1,67 @@
 import datetime,time,dateutil.parser
-import pytz, pickle
+import pytz, queue, asyncio, concurrent.futures
 from TDAmeritrade_API import *
+from TDAmeritrade_quotes import QuoteBook
+from TDAmeritrade_rate_limit import request_priority,SELL
+from TDAmeritrade_locks import locks
+from TDAmeritrade_journal import journal
 
 #TD Ameritrade_algorithm_buysell v2
 # CD 6/14/20 Update algorithm not to sell all if new_buy_percent = 0 (lowers API calls and prevents negative cost basis)
 # CD 6/14/20 Update algorithm to text if funds are low or if a ticker has not been traded in 5 days.
 
 
-def ordering_bot(lock,transactions,errors):
+class TickerThrottle:
+    """
+    Spaces out the order requests process_ticker makes for each ticker.
+    Streamed quotes can wake a ticker many times a second, so without this every quote at the limit price would look up
+    the order again and every quote after a failed order would place it again.
+    """
+
+    def __init__(self,track_interval=15,backoff=2,max_backoff=120):
+        """
+        track_interval - seconds to wait after looking up a ticker's orders before looking them up again
+        backoff - seconds to wait after a failed request before trying it again (doubles after each failure)
+        max_backoff - max seconds to wait after failed requests
+        """
+        self.track_interval = track_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        #(ticker, request kind) -> time.monotonic() before which the request is skipped
+        self.next_time = {}
+        #(ticker, request kind) -> number of failures in a row
+        self.failures = {}
+
+    def ready(self,ticker,kind):
+        """
+        Returns True if the request kind (Ex: 'Track', 'Buy') of the ticker can be made now
+        """
+        return time.monotonic() >= self.next_time.get((ticker,kind),0)
+
+    def wait(self,ticker,kind,seconds):
+        """
+        Skips the request kind of the ticker for the next seconds
+        """
+        self.next_time[(ticker,kind)] = time.monotonic()+seconds
+
+    def result(self,ticker,kind,succeeded):
+        """
+        Backs off the request kind of the ticker after a failure, or clears the back off after a success
+        """
+        key = (ticker,kind)
+        if succeeded:
+            self.failures.pop(key,None)
+            self.next_time.pop(key,None)
+        else:
+            self.failures[key] = self.failures.get(key,0)+1
+            self.wait(ticker,kind,min(self.backoff*2**(self.failures[key]-1),self.max_backoff))
+
+
+#The throttle shared by every thread
+throttle = TickerThrottle()
+
+
+def ordering_bot(transactions,errors):
     """
     Runs a bot to buy and sell stock. 
     Uses the transactions dictionary to set up parameters for when to buy and sell stock. 
@@ -39,191 +93,412 @@ def ordering_bot(lock,transactions,errors):
         Access Token - the token we use to access the TD Ameritrade site
         Access Expire Time - time the access token expires
         Max Buys - the number of buy orders we allow the bot to place without any sells (prevents continuous purchase of stock heading to zero)
-        Last Requests - the last requests we made to the TD Ameritrade API (make sure we don't make more than two calls per second)
+        Last Requests - the last requests we made to the TD Ameritrade API (no longer used, TDAmeritrade_rate_limit.py spaces out the requests)
     """
-    #Initialize min request index to 0 since no transactions have started yet
-    min_request_index=0
-
     #Run this code until we encounter an error or trading hours have ended (include extended hours)
     open_time = datetime.datetime(2020,1,1,4,00,0,0).time()
     close_time = datetime.datetime(2020,1,1,17,0,0,0).time()
     open_time_seconds = datetime.timedelta(hours=open_time.hour,minutes=open_time.minute,seconds=open_time.second).total_seconds()
 
-    #Continue looping while we don't have any errors
-    while len(errors)==0:
+    #Bid and ask prices of every ticker (requested in batches), its worker threads are shut down when the loop ends
+    with QuoteBook() as quotes:
 
-        #Reset API errors list
-        transactions['API Errors']=[]
+        #Continue looping while we don't have any errors
+        while len(errors)==0:
 
-        current = datetime.datetime.now()
-        current_seconds = datetime.timedelta(hours=current.hour,minutes=current.minute,seconds=current.second).total_seconds()
-        #Sleep until trading opens for the day
-        if open_time_seconds>=current_seconds+60:
-            time.sleep(open_time_seconds-current_seconds-60)
-        if close_time<datetime.datetime.now().time():
-            time.sleep(open_time_seconds+86300-current_seconds)
+            #Reset API errors list
+            transactions['API Errors']=[]
 
-        #If the day is Saturday, sleep for two more days
-        if datetime.datetime.now().weekday()==5:
-            time.sleep(2*86300)
+            current = datetime.datetime.now()
+            current_seconds = datetime.timedelta(hours=current.hour,minutes=current.minute,seconds=current.second).total_seconds()
+            #Sleep until trading opens for the day
+            if open_time_seconds>=current_seconds+60:
+                time.sleep(open_time_seconds-current_seconds-60)
+            if close_time<datetime.datetime.now().time():
+                time.sleep(open_time_seconds+86300-current_seconds)
 
-        while len(errors)==0 and open_time<=datetime.datetime.now().time() and close_time>=datetime.datetime.now().time():
+            #If the day is Saturday, sleep for two more days
+            if datetime.datetime.now().weekday()==5:
+                time.sleep(2*86300)
+
+            while len(errors)==0 and open_time<=datetime.datetime.now().time() and close_time>=datetime.datetime.now().time():
             
-            ############################### Get a new access token if we need it ##########################
-            #Get the access token and the expire time of the access token.
-            (transactions['Access Token'],transactions['Access Expire Time']) = get_access(transactions['Access Token'],transactions['Access Expire Time'])
+                ############################### Get a new access token if we need it ##########################
+                #Get the access token and the expire time of the access token.
+                update_access(transactions)
+
 
 
+                ############################### Get Bid  and Ask Price #########################
+                #Get quote information from API calls (one per batch of tickers)
+                update_quotes(transactions,quotes)
 
-            ############################### Get Bid  and Ask Price #########################
-            lock.acquire()
-            try:
-                #Get quote information from API call
-                new_quotes = get_multi_quotes(transactions['Access Token'],','.join(transactions['Tickers']))
+
+
+                ############################### Place Limit Buy Orders #########################
+                #Make sure each ticker has a buy order in place
                 for ticker in transactions['Tickers']:
-                    #For each ticker store the latest bid price
-                    if ticker in new_quotes and 'bidPrice' in new_quotes[ticker] and 'askPrice' in new_quotes[ticker]:
-                        transactions[ticker]['Bid Price'] = new_quotes[ticker]['bidPrice']
-                        transactions[ticker]['Ask Price'] = new_quotes[ticker]['askPrice']
-
-                transactions['Last Requests'][min_request_index]=time.time()
-            except:
-                transactions['API Errors'].append('Could not get quotes')
-
-            last_requests=transactions['Last Requests']
-            lock.release()
-            #Make sure we are not making too many requests to the TD Ameritrade API
-            min_request_index=check_request_times(last_requests)
-
-
-
-            ############################### Place Limit Buy Orders #########################
-            lock.acquire()
-            #Make sure each ticker has a buy order in place
-            for ticker in transactions['Tickers']:
-                #If we don't have a buy order and we have funds to make another buy
-                if transactions[ticker]['Limit Buy ID']==0:
-                    #Place the new limit buy order for each ticker (for first buy and if all stock has been sold)
-                    place_buy_order(transactions,ticker)
-                    transactions['Last Requests'][min_request_index]=time.time()
-
-                last_requests=transactions['Last Requests']
-                #Make sure we are not making too many requests to the TD Ameritrade API
-                min_request_index=check_request_times(last_requests)
-            lock.release()
-
-
-            ############################### Track Orders ###################################
-            lock.acquire()
-            for ticker in transactions['Tickers']:
-                #Check if there are limit buy orders and the ask price dipped below the limit buy order
-                if transactions[ticker]['Limit Buy Price']>0 and \
-                    transactions[ticker]['Bid Price']<=transactions[ticker]['Limit Buy Price']:
-                    #Track the buy order (remove from limit buy array if filled)
-                    track_buy_orders(transactions,ticker)
-                    transactions['Last Requests'][min_request_index]=time.time()
-
-                #Check if there are limit sell orders and the bid price rose above the limit sell order
-                elif transactions[ticker]['Limit Sell Price']>0 and \
-                    transactions[ticker]['Ask Price']>=transactions[ticker]['Limit Sell Price']:
-                    #Track the sell order (remove from limit sell arrays if filled)
-                    track_sell_orders(transactions,ticker)
-                    transactions['Last Requests'][min_request_index]=time.time()
-            
-                last_requests=transactions['Last Requests']
-                #Make sure we are not making too many requests to the TD Ameritrade API
-                min_request_index=check_request_times(last_requests)
-            lock.release()
+                    #If we don't have a buy order and we have funds to make another buy
+                    if transactions[ticker].limit_buy_id==0:
+                        #Place the new limit buy order for each ticker (for first buy and if all stock has been sold)
+                        place_buy_order(transactions,ticker)
+
 
+                ############################### Track Orders ###################################
+                #Track the orders of every ticker with one request (applies filled buys and sells)
+                track_fills(transactions)
 
-            ############################### Place/Replace Limit Sell Orders #########################
-            lock.acquire()
-            for ticker in transactions['Tickers']:
-                #If we own stock and don't have a limit sell order placed, check if we should place a limit sell order
-                if transactions[ticker]['Stock Owned']>0:
+
+                ############################### Place/Replace Limit Sell Orders #########################
+                for ticker in transactions['Tickers']:
+                    #If we own stock and don't have a limit sell order placed, check if we should place a limit sell order
+                    if transactions[ticker].stock_owned>0:
                     
-                    #Place a limit sell order if we own stock and yet we don't have a limit sell order placed
-                    if transactions[ticker]['Limit Sell ID']==0:
-                        #Place the new limit sell order
-                        place_sell_order(transactions,ticker)
-                        transactions['Last Requests'][min_request_index]=time.time()
+                        #Place a limit sell order if we own stock and yet we don't have a limit sell order placed
+                        if transactions[ticker].limit_sell_id==0:
+                            #Place the new limit sell order
+                            place_sell_order(transactions,ticker)
                     
-                    #Place a limit sell order if we own stock, the current sell does not match the expected sell (average buy price * (1+sell proportion))
-                    elif transactions[ticker]['Limit Sell Price'] != round(transactions[ticker]['Average Buy']*(1 + \
-                        transactions[ticker]['Sell Proportion']),transactions[ticker]['Max Digits']):
-                        #Replace the limit sell order
-                        replace_sell_order(transactions,ticker)
-                        transactions['Last Requests'][min_request_index]=time.time()
-
-                last_requests=transactions['Last Requests']
-                #Make sure we are not making too many requests to the TD Ameritrade API
-                min_request_index=check_request_times(last_requests)
-            lock.release()
+                        #Place a limit sell order if we own stock, the current sell does not match the expected sell (average buy price * (1+sell proportion))
+                        elif transactions[ticker].limit_sell_price != round(transactions[ticker].average_buy*(1 + \
+                            transactions[ticker].sell_proportion),transactions[ticker].max_digits):
+                            #Replace the limit sell order
+                            replace_sell_order(transactions,ticker)
             
 
-            ############################### Cancel Buy Orders ########################
-            lock.acquire()
-            for ticker in transactions['Tickers']:
-                #Cancel buy order when we successfully sold stock (new buy order closer to price can be placed)
-                if transactions[ticker]['Previous Sell']>0 and transactions[ticker]['Limit Buy ID']>0:
-                    #Cancel buy order on TD Ameritrade and remove it from buy arrays
-                    cancel_buy_orders(transactions,ticker)   
-                    transactions['Last Requests'][min_request_index]=time.time()
+                ############################### Cancel Buy Orders ########################
+                for ticker in transactions['Tickers']:
+                    #Cancel buy order when we successfully sold stock (new buy order closer to price can be placed)
+                    if transactions[ticker].previous_sell>0 and transactions[ticker].limit_buy_id>0:
+                        #Cancel buy order on TD Ameritrade and remove it from buy arrays
+                        cancel_buy_orders(transactions,ticker)   
+
+                #Make sure the journal is on disk and take a snapshot every so often
+                journal.maybe_snapshot(transactions)
+
+            #Get the access token and the expire time of the access token.
+            update_access(transactions)
+
+            #Track all the buy and sell orders to make sure we are up to date
+            track_fills(transactions)
+
+            #Save a snapshot of the transactions dictionary (starts a new journal)
+            journal.snapshot(transactions)
+
 
-                last_requests=transactions['Last Requests']
-                #Make sure we are not making too many requests to the TD Ameritrade site
-                min_request_index=check_request_times(last_requests)
-            lock.release()
+def streaming_ordering_bot(transactions,errors,updates):
+    """
+    Runs the same algorithm as ordering_bot, but is woken by streamed quotes instead of polling get_multi_quotes.
+    read_websocket stores the bid and ask prices of each ticker and puts the ticker in the updates queue.
+    Only the tickers with new quotes are run through the buy/track/sell/cancel steps (process_ticker),
+    so the API requests are only used for orders.
+
+    transactions - dictionary of info related to bot transactions (see ordering_bot)
+    errors - list of errors. If this is not empty, end the loop
+    updates - queue of tickers with new quotes (filled by read_websocket)
+    """
+    #Trading hours (include extended hours)
+    open_time = datetime.datetime(2020,1,1,4,00,0,0).time()
+    close_time = datetime.datetime(2020,1,1,17,0,0,0).time()
+
+    trading=False
+    pending=set()
+    while len(errors)==0:
+
+        #Wait for new quotes (wake up every second to check for errors and trading hours)
+        try:
+            pending.add(updates.get(timeout=1))
+            while True:
+                pending.add(updates.get_nowait())
+        except queue.Empty:
+            pass
+
+        now=datetime.datetime.now()
+        if now.weekday()>=5 or now.time()<open_time or now.time()>close_time:
+            if trading:
+                #Trading hours ended. Track all the orders and save the transactions dictionary.
+                update_access(transactions)
+                track_fills(transactions)
+                journal.snapshot(transactions)
+                trading=False
+            pending.clear()
+            continue
+
+        if not trading:
+            #Start of trading hours. Run every ticker once to place orders.
+            trading=True
+            pending.update(transactions['Tickers'])
+
+        update_access(transactions)
+
+        for ticker in pending:
+            if ticker in transactions['Tickers']:
+                process_ticker(transactions,ticker)
+        pending.clear()
+        journal.maybe_snapshot(transactions)
+
+
+def async_ordering_bot(transactions,errors,workers=16):
+    """
+    Runs the same algorithm as ordering_bot, but the tickers are run at the same time instead of one after the other.
+    Each cycle gets the quotes of every ticker and tracks the orders of every ticker (track_fills),
+    then runs process_ticker for every ticker in its own worker thread.
+    The tickers only change their own dictionaries, so one ticker waiting on the site does not hold up the others,
+    and a cycle over many tickers takes about as long as the slowest ticker (the rate limiter still spaces out the requests).
+
+    transactions - dictionary of info related to bot transactions (see ordering_bot)
+    errors - list of errors. If this is not empty, end the loop
+    workers - max number of requests waiting on the site at once
+    """
+    asyncio.run(async_ordering_loop(transactions,errors,workers))
+
+
+async def async_ordering_loop(transactions,errors,workers):
+    """
+    Event loop of async_ordering_bot
+    The blocking requests run in a pool of workers threads (shut down when the loop ends).
+    """
+    loop = asyncio.get_running_loop()
+
+    #Trading hours (include extended hours)
+    open_time = datetime.datetime(2020,1,1,4,00,0,0).time()
+    close_time = datetime.datetime(2020,1,1,17,0,0,0).time()
+
+    #Bid and ask prices of every ticker (requested in batches), its worker threads are shut down with the executor
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor, QuoteBook() as quotes:
+        trading=False
+        while len(errors)==0:
+
+            now=datetime.datetime.now()
+            if now.weekday()>=5 or now.time()<open_time or now.time()>close_time:
+                if trading:
+                    #Trading hours ended. Track all the orders and save the transactions dictionary.
+                    await loop.run_in_executor(executor,update_access,transactions)
+                    await loop.run_in_executor(executor,track_fills,transactions)
+                    journal.snapshot(transactions)
+                    trading=False
+                #Check for errors and the start of trading hours every few seconds
+                await asyncio.sleep(5)
+                continue
+            trading=True
+
+            #Reset API errors list
+            transactions['API Errors']=[]
 
-        lock.acquire()
+            await loop.run_in_executor(executor,update_access,transactions)
 
-        #Get the access token and the expire time of the access token.
-        (transactions['Access Token'],transactions['Access Expire Time']) = get_access(transactions['Access Token'],transactions['Access Expire Time'])
+            #Get quote information for every ticker
+            await loop.run_in_executor(executor,update_quotes,transactions,quotes)
 
-        #Track all the buy and sell orders to make sure we are up to date
-        for ticker in transactions['Tickers']:
+            #Track the orders of every ticker with one request
+            await loop.run_in_executor(executor,track_fills,transactions)
+
+            #Place buys, place/replace sells and cancel buys of every ticker at once
+            await asyncio.gather(*[loop.run_in_executor(executor,process_ticker,transactions,ticker,False) for ticker in transactions['Tickers']])
+            await loop.run_in_executor(executor,journal.maybe_snapshot,transactions)
+
+
+def update_access(transactions):
+    """
+    Gets a new access token if the old one expired (the request is made without holding the shared lock)
+    transactions - dictionary of info related to bot transactions
+    """
+    with locks.shared:
+        (access_token,expire_time) = (transactions['Access Token'],transactions['Access Expire Time'])
+    (access_token,expire_time) = get_access(access_token,expire_time)
+    with locks.shared:
+        (transactions['Access Token'],transactions['Access Expire Time']) = (access_token,expire_time)
 
-            #Check if there are limit buy orders
-            if transactions[ticker]['Limit Buy Price']>0:
-                #Track the buy order (remove from limit buy array if filled)
+
+def update_quotes(transactions,quotes,max_age=60):
+    """
+    Gets the quotes of every ticker and stores the bid and ask price of each ticker
+    transactions - dictionary of info related to bot transactions
+    quotes - QuoteBook of the ordering loop
+    max_age - seconds before a quote is stale (stale tickers keep their last prices and are added to the API errors)
+    """
+    failed = quotes.refresh(transactions['Access Token'],transactions['Tickers'])
+    if failed>0:
+        transactions['API Errors'].append('Could not get quotes ({} of {} batches)'.format(failed,len(quotes.shards)))
+    stale = quotes.store(transactions,max_age)
+    if len(stale)>0:
+        transactions['API Errors'].append('Stale quotes for {} tickers (Ex: {})'.format(len(stale),','.join(stale[:10])))
+
+
+def process_ticker(transactions,ticker,track=True):
+    """
+    Runs the ordering_bot steps for one ticker (place buy, track orders, place/replace sell, cancel buy)
+    Each step decides from a copy of the ticker's dictionary, so the ticker lock is not held during the requests.
+    The steps are spaced out by throttle: orders are looked up at most once every track_interval seconds and a failed
+    order request backs off before it is tried again.
+    transactions - dictionary of info related to bot transactions (uses the ticker's latest Bid Price and Ask Price)
+    ticker - the stock we are trading
+    track - False if the orders were already tracked this cycle (track_fills)
+    """
+    #Place a limit buy order if we don't have one
+    state = locks.read(transactions,ticker)
+    if state.limit_buy_id==0 and throttle.ready(ticker,'Buy'):
+        place_buy_order(transactions,ticker)
+        state = locks.read(transactions,ticker)
+        throttle.result(ticker,'Buy',state.limit_buy_id!=0)
+
+    #Track the buy order if the bid price dipped to the limit buy, or the sell order if the ask price rose to the limit sell
+    if track and throttle.ready(ticker,'Track'):
+        if state.limit_buy_price>0 and state.bid_price<=state.limit_buy_price:
+            track_buy_orders(transactions,ticker)
+            throttle.wait(ticker,'Track',throttle.track_interval)
+            state = locks.read(transactions,ticker)
+        elif state.limit_sell_price>0 and state.ask_price>=state.limit_sell_price:
+            track_sell_orders(transactions,ticker)
+            throttle.wait(ticker,'Track',throttle.track_interval)
+            state = locks.read(transactions,ticker)
+
+    #Place or replace the limit sell order if we own stock
+    if state.stock_owned>0 and throttle.ready(ticker,'Sell'):
+        sell_price = round(state.average_buy*(1+state.sell_proportion),state.max_digits)
+        if state.limit_sell_id==0:
+            place_sell_order(transactions,ticker)
+            state = locks.read(transactions,ticker)
+            throttle.result(ticker,'Sell',state.limit_sell_id!=0)
+        elif state.limit_sell_price != sell_price:
+            replace_sell_order(transactions,ticker)
+            state = locks.read(transactions,ticker)
+            throttle.result(ticker,'Sell',state.limit_sell_price==sell_price)
+
+    #Cancel the buy order after we sold stock (new buy order closer to price can be placed)
+    if state.previous_sell>0 and state.limit_buy_id>0 and throttle.ready(ticker,'Cancel'):
+        cancel_buy_orders(transactions,ticker)
+        state = locks.read(transactions,ticker)
+        throttle.result(ticker,'Cancel',state.limit_buy_id==0)
+
+
+def track_fills(transactions,tickers=None,window_days=7,max_results=500,old_order_interval=300):
+    """
+    Tracks the placed buy and sell orders of many tickers with one get_orders request (instead of one request per order)
+    The filled orders entered in the last window_days (or since the oldest placed order if it is newer) come back from
+    one request and are applied to their tickers.
+    Orders entered before the window are looked up by themselves, at most once every old_order_interval seconds each.
+    A sell order that is not filled yet but the ask price reached its limit may be partially filled, so only those
+    orders are looked up by themselves (track_sell_orders).
+    transactions - dictionary of info related to bot transactions
+    tickers - tickers to track (default is every ticker)
+    window_days - max number of days of filled orders to request
+    max_results - max number of orders in the reply (a full reply may be missing orders, so they are looked up by themselves)
+    old_order_interval - seconds between the lookups of each order entered before the window
+    """
+    if tickers is None:
+        tickers = transactions['Tickers']
+
+    #The entered times on the site are in UTC
+    today = utc_today()
+    window_start = today-datetime.timedelta(days=window_days)
+
+    #Order ID of each placed order in the window -> (ticker, True for a buy order)
+    placed = {}
+    oldest = today
+    for ticker in tickers:
+        state = locks.read(transactions,ticker)
+        for (buy,order_id,entered) in ((True,state.limit_buy_id,state.limit_buy_entered),(False,state.limit_sell_id,state.limit_sell_entered)):
+            if order_id==0:
+                continue
+            if len(entered)==0:
+                #Orders placed before the entered date was stored (or recovered without it) are stamped once
+                entered = stamp_entered(transactions,ticker,buy,order_id)
+                if len(entered)==0:
+                    continue
+            entered = datetime.date.fromisoformat(entered)
+            if entered<window_start:
+                #Too old for the window, look the order up by itself every so often
+                kind = 'Old Buy' if buy else 'Old Sell'
+                if throttle.ready(ticker,kind):
+                    track_order(transactions,ticker,buy)
+                    throttle.wait(ticker,kind,old_order_interval)
+                continue
+            placed[order_id] = (ticker,buy)
+            oldest = min(oldest,entered)
+    if len(placed)==0:
+        return
+
+    filled = set()
+    try:
+        #Start a day early so an order entered just before midnight UTC is not missed
+        start = max(oldest-datetime.timedelta(days=1),window_start)
+        filled_orders = get_orders(transactions['Access Token'],start.isoformat(),today.isoformat(),'FILLED',max_results)
+        for limit_order in filled_orders:
+            if limit_order.get('orderId') in placed:
+                (ticker,buy) = placed[limit_order['orderId']]
+                if buy:
+                    apply_buy_fill(transactions,ticker,limit_order)
+                else:
+                    apply_sell_fill(transactions,ticker,limit_order)
+                filled.add(limit_order['orderId'])
+    except:
+        transactions['API Errors'].append('Could not get filled orders')
+        return
+
+    #A full reply may have left out some of the filled orders (get_orders has no paging), so look the rest up by themselves
+    truncated = len(filled_orders)>=max_results
+    if truncated:
+        transactions['API Errors'].append('Filled orders reply was full ({} orders)'.format(max_results))
+
+    for order_id,(ticker,buy) in placed.items():
+        if order_id in filled:
+            continue
+        state = locks.read(transactions,ticker)
+        if buy:
+            if truncated and state.limit_buy_id==order_id:
                 track_buy_orders(transactions,ticker)
-                transactions['Last Requests'][min_request_index]=time.time()
+        elif state.limit_sell_id==order_id and (truncated or state.ask_price>=state.limit_sell_price):
+            #Look up the sell orders that may be partially filled
+            track_sell_orders(transactions,ticker)
 
-                last_requests=transactions['Last Requests']
-                #Make sure we are not making too many requests to the TD Ameritrade API
-                min_request_index=check_request_times(last_requests)
-            
-            #Check if there are limit sell orders
-            if transactions[ticker]['Limit Sell Price']>0:
-                #Track the sell order (remove from limit sell arrays if filled)
-                track_sell_orders(transactions,ticker)
-                transactions['Last Requests'][min_request_index]=time.time()
-            
-                last_requests=transactions['Last Requests']
-                #Make sure we are not making too many requests to the TD Ameritrade API
-                min_request_index=check_request_times(last_requests)
 
-        #Save transactions dictionary
-        pickle.dump(transactions,open("Transactions.p","wb"))
+def utc_today():
+    """
+    Returns today's date in UTC (the dates of the entered times of orders on the site)
+    """
+    return datetime.datetime.utcnow().date()
 
-        lock.release()
 
+def track_order(transactions,ticker,buy):
+    """
+    Looks up the limit buy order (buy=True) or the limit sell order of a ticker by itself
+    """
+    if buy:
+        track_buy_orders(transactions,ticker)
+    else:
+        track_sell_orders(transactions,ticker)
 
-def check_request_times(last_requests):
+
+def stamp_entered(transactions,ticker,buy,order_id):
     """
-    Checks if we are making too many api requests and get the latest request time index
-    last_requests - last requests made to the site. 
-        If all of these are within one second, wait before making another call.
+    Stores the date an order was entered on the site ('Limit Buy Entered' or 'Limit Sell Entered') for orders that don't
+    have one yet, and applies the order if it was already filled
+    buy - True for the limit buy order, False for the limit sell order
+    order_id - the ID of the order
 
-    Returns the index of the latest request time in transaction['Last Requests']
+    Returns the entered date as an ISO date ('' if the order could not be looked up)
     """
-    copy_requests = last_requests.copy()
-    copy_requests.sort()
+    try:
+        limit_order = get_order_by_id(transactions['Access Token'],order_id)
+        entered = limit_order['enteredTime'][:10]
+    except:
+        transactions['API Errors'].append('Could not get the entered time of order {}'.format(order_id))
+        return ''
 
-    if (copy_requests[1]-copy_requests[0])<1 and (copy_requests[1]-copy_requests[0])>0:
-        time.sleep(1-(copy_requests[1]-copy_requests[0])) #Sleep to make sure we don't have too many requests per second.
-    return last_requests.index(min(last_requests)) #Min Index
+    key = 'Limit Buy Entered' if buy else 'Limit Sell Entered'
+    with locks.ticker(ticker):
+        if transactions[ticker][('Limit Buy ID' if buy else 'Limit Sell ID')]!=order_id:
+            return ''
+        transactions[ticker][key] = entered
+        journal.record(ticker,'Order Entered',transactions[ticker],[key])
 
+    #We already have the order, so apply it if it was filled
+    if buy and limit_order.get('status')=='FILLED':
+        apply_buy_fill(transactions,ticker,limit_order)
+    elif not buy:
+        apply_sell_fill(transactions,ticker,limit_order)
+    return entered
 
 
 def place_buy_order(transactions,ticker):
@@ -240,26 +515,29 @@ def place_buy_order(transactions,ticker):
 
     Returns the status code of the request.
     """
-    if transactions[ticker]['Stock Owned']==0 and transactions[ticker]['Previous Sell']>0:
+    #Read the ticker's values (the order is placed without holding the ticker lock)
+    state = locks.read(transactions,ticker)
+
+    if state.stock_owned==0 and state.previous_sell>0:
         #We sold the stock. Set new buy price at New Buy Proportion below previous sell
-        buy_price = transactions[ticker]['Previous Sell']*(1-transactions[ticker]['New Buy Proportion'])
-    elif transactions[ticker]['Stock Owned']>0:
+        buy_price = state.previous_sell*(1-state.new_buy_proportion)
+    elif state.stock_owned>0:
         #Place another limit buy order Buy proportion below previous buy
-        buy_price = transactions[ticker]['Previous Buy']*(1-transactions[ticker]['Buy Proportion'])
+        buy_price = state.previous_buy*(1-state.buy_proportion)
     else:
         #We haven't bought or sold any of this stock yet
-        buy_price = transactions[ticker]['First Buy']
+        buy_price = state.first_buy
 
     #Round buy price according to number of digits allowed (2 digits for >$1 stocks, 4 digits for <$1 stocks)
-    buy_price = round(buy_price,transactions[ticker]['Max Digits'])
+    buy_price = round(buy_price,state.max_digits)
 
     #Make sure we have the funds to buy before placing the order
-    if transactions[ticker]['Available Balance'] > buy_price*transactions[ticker]['Order Quantity']:
+    if state.available_balance > buy_price*state.order_quantity:
 
         #Build the order leg collections for placing orders on TD Ameritrade
         orderLegCollection_buy = [{ 'instrument':{'symbol': ticker,'assetType':'EQUITY'},
                                     'instruction':'BUY',
-                                    'quantity':transactions[ticker]['Order Quantity']}]
+                                    'quantity':state.order_quantity}]
 
         #Create main order request
         buy_request = build_order_request('SEAMLESS','GOOD_TILL_CANCEL','LIMIT',orderLegCollection_buy,'SINGLE',str(buy_price))
@@ -270,17 +548,22 @@ def place_buy_order(transactions,ticker):
 
             #Check request to make sure it successfully posted
             if post_order_response.status_code==201:
-                transactions[ticker]['Available Balance']-= buy_price*transactions[ticker]['Order Quantity']
-                #Reset the previous sell since we have a new buy order in place
-                transactions[ticker]['Previous Sell']=0
-
-                response_headers=post_order_response.headers
-                #Get the order id of the buy order from the headers
-                if 'Location' in response_headers:
-                    order_id = int(response_headers['Location'].split('orders/')[1])
-
-                    transactions[ticker]['Limit Buy ID'] = order_id
-                    transactions[ticker]['Limit Buy Price'] = buy_price
+                with locks.ticker(ticker):
+                    transactions[ticker].available_balance-= buy_price*state.order_quantity
+                    #Reset the previous sell since we have a new buy order in place
+                    transactions[ticker].previous_sell=0
+
+                    response_headers=post_order_response.headers
+                    #Get the order id of the buy order from the headers
+                    if 'Location' in response_headers:
+                        order_id = int(response_headers['Location'].split('orders/')[1])
+
+                        transactions[ticker].limit_buy_id = order_id
+                        transactions[ticker].limit_buy_price = buy_price
+                        transactions[ticker].limit_buy_entered = utc_today().isoformat()
+
+                    journal.record(ticker,'Buy Placed',transactions[ticker],
+                                   ['Available Balance','Previous Sell','Limit Buy ID','Limit Buy Price','Limit Buy Entered'])
                         
             return post_order_response.status_code
         except:
@@ -299,25 +582,43 @@ def track_buy_orders(transactions,ticker):
     """
     try:
         #Get the order
-        limit_order=get_order_by_id(transactions['Access Token'],transactions[ticker]['Limit Buy ID'])
+        with locks.ticker(ticker):
+            order_id = transactions[ticker].limit_buy_id
+        limit_order=get_order_by_id(transactions['Access Token'],order_id)
     
         #Check if the order was filled
         if limit_order['status']=='FILLED':
-
-            #Reset limit buy arrays and add in amount of stock we have purchased
-            transactions[ticker]['Limit Buy ID']=0
-            transactions[ticker]['Limit Buy Price']=0
-            transactions[ticker]['Stock Bought']+=limit_order['quantity']
-
-            #Add in the last buy price and calculate the average cost of stock
-            transactions[ticker]['Previous Buy']=limit_order['price']
-            transactions[ticker]['Average Buy']=(transactions[ticker]['Average Buy']*transactions[ticker]['Stock Owned'] + \
-                limit_order['price']*limit_order['quantity'])/(transactions[ticker]['Stock Owned']+limit_order['quantity'])
-            transactions[ticker]['Stock Owned']+=limit_order['quantity']
+            apply_buy_fill(transactions,ticker,limit_order)
     except:
         transactions['API Errors'].append('Could not get buy orders')
 
 
+def apply_buy_fill(transactions,ticker,limit_order):
+    """
+    Adds the stock of a filled limit buy order to the ticker
+    transactions - dictionary containing information about transactions
+    ticker - the stock ticker we are trading
+    limit_order - the filled order (from get_order_by_id or get_orders)
+    """
+    with locks.ticker(ticker):
+        #Only apply the fill to the order that is still placed (a late or repeated reply must not add the stock twice)
+        if transactions[ticker].limit_buy_id!=limit_order.get('orderId'):
+            return
+
+        #Reset limit buy arrays and add in amount of stock we have purchased
+        transactions[ticker].limit_buy_id=0
+        transactions[ticker].limit_buy_price=0
+        transactions[ticker].stock_bought+=limit_order['quantity']
+
+        #Add in the last buy price and calculate the average cost of stock
+        transactions[ticker].previous_buy=limit_order['price']
+        transactions[ticker].average_buy=(transactions[ticker].average_buy*transactions[ticker].stock_owned + \
+            limit_order['price']*limit_order['quantity'])/(transactions[ticker].stock_owned+limit_order['quantity'])
+        transactions[ticker].stock_owned+=limit_order['quantity']
+        journal.record(ticker,'Buy Filled',transactions[ticker],
+                       ['Limit Buy ID','Limit Buy Price','Stock Bought','Previous Buy','Average Buy','Stock Owned'])
+
+
 def track_sell_orders(transactions,ticker):
     """
     Determines if we successfully sold stock with our limit order. Updates transactions limit sell list.
@@ -329,34 +630,54 @@ def track_sell_orders(transactions,ticker):
     """
     try:
         #Get the order
-        limit_order=get_order_by_id(transactions['Access Token'],transactions[ticker]['Limit Sell ID'])
+        with locks.ticker(ticker):
+            order_id = transactions[ticker].limit_sell_id
+        limit_order=get_order_by_id(transactions['Access Token'],order_id)
     
+        apply_sell_fill(transactions,ticker,limit_order)
+    except:
+        transactions['API Errors'].append('Could not get sell orders')
+
+
+def apply_sell_fill(transactions,ticker,limit_order):
+    """
+    Removes the sold stock of a filled (or partially filled) limit sell order from the ticker
+    transactions - dictionary containing information about transactions
+    ticker - the stock ticker we are trading
+    limit_order - the sell order (from get_order_by_id or get_orders)
+    """
+    with locks.ticker(ticker):
+        #Only apply the fill to the order that is still placed (a late or repeated reply must not sell the stock twice)
+        if transactions[ticker].limit_sell_id!=limit_order.get('orderId'):
+            return
+
         #Check if the order was filled
         if limit_order['status']=='FILLED':
 
             #Reset limit sell arrays and add in amount of stock sold
-            transactions[ticker]['Limit Sell ID']=0
-            transactions[ticker]['Limit Sell Price']=0
-            transactions[ticker]['Stock Sold']+=limit_order['quantity']
+            transactions[ticker].limit_sell_id=0
+            transactions[ticker].limit_sell_price=0
+            transactions[ticker].stock_sold+=limit_order['quantity']
 
             #Reset the previous buy price and average buy price since we already sold it
-            transactions[ticker]['Previous Buy']=0
-            transactions[ticker]['Average Buy']=0
+            transactions[ticker].previous_buy=0
+            transactions[ticker].average_buy=0
             #Add in previous sell price and set stock owned to zero
-            transactions[ticker]['Previous Sell']=limit_order['price']
-            transactions[ticker]['Stock Owned']=0
+            transactions[ticker].previous_sell=limit_order['price']
+            transactions[ticker].stock_owned=0
 
             #Add profit to our balance
-            transactions[ticker]['Available Balance']+=limit_order['price']*limit_order['quantity']
-            transactions[ticker]['Last Fill']=0
-        else:
+            transactions[ticker].available_balance+=limit_order['price']*limit_order['quantity']
+            transactions[ticker].last_fill=0
+            journal.record(ticker,'Sell Filled',transactions[ticker],['Limit Sell ID','Limit Sell Price','Stock Sold','Previous Buy',
+                           'Average Buy','Previous Sell','Stock Owned','Available Balance','Last Fill'])
+        elif limit_order['filledQuantity']!=transactions[ticker].last_fill:
             #Subtract of filled quantity (just in case it was partially filled)
-            transactions[ticker]['Stock Owned']-=(limit_order['filledQuantity']-transactions[ticker]['Last Fill'])
-            transactions[ticker]['Stock Sold']+=(limit_order['filledQuantity']-transactions[ticker]['Last Fill'])
-            transactions[ticker]['Available Balance']+=(limit_order['filledQuantity']-transactions[ticker]['Last Fill'])*limit_order['price']
-            transactions[ticker]['Last Fill']=limit_order['filledQuantity']
-    except:
-        transactions['API Errors'].append('Could not get sell orders')
+            transactions[ticker].stock_owned-=(limit_order['filledQuantity']-transactions[ticker].last_fill)
+            transactions[ticker].stock_sold+=(limit_order['filledQuantity']-transactions[ticker].last_fill)
+            transactions[ticker].available_balance+=(limit_order['filledQuantity']-transactions[ticker].last_fill)*limit_order['price']
+            transactions[ticker].last_fill=limit_order['filledQuantity']
+            journal.record(ticker,'Sell Partially Filled',transactions[ticker],['Stock Owned','Stock Sold','Available Balance','Last Fill'])
 
 
 def place_sell_order(transactions,ticker):
@@ -368,19 +689,23 @@ def place_sell_order(transactions,ticker):
             'Sell Proportion' - proportion above the average buy to set limit sell order
     ticker - the stock we are trading
     """
+    #Read the ticker's values (the order is placed without holding the ticker lock)
+    state = locks.read(transactions,ticker)
+
     orderLegCollection_sell = [{'instrument':{'symbol': ticker,'assetType':'EQUITY'},
                             'instruction':'SELL',
-                            'quantity':transactions[ticker]['Stock Owned']}]
+                            'quantity':state.stock_owned}]
 
     #Place sell order at sell proportion above the average buy cost
-    sell_price = round(transactions[ticker]['Average Buy']*(1+transactions[ticker]['Sell Proportion']),transactions[ticker]['Max Digits'])
+    sell_price = round(state.average_buy*(1+state.sell_proportion),state.max_digits)
 
     #Create main order request
     sell_request = build_order_request('SEAMLESS','GOOD_TILL_CANCEL','LIMIT',orderLegCollection_sell,'SINGLE',str(sell_price))
 
     try:
-        #Make the actual post request
-        post_order_response = post_order(transactions['Access Token'],sell_request)
+        #Make the actual post request (in the sell lane so it goes ahead of quotes and buys)
+        with request_priority(SELL):
+            post_order_response = post_order(transactions['Access Token'],sell_request)
 
         #Check request to make sure it successfully posted
         if post_order_response.status_code==201:
@@ -390,8 +715,11 @@ def place_sell_order(transactions,ticker):
             if 'Location' in response_headers:
                 order_id = int(response_headers['Location'].split('orders/')[1])
 
-                transactions[ticker]['Limit Sell ID'] = order_id
-                transactions[ticker]['Limit Sell Price'] = sell_price
+                with locks.ticker(ticker):
+                    transactions[ticker].limit_sell_id = order_id
+                    transactions[ticker].limit_sell_price = sell_price
+                    transactions[ticker].limit_sell_entered = utc_today().isoformat()
+                    journal.record(ticker,'Sell Placed',transactions[ticker],['Limit Sell ID','Limit Sell Price','Limit Sell Entered'])
     
     except:
         transactions['API Errors'].append('Could not place buy order for {} at price {}'.format(ticker,sell_price))
@@ -407,19 +735,22 @@ def replace_sell_order(transactions,ticker):
             'Sell Proportion' - proportion above the average buy to set limit sell order
     ticker - the stock we are trading
     """
+    #Read the ticker's values (the order is replaced without holding the ticker lock)
+    state = locks.read(transactions,ticker)
+
     orderLegCollection_sell = [{'instrument':{'symbol': ticker,'assetType':'EQUITY'},
                             'instruction':'SELL',
-                            'quantity':transactions[ticker]['Stock Owned']}]
+                            'quantity':state.stock_owned}]
 
     #Place sell order at sell proportion above the average buy cost
-    sell_price = round(transactions[ticker]['Average Buy']*(1+transactions[ticker]['Sell Proportion']),transactions[ticker]['Max Digits'])
+    sell_price = round(state.average_buy*(1+state.sell_proportion),state.max_digits)
 
     #Create main order request
     sell_request = build_order_request('SEAMLESS','GOOD_TILL_CANCEL','LIMIT',orderLegCollection_sell,'SINGLE',str(sell_price))
 
     try:
         #Make the actual put request to replace order
-        put_order_response = replace_order(transactions['Access Token'],transactions[ticker]['Limit Sell ID'],sell_request)
+        put_order_response = replace_order(transactions['Access Token'],state.limit_sell_id,sell_request)
 
         #Check request to make sure it successfully posted
         if put_order_response.status_code==201:
@@ -429,8 +760,11 @@ def replace_sell_order(transactions,ticker):
             if 'Location' in response_headers:
                 order_id = int(response_headers['Location'].split('orders/')[1])
 
-                transactions[ticker]['Limit Sell ID'] = order_id
-                transactions[ticker]['Limit Sell Price'] = sell_price
+                with locks.ticker(ticker):
+                    transactions[ticker].limit_sell_id = order_id
+                    transactions[ticker].limit_sell_price = sell_price
+                    transactions[ticker].limit_sell_entered = utc_today().isoformat()
+                    journal.record(ticker,'Sell Replaced',transactions[ticker],['Limit Sell ID','Limit Sell Price','Limit Sell Entered'])
     
         #Try tracking the order to get latest information
         else:
@@ -450,21 +784,24 @@ def cancel_buy_orders(transactions,ticker):
 
     Returns: The status code of the delete request
     """
+    state = locks.read(transactions,ticker)
     try:
         #Cancel the order with the min price
-        delete_response = delete_order(transactions['Access Token'],transactions[ticker]['Limit Buy ID'])
+        delete_response = delete_order(transactions['Access Token'],state.limit_buy_id)
 
         if delete_response.status_code==200:
-            #Add back the cost of the limit buy back to available balance and reset limit buy values
-            transactions[ticker]['Available Balance'] += transactions[ticker]['Limit Buy Price']*transactions[ticker]['Order Quantity']
-            transactions[ticker]['Limit Buy ID']=0
-            transactions[ticker]['Limit Buy Price']=0
+            with locks.ticker(ticker):
+                #Add back the cost of the limit buy back to available balance and reset limit buy values
+                transactions[ticker].available_balance += transactions[ticker].limit_buy_price*transactions[ticker].order_quantity
+                transactions[ticker].limit_buy_id=0
+                transactions[ticker].limit_buy_price=0
+                journal.record(ticker,'Buy Cancelled',transactions[ticker],['Available Balance','Limit Buy ID','Limit Buy Price'])
 
         return delete_response.status_code
     except:
-        transactions['API Errors'].append('Could not cancel order for {} at price {}'.format(ticker,transactions[ticker]['Limit Buy Price']))
+        transactions['API Errors'].append('Could not cancel order for {} at price {}'.format(ticker,state.limit_buy_price))
         return 0
 
 
 
-        
\ No newline at end of file
+        
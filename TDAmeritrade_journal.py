@@ -0,0 +1,184 @@
+# Write ahead journal of the transactions dictionary (crash recovery for the bot).
+# Every change the bot makes to a ticker (order placed, filled, partially filled, replaced, cancelled) is appended to
+# Transactions.journal as one json line with the new values of the keys that changed:
+#   {"Sequence": 12, "Time": 1592150400.123, "Ticker": "SVC", "Event": "Buy Filled", "Values": {"Stock Owned": 10, ...}}
+# Lines are flushed to the OS right away (a crash of the bot loses nothing) and fsynced at most every sync_interval
+# seconds (a crash of the computer loses at most that much).
+# A snapshot (Transactions.p) of the whole dictionary is written every so often to a temporary file and renamed over
+# the old one, then the journal starts over. At startup the snapshot is loaded and the journal lines after it are
+# applied, which gives back the exact state before the crash.
+# Lines set values instead of adding to them, so applying a line that is already in the snapshot does not change anything.
+
+import os, json, time, pickle, threading, uuid
+from TDAmeritrade_locks import locks
+from TDAmeritrade_state import migrate_transactions
+
+
+class TransactionJournal:
+    """
+    Journal and snapshots of the transactions dictionary
+    """
+
+    def __init__(self,sync_interval=1.0,snapshot_interval=600,snapshot_records=5000):
+        """
+        sync_interval - max seconds between fsyncs of the journal
+        snapshot_interval - seconds between snapshots (maybe_snapshot)
+        snapshot_records - number of journal lines that starts a snapshot early (maybe_snapshot)
+        """
+        self.sync_interval = sync_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_records = snapshot_records
+        self.snapshot_path = "Transactions.p"
+        self.journal_path = "Transactions.journal"
+        self.journal_id = None
+        self.file = None
+        self.sequence = 0
+        self.records = 0
+        self.last_sync = time.monotonic()
+        self.last_snapshot = time.monotonic()
+        #Lines written while a snapshot is being taken (they go in the new journal)
+        self.capture = None
+        self.lock = threading.Lock()
+        self.snapshot_lock = threading.Lock()
+
+    def open(self,snapshot_path="Transactions.p",journal_path="Transactions.journal"):
+        """
+        Loads the transactions dictionary, applies the journal and starts a new journal from a fresh snapshot
+
+        Returns the transactions dictionary
+        """
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        transactions = self.recover()
+        self.snapshot(transactions)
+        return transactions
+
+    def recover(self):
+        """
+        Loads the snapshot and applies the journal lines written after it (a partly written last line is skipped)
+
+        Returns the transactions dictionary
+        """
+        with open(self.snapshot_path,'rb') as snapshot_file:
+            transactions = migrate_transactions(pickle.load(snapshot_file))
+        #The journal keys are only kept in the snapshot file
+        self.journal_id = transactions.pop('Journal ID',None)
+        snapshot_sequence = transactions.pop('Journal Sequence',0)
+        self.sequence = snapshot_sequence
+
+        #Only apply a journal that belongs to this snapshot (a new Transactions.p from initialize_transactions has no ID)
+        if self.journal_id is not None and os.path.exists(self.journal_path):
+            with open(self.journal_path,'r') as journal_file:
+                lines = journal_file.read().split('\n')
+            try:
+                header = json.loads(lines[0])
+            except ValueError:
+                header = {}
+            if header.get('Journal ID')==self.journal_id:
+                for line in lines[1:]:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record['Sequence'] > snapshot_sequence and record['Ticker'] in transactions:
+                        transactions[record['Ticker']].update(record['Values'])
+                    self.sequence = max(self.sequence,record['Sequence'])
+
+        if self.journal_id is None:
+            self.journal_id = uuid.uuid4().hex
+        return transactions
+
+    def record(self,ticker,event,values,keys):
+        """
+        Appends a change of a ticker to the journal (call while holding the ticker lock, after the change)
+        ticker - the stock that changed
+        event - what happened (Ex: 'Buy Filled')
+        values - the ticker's dictionary
+        keys - the keys that changed (keys the ticker does not have are skipped)
+        """
+        if self.file is None:
+            return
+        with self.lock:
+            self.sequence += 1
+            line = json.dumps({'Sequence':self.sequence,'Time':round(time.time(),3),'Ticker':ticker,'Event':event,
+                               'Values':{key:values[key] for key in keys if key in values}})
+            self.file.write(line+'\n')
+            self.file.flush()
+            if self.capture is not None:
+                self.capture.append(line)
+            self.records += 1
+
+            #Batch the fsyncs (one every sync_interval seconds at most)
+            if time.monotonic()-self.last_sync >= self.sync_interval:
+                os.fsync(self.file.fileno())
+                self.last_sync = time.monotonic()
+
+    def sync(self):
+        """
+        Makes sure every journal line is on disk
+        """
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.last_sync = time.monotonic()
+
+    def snapshot(self,transactions):
+        """
+        Writes a snapshot of the transactions dictionary (temporary file renamed over the old snapshot)
+        and starts a new journal with the lines written after it
+        """
+        with self.snapshot_lock:
+            with self.lock:
+                sequence = self.sequence
+                self.capture = []
+
+            #Lines written from here on may or may not be in the copy, so they are kept in the new journal too
+            copy = locks.snapshot(transactions)
+            copy['Journal ID'] = self.journal_id
+            copy['Journal Sequence'] = sequence
+            write_atomic(self.snapshot_path,pickle.dumps(copy,protocol=pickle.HIGHEST_PROTOCOL))
+
+            with self.lock:
+                lines = [json.dumps({'Journal ID':self.journal_id,'Sequence':sequence})]+self.capture
+                write_atomic(self.journal_path,('\n'.join(lines)+'\n').encode())
+                if self.file is not None:
+                    self.file.close()
+                self.file = open(self.journal_path,'a')
+                self.capture = None
+                self.records = 0
+                self.last_snapshot = time.monotonic()
+
+    def maybe_snapshot(self,transactions):
+        """
+        Syncs the journal and takes a snapshot if enough time has passed or the journal is long (call once per cycle)
+        """
+        self.sync()
+        if self.records >= self.snapshot_records or time.monotonic()-self.last_snapshot >= self.snapshot_interval:
+            self.snapshot(transactions)
+
+    def close(self):
+        """
+        Syncs and closes the journal
+        """
+        self.sync()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def write_atomic(path,data):
+    """
+    Writes a file so that it is either the old or the new file after a crash (temporary file, fsync, rename)
+    """
+    temp_path = path+'.tmp'
+    with open(temp_path,'wb') as temp_file:
+        temp_file.write(data)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path,path)
+
+
+#The journal shared by every thread
+journal = TransactionJournal()
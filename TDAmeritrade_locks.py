@@ -0,0 +1,57 @@
+# Locks for the transactions dictionary shared by the bot threads (Bot_Threading.py).
+# Each ticker has its own lock, and the keys shared by all tickers (Access Token, API Errors, ...) have one more lock.
+# A lock is only held while values of the dictionary are read or written, never during a request to TD Ameritrade:
+#   1. read the values the request needs under the ticker lock (read)
+#   2. make the request without any lock
+#   3. write the result under the ticker lock (Ex: with locks.ticker(ticker): transactions[ticker]['Limit Buy ID']=order_id)
+# So a quote update or a 'Check' from the user never waits on an order round trip.
+# Only one thread makes the order requests of a ticker, so the values do not change between the read and the write
+# (other threads only write the quotes of a ticker).
+
+import threading, copy
+
+
+class TransactionLocks:
+    """
+    Per ticker locks and a lock for the shared keys of the transactions dictionary
+    """
+
+    def __init__(self):
+        self.shared = threading.Lock()
+        self.tickers = {}
+        self.create_lock = threading.Lock()
+
+    def ticker(self,ticker):
+        """
+        Returns the lock of a ticker (created the first time it is used)
+        """
+        lock = self.tickers.get(ticker)
+        if lock is None:
+            with self.create_lock:
+                lock = self.tickers.setdefault(ticker,threading.Lock())
+        return lock
+
+    def read(self,transactions,ticker):
+        """
+        Returns a copy of the state of one ticker (TickerState)
+        """
+        with self.ticker(ticker):
+            return transactions[ticker].copy()
+
+    def snapshot(self,transactions):
+        """
+        Returns a copy of the transactions dictionary (each ticker is copied under its own lock, so the values of a ticker
+        are consistent with each other). Used to print or save the transactions while the bot is running.
+        """
+        with self.shared:
+            keys = list(transactions.keys())
+            tickers = set(transactions.get('Tickers',[]))
+            shared = {key:copy.copy(transactions[key]) for key in keys if key not in tickers}
+        for ticker in tickers:
+            if ticker in transactions:
+                shared[ticker] = self.read(transactions,ticker)
+        return {key:shared[key] for key in keys if key in shared}
+
+
+#The locks shared by every thread
+locks = TransactionLocks()
@@ -0,0 +1,159 @@
+# Quotes of every ticker with get_multi_quotes, split into batches (shards) for large lists of tickers.
+# One get_multi_quotes request with every ticker gets too long for the url (and the reply too big) as the list grows.
+# QuoteBook splits the tickers into batches bounded by the number of symbols and the length of the url, and gets
+# the batches at the same time from a few worker threads (the rate limiter of TDAmeritrade_rate_limit.py still spaces
+# them out in the quote lane). A refresh of every ticker always costs len(quotes.shards) requests.
+# The bid price, ask price and time of the latest quote of each ticker are kept in arrays (allocated once per list
+# of tickers), so we can tell which tickers have old (stale) quotes when a batch fails.
+# The worker threads are started by the first refresh with more than one batch, call close (or use a with block) to
+# shut them down.
+
+import time, urllib.parse, concurrent.futures
+from array import array
+import TDAmeritrade_API
+from TDAmeritrade_locks import locks
+
+
+class QuoteBook:
+    """
+    Latest bid and ask price of each ticker, refreshed with batched get_multi_quotes requests
+    """
+
+    def __init__(self,max_symbols=300,max_url_length=2000,workers=4):
+        """
+        max_symbols - max number of tickers in one get_multi_quotes request
+        max_url_length - max length of the url of one get_multi_quotes request
+        workers - number of batches requested at the same time
+        """
+        self.max_symbols = max_symbols
+        self.max_url_length = max_url_length
+        self.workers = workers
+        self.executor = None
+        self.set_symbols([])
+
+    def set_symbols(self,symbols):
+        """
+        Sets the tickers to get quotes for (allocates the arrays and splits the tickers into batches)
+        symbols - list of ticker symbols
+        """
+        self.symbols = list(symbols)
+        self.index = {symbol:i for i,symbol in enumerate(self.symbols)}
+        self.bid = array('d',[0.0])*len(self.symbols)
+        self.ask = array('d',[0.0])*len(self.symbols)
+        #Time (seconds since epoch) of the latest quote of each ticker (0 if we never got one)
+        self.time = array('d',[0.0])*len(self.symbols)
+
+        #Fill each batch until the next symbol would go over the symbol count or the url length
+        base_length = len(TDAmeritrade_API.api_url+'/marketdata/quotes?symbol=')
+        self.shards = []
+        shard = []
+        length = base_length
+        for symbol in self.symbols:
+            #Each symbol adds its url encoded length and an encoded comma (%2C)
+            symbol_length = len(urllib.parse.quote(symbol,safe=''))+(3 if shard else 0)
+            if shard and (len(shard)>=self.max_symbols or length+symbol_length>self.max_url_length):
+                self.shards.append(shard)
+                shard = []
+                length = base_length
+                symbol_length -= 3
+            shard.append(symbol)
+            length += symbol_length
+        if shard:
+            self.shards.append(shard)
+
+    def fetch(self,access_token,shard):
+        """
+        Gets the quotes of one batch and stores the bid and ask prices in the arrays
+        Returns the number of tickers that got a new quote
+        """
+        new_quotes = TDAmeritrade_API.get_multi_quotes(access_token,','.join(shard))
+        now = time.time()
+        updated = 0
+        for symbol in shard:
+            quote = new_quotes.get(symbol)
+            if quote is not None and 'bidPrice' in quote and 'askPrice' in quote:
+                i = self.index[symbol]
+                self.bid[i] = quote['bidPrice']
+                self.ask[i] = quote['askPrice']
+                self.time[i] = now
+                updated += 1
+        return updated
+
+    def refresh(self,access_token,symbols=None):
+        """
+        Gets the quotes of every ticker (one request per batch, the batches are requested at the same time)
+        access_token - token used to access the TD Ameritrade site
+        symbols - list of tickers (the arrays and batches are only built again if the list changed)
+
+        Returns the number of batches that failed
+        """
+        if symbols is not None and symbols!=self.symbols:
+            self.set_symbols(symbols)
+
+        #A single batch is requested from this thread
+        if len(self.shards)<=1:
+            try:
+                for shard in self.shards:
+                    self.fetch(access_token,shard)
+                return 0
+            except:
+                return 1
+
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+        failed = 0
+        futures = [self.executor.submit(self.fetch,access_token,shard) for shard in self.shards]
+        for future in futures:
+            try:
+                future.result()
+            except:
+                failed += 1
+        return failed
+
+    def close(self):
+        """
+        Shuts down the worker threads (a later refresh starts new ones)
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+    def quote(self,symbol):
+        """
+        Returns (bid price, ask price, time of the quote) of a ticker
+        """
+        i = self.index[symbol]
+        return (self.bid[i],self.ask[i],self.time[i])
+
+    def stale(self,max_age):
+        """
+        Returns the tickers whose latest quote is older than max_age seconds (or that never got a quote)
+        """
+        oldest = time.time()-max_age
+        return [symbol for symbol,quote_time in zip(self.symbols,self.time) if quote_time<oldest]
+
+    def store(self,transactions,max_age):
+        """
+        Stores the bid and ask price of each ticker in the transactions dictionary (tickers with stale quotes keep their
+        last prices)
+        transactions - dictionary of info related to bot transactions
+        max_age - quotes older than this many seconds are not stored
+
+        Returns the tickers with stale quotes
+        """
+        oldest = time.time()-max_age
+        stale = []
+        for i,symbol in enumerate(self.symbols):
+            if self.time[i]<oldest:
+                stale.append(symbol)
+            elif symbol in transactions:
+                with locks.ticker(symbol):
+                    transactions[symbol].bid_price = self.bid[i]
+                    transactions[symbol].ask_price = self.ask[i]
+        return stale
@@ -0,0 +1,129 @@
+# Process wide rate limiter for the TD Ameritrade API (every request of TDAmeritrade_API.TDClient goes through it).
+# Token bucket - the bucket holds up to capacity requests and refills at rate requests per second, so short bursts
+# use the whole budget instead of sleeping after every request.
+# Priority lanes - when requests are waiting, the lowest lane number goes first (cancels and sells go ahead of quotes
+# and status polls). Requests in the same lane go in the order they arrived.
+# Wait times of each lane are recorded so we can see if the budget is too small.
+
+import threading, time, heapq
+from contextlib import contextmanager
+
+#Priority lanes (lower number goes first)
+AUTH = 0        #Access tokens
+CANCEL = 1      #Cancel orders
+SELL = 2        #Place and replace sell orders
+BUY = 3         #Place buy orders
+STATUS = 4      #Order status and account info
+QUOTE = 5       #Quotes
+HISTORY = 6     #Price history downloads
+lane_names = ['Auth','Cancel','Sell','Buy','Status','Quote','History']
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter with priority lanes
+    """
+
+    def __init__(self,rate=1.8,capacity=12):
+        """
+        rate - requests per second the bucket refills at
+            (TD Ameritrade allows 120 requests a minute, rate*60+capacity keeps any minute at or under that)
+        capacity - max number of requests that can be made at once after the bucket has filled up
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.count = 0
+        self.wait_stats = {}
+
+    def configure(self,rate=None,capacity=None):
+        """
+        Changes the refill rate and/or capacity of the bucket
+        """
+        with self.condition:
+            self.refill()
+            if rate is not None:
+                self.rate = rate
+            if capacity is not None:
+                self.capacity = capacity
+                self.tokens = min(self.tokens,capacity)
+            self.condition.notify_all()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,self.tokens+(now-self.last)*self.rate)
+        self.last = now
+
+    def acquire(self,priority=STATUS):
+        """
+        Waits until a request in this lane can be made
+        priority - lane of the request (Ex: CANCEL, QUOTE)
+
+        Returns the number of seconds the request waited
+        """
+        start = time.monotonic()
+        with self.condition:
+            self.count += 1
+            entry = (priority,self.count)
+            heapq.heappush(self.waiting,entry)
+            while True:
+                self.refill()
+                if self.waiting[0]==entry:
+                    if self.tokens >= 1:
+                        heapq.heappop(self.waiting)
+                        self.tokens -= 1
+                        #Let the next request in line check the bucket
+                        self.condition.notify_all()
+                        break
+                    self.condition.wait((1-self.tokens)/self.rate)
+                else:
+                    self.condition.wait()
+
+            wait = time.monotonic()-start
+            stats = self.wait_stats.setdefault(priority,[0,0.0,0.0])
+            stats[0] += 1
+            stats[1] += wait
+            stats[2] = max(stats[2],wait)
+        return wait
+
+    def stats(self):
+        """
+        Returns a dictionary of lane name to Requests, Average Wait and Max Wait (seconds)
+        """
+        with self.condition:
+            return {lane_names[priority] if priority<len(lane_names) else priority:
+                    {'Requests':count,'Average Wait':total/count,'Max Wait':longest}
+                    for priority,(count,total,longest) in sorted(self.wait_stats.items())}
+
+
+#The limiter shared by every thread
+limiter = RateLimiter()
+
+#Priority set by request_priority for the current thread
+thread_priority = threading.local()
+
+
+@contextmanager
+def request_priority(priority):
+    """
+    Sends the API requests made inside the with block in another lane.
+    Ex: with request_priority(SELL): post_order(access_token,sell_request)
+    """
+    previous = getattr(thread_priority,'priority',None)
+    thread_priority.priority = priority
+    try:
+        yield
+    finally:
+        thread_priority.priority = previous
+
+
+def current_priority(priority):
+    """
+    Returns the lane of a request in this thread
+    priority - default lane of the request (request_priority overrides it)
+    """
+    override = getattr(thread_priority,'priority',None)
+    return priority if override is None else override
@@ -0,0 +1,130 @@
+# Typed state of each ticker in the transactions dictionary.
+# Each ticker used to be a dictionary of about 20 string keys. TickerState keeps the same values in slots (no dictionary
+# per ticker) and the bot reads them as attributes (Ex: transactions[ticker].limit_buy_price).
+# The old keys still work (transactions[ticker]['Limit Buy Price']), so the user interface, the journal and the
+# estimators that read the transactions dictionary do not need to change.
+# The keys shared by all tickers (Access Token, Tickers, API Errors, ...) stay in the transactions dictionary.
+# migrate_transactions converts the ticker dictionaries of an old Transactions.p.
+
+#Key in the transactions dictionary -> attribute of TickerState (and the default value)
+ticker_fields = {'First Buy':('first_buy',0),
+                 'Order Quantity':('order_quantity',0),
+                 'Available Balance':('available_balance',0),
+                 'Buy Proportion':('buy_proportion',0),
+                 'Sell Proportion':('sell_proportion',0),
+                 'New Buy Proportion':('new_buy_proportion',0),
+                 'Max Digits':('max_digits',2),
+                 'Previous Buy':('previous_buy',0),
+                 'Average Buy':('average_buy',0),
+                 'Previous Sell':('previous_sell',0),
+                 'Stock Owned':('stock_owned',0),
+                 'Last Fill':('last_fill',0),
+                 'Stock Bought':('stock_bought',0),
+                 'Stock Sold':('stock_sold',0),
+                 'Limit Buy ID':('limit_buy_id',0),
+                 'Limit Buy Price':('limit_buy_price',0),
+                 'Limit Buy Entered':('limit_buy_entered',''),
+                 'Limit Sell ID':('limit_sell_id',0),
+                 'Limit Sell Price':('limit_sell_price',0),
+                 'Limit Sell Entered':('limit_sell_entered',''),
+                 'Bid Price':('bid_price',0),
+                 'Ask Price':('ask_price',0),
+                 'Current Price':('current_price',0)}
+attributes = {key:attribute for key,(attribute,default) in ticker_fields.items()}
+
+
+class TickerState:
+    """
+    Values of one ticker (same keys as the old ticker dictionary, see ordering_bot)
+    Keys that are not in ticker_fields are kept in extra.
+    """
+    __slots__ = [attribute for attribute,default in ticker_fields.values()]+['extra']
+
+    def __init__(self,values=None):
+        """
+        values - dictionary of key to value (Ex: an old ticker dictionary), missing keys get their default
+        """
+        for attribute,default in ticker_fields.values():
+            setattr(self,attribute,default)
+        self.extra = None
+        if values is not None:
+            self.update(values)
+
+    def __getitem__(self,key):
+        if key in attributes:
+            return getattr(self,attributes[key])
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self,key,value):
+        if key in attributes:
+            setattr(self,attributes[key],value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self,key):
+        return key in attributes or (self.extra is not None and key in self.extra)
+
+    def get(self,key,default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return list(attributes)+(list(self.extra) if self.extra is not None else [])
+
+    def items(self):
+        return [(key,self[key]) for key in self.keys()]
+
+    def update(self,values):
+        """
+        Sets many values at once (values - dictionary of key to value)
+        """
+        for key,value in values.items():
+            self[key] = value
+
+    def copy(self):
+        """
+        Returns a copy of the state
+        """
+        copy = TickerState.__new__(TickerState)
+        for attribute in TickerState.__slots__:
+            setattr(copy,attribute,getattr(self,attribute))
+        if self.extra is not None:
+            copy.extra = dict(self.extra)
+        return copy
+
+    def to_dict(self):
+        """
+        Returns the values as an old style ticker dictionary
+        """
+        return dict(self.items())
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __eq__(self,other):
+        if isinstance(other,(TickerState,dict)):
+            return self.to_dict()==dict(other.items())
+        return NotImplemented
+
+    def __getstate__(self):
+        #Pickle by key so a Transactions.p still loads after fields are added
+        return self.to_dict()
+
+    def __setstate__(self,values):
+        TickerState.__init__(self,values)
+
+
+def migrate_transactions(transactions):
+    """
+    Converts the ticker dictionaries of a transactions dictionary (Ex: from an old Transactions.p) to TickerState
+    Tickers that are already TickerState are left as they are.
+
+    Returns the transactions dictionary
+    """
+    for ticker in transactions.get('Tickers',[]):
+        if ticker in transactions and not isinstance(transactions[ticker],TickerState):
+            transactions[ticker] = TickerState(transactions[ticker])
+    return transactions
@@ -4,9 +4,11 @@
 # update_user - Gives an update message to user about current status of bot and transactions made.
 
 import datetime
+from TDAmeritrade_rate_limit import limiter
+from TDAmeritrade_locks import locks
 
 
-def user_interface(lock,transactions,errors):
+def user_interface(transactions,errors):
     """
     User interaction. User can get information about the transactions
     """
@@ -17,13 +19,16 @@ def user_interface(lock,transactions,errors):
                 user_input=input("Enter 'Check' to check the status of bot or 'Stop' to stop it: ")
             
             if user_input=="Check":
-                lock.acquire()
+                #Copy the transactions so the bot threads are not held up while printing
+                snapshot = locks.snapshot(transactions)
                 print("--------------------")
                 print("--------------------")
-                print(transactions)
+                print(snapshot)
+                print("--------------------")
+                #Wait times of the API requests in each priority lane
+                print(limiter.stats())
                 print("--------------------")
                 print("--------------------")
-                lock.release()
                 #Reset user_input
                 user_input="Random"
             elif user_input=="Stop":
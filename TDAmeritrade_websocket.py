@@ -1,6 +1,8 @@
 
 from websocket import create_connection
 from TDAmeritrade_API import get_access
+from TDAmeritrade_locks import locks
+from TDAmeritrade_state import TickerState
 import time, urllib.parse, json
 
 def login_websocket(ws,user_principals,tokenTimeStampAsMs,errors):
@@ -52,7 +54,7 @@ def login_websocket(ws,user_principals,tokenTimeStampAsMs,errors):
         errors.append('Failed to login to websocket.')
         
 
-def refresh_access(ws,lock,transactions,errors):
+def refresh_access(ws,transactions,errors):
     """
     Ping the connection every 4.5 seconds to make sure I continue to receive data.
 
@@ -70,9 +72,9 @@ def refresh_access(ws,lock,transactions,errors):
             ws.ping()
             #After six 4.5 minute sleeps, get a new access token. (it expires every 30 minutes)
             if n==6:
-                lock.acquire()
-                (transactions['Access Token'],transactions['Access Expire Time']) = get_access()
-                lock.release()
+                (access_token,expire_time) = get_access()
+                with locks.shared:
+                    (transactions['Access Token'],transactions['Access Expire Time']) = (access_token,expire_time)
                 n=0 #Reset count
         except:
             #Add a value to error array
@@ -117,14 +119,14 @@ def subscribe_quote_websocket(ws,user_principals,request_id,symbol,fields,errors
         return ''
 
 
-def read_websocket(ws,lock,transactions,errors):
+def read_websocket(ws,transactions,errors,updates=None):
     """
     Listens in the websockets for stock price updates 
 
     ws - TD Ameritrade websocket server to get stock price 
-    lock - lock for updating transactions dictionary
     transactions - dictionary of information on stock trading transactions
     errors - array of errors. If this is not empty, end the loop
+    updates - queue to put each ticker with a new quote in (wakes streaming_ordering_bot), None to only store the quotes
     """
     while len(errors)==0:
         try:
@@ -132,19 +134,32 @@ def read_websocket(ws,lock,transactions,errors):
             data = ws.recv()
             received_message = json.loads(data)
 
-            #Check if message received contains price updates
-            if 'data' in received_message and 'content' in received_message['data'][0]:
-                lock.acquire()
-                #New bid price information
-                if '1' in received_message['data'][0]['content'][0]:
-                    transactions['Bid Price']=received_message['data'][0]['content'][0]['1']
-                #New ask price information
-                if '2' in received_message['data'][0]['content'][0]:
-                    transactions['Ask Price']=received_message['data'][0]['content'][0]['2']
-                #New price information
-                if '3' in received_message['data'][0]['content'][0]:
-                    transactions['Current Price']=received_message['data'][0]['content'][0]['3']
-                lock.release()
+            #A message can have quotes for many tickers. Each content entry is one ticker ('key') and the fields that changed.
+            if 'data' in received_message:
+                updated=[]
+                for service in received_message['data']:
+                    if service.get('service')!='QUOTE' or 'content' not in service:
+                        continue
+                    for content in service['content']:
+                        ticker = content.get('key')
+                        if ticker not in transactions or not isinstance(transactions[ticker],TickerState):
+                            continue
+                        #Only this ticker's lock is held, so a ticker waiting on an order request does not hold up the quotes
+                        with locks.ticker(ticker):
+                            #New bid price information
+                            if '1' in content:
+                                transactions[ticker].bid_price=content['1']
+                            #New ask price information
+                            if '2' in content:
+                                transactions[ticker].ask_price=content['2']
+                            #New price information
+                            if '3' in content:
+                                transactions[ticker].current_price=content['3']
+                        updated.append(ticker)
+
+                if updates is not None:
+                    for ticker in updated:
+                        updates.put(ticker)
 
             """ Not sure if i want to get acct activity from websocket if it takes a few minutes to update.
             elif received_message['type']=='user':